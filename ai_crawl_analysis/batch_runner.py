@@ -0,0 +1,212 @@
+"""
+Runs the processing pipeline on several crawl files at the same time.
+
+Each CSV file in the input directory is processed by main.run_pipeline() in its own worker process,
+with its outputs written to a subdirectory of the output directory named after the file. The
+workers share the model quota: the requests-per-minute and tokens-per-minute limits are divided
+between them, and a semaphore shared by all the workers limits the number of AI requests in flight.
+
+A site that fails does not stop the others. A summary with the status and run time of each site is
+printed at the end, and the exit code is 1 if any site failed.
+
+Usage:
+    python -m ai_crawl_analysis.batch_runner input_dir [--workers N] [--ai-concurrency N]
+
+Example:
+    python -m ai_crawl_analysis.batch_runner data/audit-inputs --workers 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from ai_crawl_analysis.main import add_pipeline_arguments, run_pipeline
+from ai_crawl_analysis.utilities.ai_call import DEFAULT_MODEL
+from ai_crawl_analysis.utilities.rate_limiter import (
+    get_model_quota,
+    set_shared_request_slots,
+)
+from ai_crawl_analysis.utilities.response_cache import get_response_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Maximum number of AI requests in flight across all the workers.
+DEFAULT_AI_CONCURRENCY = 8
+
+
+def site_namespace(input_file: Path) -> str:
+    """
+    Return the output subdirectory name for a crawl file, eg. "sample-seed-fund".
+    """
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", input_file.stem).strip("-.") or "site"
+
+
+def find_crawl_files(input_dir: Path) -> list[Path]:
+    """
+    Return the crawl CSV files in a directory, leaving out the filtered copies that older versions
+    of the pipeline wrote next to the crawl files.
+    """
+    return sorted(
+        path
+        for path in input_dir.glob("*.csv")
+        if not path.name.endswith(".filtered.csv")
+    )
+
+
+def _init_worker(
+    request_slots, requests_per_minute: int, tokens_per_minute: int, no_cache: bool
+):
+    """
+    Set up a worker process: share the request slots and give it its part of the model quota.
+    """
+    set_shared_request_slots(request_slots)
+    os.environ["GEMINI_RPM"] = str(requests_per_minute)
+    os.environ["GEMINI_TPM"] = str(tokens_per_minute)
+    if no_cache:
+        get_response_cache().enabled = False
+
+
+def _run_site(
+    input_file: Path, args: argparse.Namespace, namespace: str
+) -> tuple[str, str]:
+    """
+    Run the pipeline on one crawl file in a worker process.
+
+    :return: The status of the site ("ok" or "failed") and an error message.
+    """
+    try:
+        run_pipeline(input_file, args, namespace)
+    except SystemExit as error:
+        if error.code:
+            return "failed", f"exited with status {error.code}"
+    except Exception as error:
+        logger.exception(f"Processing {input_file} failed")
+        return "failed", f"{type(error).__name__}: {error}"
+    return "ok", ""
+
+
+def run_batch(
+    input_files: list[Path],
+    args: argparse.Namespace,
+    workers: int = DEFAULT_WORKERS,
+    ai_concurrency: int = DEFAULT_AI_CONCURRENCY,
+) -> list[dict]:
+    """
+    Run the pipeline on several crawl files in parallel.
+
+    :param input_files: The crawl CSV files to process.
+    :param args: The pipeline options, as parsed by a parser set up with add_pipeline_arguments().
+    :param workers: Number of sites processed at the same time.
+    :param ai_concurrency: Maximum number of AI requests in flight across all the workers.
+    :return: A list with the "site", "status", "seconds" and "error" of each crawl file, in the
+      order of input_files.
+    """
+    workers = max(1, min(workers, len(input_files)))
+    requests_per_minute, tokens_per_minute = get_model_quota(DEFAULT_MODEL)
+    results = {}
+    with multiprocessing.Manager() as manager:
+        request_slots = manager.Semaphore(ai_concurrency)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(
+                request_slots,
+                max(1, requests_per_minute // workers),
+                max(1, tokens_per_minute // workers),
+                args.no_cache,
+            ),
+        ) as executor:
+            started = {}
+            futures = {}
+            for input_file in input_files:
+                namespace = site_namespace(input_file)
+                started[namespace] = time.monotonic()
+                futures[executor.submit(_run_site, input_file, args, namespace)] = (
+                    namespace
+                )
+            for future in as_completed(futures):
+                namespace = futures[future]
+                try:
+                    status, error = future.result()
+                except Exception as error_:
+                    # The worker process died, eg. because it ran out of memory.
+                    status, error = "failed", f"{type(error_).__name__}: {error_}"
+                results[namespace] = {
+                    "site": namespace,
+                    "status": status,
+                    "seconds": time.monotonic() - started[namespace],
+                    "error": error,
+                }
+                logger.info(f"Finished {namespace}: {status}")
+    return [results[site_namespace(input_file)] for input_file in input_files]
+
+
+def print_summary(results: list[dict]):
+    """
+    Print the status and run time of each site.
+    """
+    width = max(len(result["site"]) for result in results)
+    print("\nBatch summary:")
+    for result in results:
+        line = f"  {result['site']:<{width}}  {result['status']:<6}  {result['seconds']:8.1f}s"
+        if result["error"]:
+            line += f"  {result['error']}"
+        print(line)
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"{len(results) - failed} of {len(results)} sites processed successfully.")
+
+
+def main():
+    """
+    Processes every crawl file in a directory with the AI migrations processing pipeline.
+    """
+    parser = argparse.ArgumentParser(
+        description="Process several crawled sites in parallel for AI-assisted migration."
+    )
+    parser.add_argument(
+        "input_dir", help="Directory with the input CSV files of crawled data"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of sites processed at the same time.",
+    )
+    parser.add_argument(
+        "--ai-concurrency",
+        type=int,
+        default=DEFAULT_AI_CONCURRENCY,
+        help="Maximum number of AI requests in flight across all the sites.",
+    )
+    add_pipeline_arguments(parser)
+    args = parser.parse_args()
+
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        logger.error(f"Input directory not found: {input_dir}")
+        sys.exit(1)
+    input_files = find_crawl_files(input_dir)
+    if not input_files:
+        logger.error(f"No CSV files found in {input_dir}")
+        sys.exit(1)
+    namespaces = [site_namespace(input_file) for input_file in input_files]
+    if len(set(namespaces)) != len(namespaces):
+        logger.error("Several input files map to the same output directory name")
+        sys.exit(1)
+
+    logger.info(f"Processing {len(input_files)} sites with {args.workers} workers")
+    results = run_batch(input_files, args, args.workers, args.ai_concurrency)
+    print_summary(results)
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,105 @@ Analyzes a site crawl by extracting specified columns from a JSON file and addin
 groups to the data.
 
 Parameters:
-:param input_csv: Path to the input CSV file containing site crawl data.
-:param output_json: Path to the output JSON file where extracted columns will be saved.
+:param input_csv: Path to the input CSV file containing site crawl data, or the expanded crawl as a
+   DataFrame, eg. from the fused pipeline in main.py.
+:param output_json: Path to the output JSON file where extracted columns will be saved, or None to
+   keep them in memory.
 :param columns: List of column names to extract from the JSON file.
 :param is_web_app: Boolean indicating if the function is called from the streamlit web app context
    (default is False).
-:return: Path to the output JSON file with the extracted columns.
+:param max_input_tokens: Maximum estimated input tokens for each batch of rows sent to the model.
+:param max_output_tokens: Maximum estimated output tokens for each batch. Large sites are split into
+   batches that fit both budgets, and the results are merged back into one table.
+:param concurrency: Maximum number of AI requests kept in flight at once.
+:param stream: Stream the AI responses and write each row to a .stream.jsonl file next to the output
+   (and to the app) as soon as it arrives.
+:param near_duplicates: Only send one page of each group of pages with nearly the same page structure and
+   description (eg. pagination or tag archive pages) to the AI model, and give its migration group
+   to the rest of the group.
+:param url_templates: Group URLs by path template (eg. /grants/{id}) and only send a few URLs of each
+   template to the AI model. The migration group returned for them is given to the whole template.
+:param incremental: Keep the results of every URL in a local result store, and only send new URLs and
+   URLs whose extracted columns changed since the last run to the AI model. Unchanged URLs reuse
+   their stored migration group and streamlined sidebar.
+:param result_store: Path of the result store used with incremental (default is the
+   AI_RESULT_STORE environment variable, or data/result-store.sqlite). main.py keeps one store in
+   the output directory of each site, so sites processed at the same time do not share a database.
+:param sidebar_mode: "ai" to streamline sidebars with a second AI call, or "local" to cluster similar
+   sidebars locally without calling the model (default is "ai").
+:param output_dir: Directory for the analysis outputs (default is data/crawl-analysis).
+:param intermediate_format: Format of migration_groups.json and final-analysis-output.json: "text"
+   for JSON, or "parquet" or "ipc" to write them as Parquet or Arrow IPC files with the same name
+   (default is "text"). The format of output_json is taken from its suffix.
+:param save_outputs: Save the rows with migration groups and the final analysis to
+   migration_groups.json and final-analysis-output.json in output_dir (default is True).
+:param migration_groups: The migration group of each address, eg. from classify_expanding_crawl().
+   The rows are then not sent to the model for migration groups, and near_duplicates and
+   url_templates have no effect.
+:param payload_format: "json" to send the rows to the AI model as JSON objects, or "compact" to send
+   them as a table with a header row, addresses relative to the site's origin and short row ids,
+   and get back only the id and result of each row (default is "json").
+:param max_structure_chars: Maximum characters of each page structure in compact payloads, or None
+   to send them whole (default is DEFAULT_MAX_STRUCTURE_CHARS).
+:return: A DataFrame of the final analysis, with migration groups and streamlined sidebars. It is also
+   saved to final-analysis-output.json in output_dir, unless save_outputs is False.
 """
 
+import asyncio
+import json
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
 
+import polars as pl
 import streamlit as st
 
-from ai_crawl_analysis.utilities.ai_call import call_ai
+from ai_crawl_analysis.utilities.ai_call import call_ai_async, call_ai_stream_async
+from ai_crawl_analysis.utilities.batching import (
+    DEFAULT_MAX_INPUT_TOKENS,
+    DEFAULT_MAX_OUTPUT_TOKENS,
+    batch_rows,
+    estimate_tokens,
+)
 from ai_crawl_analysis.utilities.extract_columns_to_json import extract_cols_to_json
 from ai_crawl_analysis.utilities.file_loaders import load_prompt, load_schema
-from ai_crawl_analysis.utilities.json_cleaner import clean_json_file
+from ai_crawl_analysis.utilities.frame_io import (
+    infer_csv_types,
+    intermediate_path,
+    is_text_file,
+    read_rows,
+    write_frame,
+)
+from ai_crawl_analysis.utilities.json_cleaner import parse_json_response
+from ai_crawl_analysis.utilities.json_stream import JsonArrayStreamParser
+from ai_crawl_analysis.utilities.near_duplicates import (
+    expand_near_duplicate_results,
+    find_near_duplicates,
+)
+from ai_crawl_analysis.utilities.payload_encoder import (
+    DEFAULT_MAX_STRUCTURE_CHARS,
+    PAYLOAD_FORMATS,
+    CompactPayload,
+)
+from ai_crawl_analysis.utilities.response_cache import (
+    get_response_cache,
+    response_cache_key,
+)
+from ai_crawl_analysis.utilities.result_store import ResultStore
+from ai_crawl_analysis.utilities.run_manifest import BatchCheckpoint
+from ai_crawl_analysis.utilities.sidebar_clustering import cluster_sidebars
+from ai_crawl_analysis.utilities.sidebars import (
+    apply_streamlined_sidebars,
+    normalize_sidebar,
+    sidebar_counts,
+    unique_sidebars,
+)
+from ai_crawl_analysis.utilities.url_templates import (
+    assign_url_templates,
+    compression_ratio,
+    propagate_template_groups,
+)
 
 # Prompt and schema files.
 MIGRATION_GROUPS_PROMPT_FILE = "migration_group_prompt.txt"
@@ -26,6 +109,17 @@ MIGRATION_GROUPS_SCHEMA_FILE = "migration_group_schema.json"
 SIDEBAR_GROUPS_PROMPT_FILE = "migration_group_with_sidebar_prompt.txt"
 SIDEBAR_GROUPS_SCHEMA_FILE = "migration_group_with_sidebar_schema.json"
 
+# Migration group for rows the model did not classify after all retries.
+UNCLASSIFIED_GROUP = "Unclassified"
+# Number of times rows missing from a batch response are sent again.
+MAX_BATCH_RETRIES = 2
+# Number of AI requests kept in flight at once.
+DEFAULT_CONCURRENCY = 4
+# Ways to streamline sidebar descriptions: with the AI model or by local clustering.
+SIDEBAR_MODES = ("ai", "local")
+# Expanded chunks of rows waiting for a batch when the crawl is classified while it is expanded.
+OVERLAP_QUEUE_CHUNKS = 2
+
 migration_groups_system_instructions = (
     "You are a skilled SEO and content structure analyst with "
     "expertise in site architecture, content classification, and "
@@ -41,74 +135,1019 @@ sidebar_groups_system_instructions = (
 )
 
 
+def _log(message: str, expander=None):
+    """Print a progress message and mirror it to the streamlit expander when running in the app."""
+    print(message)
+    if expander is not None:
+        expander.write(message)
+
+
+@contextmanager
+def _streamed_rows(stream_path: Path | None, expander=None):
+    """
+    Yield a callback that appends each streamed row to a JSON Lines file and shows it in the app as
+    soon as it arrives. Yields None when streaming is off.
+    """
+    if stream_path is None:
+        yield None
+        return
+
+    progress = expander.empty() if expander is not None else None
+    count = 0
+    with stream_path.open("w", encoding="utf-8") as stream_file:
+
+        def on_row(row: dict):
+            nonlocal count
+            stream_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            stream_file.flush()
+            count += 1
+            if progress is not None:
+                progress.write(f"Received {count} rows. Latest: {row.get('address')}")
+
+        yield on_row
+    print(f"Streamed {count} rows to {stream_path}")
+
+
+def _write_rows(rows: list[dict], path: Path, df: pl.DataFrame | None = None):
+    """
+    Write rows to a JSON file, or to a Parquet or Arrow IPC file depending on the suffix.
+
+    :param rows: The rows to write.
+    :param path: The output file.
+    :param df: The rows as a DataFrame, if already built.
+    """
+    if is_text_file(path):
+        path.write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+        return
+    if df is None:
+        df = pl.DataFrame(rows, infer_schema_length=None, strict=False)
+    write_frame(df, path)
+
+
+def _stored_values(stored: dict[str, dict], key: str) -> list[str]:
+    """Return the distinct non-empty values of a result key in the stored results."""
+    return sorted({result[key] for result in stored.values() if result[key]})
+
+
+def _stored_sidebars(
+    rows: list[dict], sidebar_ids: dict[str, str], stored: dict[str, dict]
+) -> dict[str, str]:
+    """
+    Map the ids of sidebars used by unchanged rows to the streamlined description stored for them.
+    """
+    stored_sidebars: dict[str, str] = {}
+    for row in rows:
+        result = stored.get(str(row.get("address")))
+        key = normalize_sidebar(row.get("sidebar"))
+        if result and result["streamlined_sidebar"] and key in sidebar_ids:
+            stored_sidebars.setdefault(sidebar_ids[key], result["streamlined_sidebar"])
+    return stored_sidebars
+
+
+def _parse_batch_response(response: str) -> list[dict]:
+    """
+    Parse the rows returned by the model for a single batch. Responses that cannot be parsed return
+    no rows so their batch is retried.
+    """
+    if not response:
+        return []
+    try:
+        data = parse_json_response(response, expected_keys=0)
+    except ValueError as e:
+        print(f"⚠️ Could not parse batch response: {e}")
+        return []
+    if not isinstance(data, list):
+        return []
+    return [item for item in data if isinstance(item, dict)]
+
+
+async def _send_batch(
+    batch: list[dict],
+    name: str,
+    prompt: str,
+    system_instructions: str,
+    response_schema: dict,
+    expander=None,
+    on_row: Callable[[dict], None] | None = None,
+    payload: CompactPayload | None = None,
+) -> str:
+    """
+    Send one batch to the model and return its response. Takes the parameters of
+    run_batches_async(), with the name of the batch in the progress logs, eg. "3/10".
+
+    With a compact payload, the response is mapped back to the rows sent, so it holds the id_key
+    and result key of each row like the response to a JSON payload.
+    """
+    started = time.perf_counter()
+    row_ids: list = []
+    if payload is None:
+        content = json.dumps(batch, ensure_ascii=False)
+    else:
+        content, row_ids = payload.encode(batch)
+        prompt = payload.prompt(prompt)
+        response_schema = payload.response_schema(response_schema)
+    if on_row is None:
+        response = await call_ai_async(
+            prompt=prompt,
+            system_instructions=system_instructions,
+            content=content,
+            response_schema=response_schema,
+        )
+    else:
+        parser = JsonArrayStreamParser()
+        chunks = []
+        try:
+            async for chunk in call_ai_stream_async(
+                prompt=prompt,
+                system_instructions=system_instructions,
+                content=content,
+                response_schema=response_schema,
+            ):
+                chunks.append(chunk)
+                for item in parser.feed(chunk):
+                    row = item if payload is None else payload.decode(item, row_ids)
+                    if row is not None:
+                        on_row(row)
+        except Exception as e:
+            # A stream cut off after some rows keeps the rows it completed, and the rows missing
+            # from it are sent again with the other missing rows.
+            if not chunks:
+                raise
+            _log(f"⚠️ The response to batch {name} was cut off: {e}", expander)
+        response = "".join(chunks)
+    if payload is not None:
+        decoded = (
+            payload.decode(item, row_ids) for item in _parse_batch_response(response)
+        )
+        response = json.dumps(
+            [row for row in decoded if row is not None], ensure_ascii=False
+        )
+    _log(
+        f"Batch {name} with {len(batch)} rows completed in "
+        f"{time.perf_counter() - started:.1f}s",
+        expander,
+    )
+    return response
+
+
+class _BatchLabels:
+    """
+    The labels returned by each batch of a run, so later batches can reuse them in their prompts.
+
+    A batch only uses the labels of the batches that are at least `window` batches before it, and
+    waits for those to complete. With `window` set to the concurrency, the labels in each prompt do
+    not depend on which batches happened to finish first, so a rerun sends the same prompts and
+    hits the response cache.
+    """
+
+    def __init__(self, window: int, settled=(), start: int = 1):
+        """
+        :param window: The number of batches before a batch whose labels it does not wait for.
+        :param settled: Labels known before the first batch, eg. from earlier runs.
+        :param start: The index of the first batch.
+        """
+        self.window = max(window, 1)
+        self.settled = [str(label) for label in settled]
+        self.start = start
+        self._labels: dict[int, set[str]] = {}
+        self._done: dict[int, asyncio.Event] = {}
+
+    def _event(self, index: int) -> asyncio.Event:
+        return self._done.setdefault(index, asyncio.Event())
+
+    async def wait(self, index: int) -> list[str]:
+        """
+        Wait for the batches whose labels a batch uses, and return the labels.
+        """
+        earlier = range(self.start, index - self.window + 1)
+        for earlier_index in earlier:
+            await self._event(earlier_index).wait()
+        labels = set(self.settled)
+        for earlier_index in earlier:
+            labels |= self._labels[earlier_index]
+        return sorted(labels)
+
+    def complete(self, index: int, labels):
+        """
+        Record the labels returned by a batch, and let the batches waiting for it continue.
+        """
+        self._labels[index] = {str(label) for label in labels}
+        self._event(index).set()
+
+
+def _label_prompt(prompt: str, result_key: str, labels: list[str]) -> str:
+    """
+    Add the labels returned so far to a prompt, so later batches reuse them.
+    """
+    if not labels:
+        return prompt
+    existing = json.dumps(sorted({str(label) for label in labels}), ensure_ascii=False)
+    return f"{prompt}\n- Reuse these existing {result_key} values where they fit: {existing}"
+
+
+def _batch_results(
+    batch: list[dict], response: str, id_key: str, result_key: str
+) -> dict[str, Any]:
+    """
+    Return the value the model returned for each row of a batch, by the row's id_key value.
+    """
+    row_ids = {str(row.get(id_key)) for row in batch}
+    results = {}
+    for item in _parse_batch_response(response):
+        row_id = str(item.get(id_key))
+        value = item.get(result_key)
+        if row_id in row_ids and value not in (None, ""):
+            results[row_id] = value
+    return results
+
+
+def _payload(
+    payload_format: str, id_key: str, result_key: str, max_structure_chars: int | None
+) -> CompactPayload | None:
+    """
+    Return the encoder of the compact payload format, or None for JSON payloads.
+    """
+    if payload_format not in PAYLOAD_FORMATS:
+        raise ValueError(
+            f"Unknown payload format {payload_format!r}, expected one of {PAYLOAD_FORMATS}"
+        )
+    if payload_format == "json":
+        return None
+    return CompactPayload(id_key, result_key, max_structure_chars)
+
+
+def _prompt_tokens(
+    prompt: str, system_instructions: str, payload: CompactPayload | None
+) -> int:
+    """
+    Estimate the tokens of the prompt and system instructions sent with every batch.
+    """
+    if payload is not None:
+        prompt = payload.prompt(prompt)
+    return estimate_tokens(prompt) + estimate_tokens(system_instructions)
+
+
+def _batches(
+    rows: list[dict],
+    max_input_tokens: int,
+    max_output_tokens: int,
+    prompt_tokens: int,
+    payload: CompactPayload | None,
+) -> list[list[dict]]:
+    """
+    Split rows into batches with batch_rows(), estimating their tokens in the payload format.
+    """
+    if payload is None:
+        return batch_rows(
+            rows,
+            max_input_tokens=max_input_tokens,
+            max_output_tokens=max_output_tokens,
+            prompt_tokens=prompt_tokens,
+        )
+    return batch_rows(
+        rows,
+        max_input_tokens=max_input_tokens,
+        max_output_tokens=max_output_tokens,
+        prompt_tokens=prompt_tokens,
+        output_tokens_per_row=payload.output_tokens_per_row,
+        row_text=payload.row_text,
+    )
+
+
+async def run_batches_async(
+    batches: list[list[dict]],
+    build_prompt: Callable[[int], Awaitable[str]],
+    system_instructions: str,
+    response_schema: dict,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    expander=None,
+    on_row: Callable[[dict], None] | None = None,
+    on_response: Callable[[int, list[dict], str], None] | None = None,
+    payload: CompactPayload | None = None,
+) -> list[str]:
+    """
+    Send batches to the model with at most `concurrency` requests in flight at once.
+
+    :param batches: The batches of rows to send.
+    :param build_prompt: Awaited with the index of a batch, counted from 1, to get its prompt
+      before the batch waits for a free request slot, so later batches can use results from
+      earlier batches (see _BatchLabels).
+    :param system_instructions: The system instructions sent with every batch.
+    :param response_schema: The schema the model's response should follow.
+    :param concurrency: Maximum number of requests in flight.
+    :param expander: Optional streamlit expander for progress logs.
+    :param on_row: Optional callback. When set, responses are streamed and the callback is called
+      with each row as soon as it is complete.
+    :param on_response: Optional callback called with the index of each batch, the batch and its
+      response as soon as the batch completes.
+    :param payload: Optional compact payload encoder. When set, the batches are sent as compact
+      tables, and the responses are mapped back to the rows sent.
+    :return: The responses, in the same order as the batches.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def send(index: int, batch: list[dict]) -> str:
+        prompt = await build_prompt(index)
+        async with semaphore:
+            response = await _send_batch(
+                batch,
+                f"{index}/{len(batches)}",
+                prompt,
+                system_instructions,
+                response_schema,
+                expander,
+                on_row,
+                payload,
+            )
+            if on_response is not None:
+                on_response(index, batch, response)
+            return response
+
+    return await asyncio.gather(
+        *(send(index, batch) for index, batch in enumerate(batches, start=1))
+    )
+
+
+async def classify_in_batches_async(
+    rows: list[dict],
+    prompt: str,
+    system_instructions: str,
+    response_schema: dict,
+    result_key: str,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    reuse_labels: bool = False,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    expander=None,
+    on_row: Callable[[dict], None] | None = None,
+    id_key: str = "address",
+    seed_labels: list[str] | None = None,
+    checkpoint: BatchCheckpoint | None = None,
+    retries: int = MAX_BATCH_RETRIES,
+    payload_format: str = "json",
+    max_structure_chars: int | None = DEFAULT_MAX_STRUCTURE_CHARS,
+) -> dict[str, Any]:
+    """
+    Send rows to the model in token-budgeted batches and collect the value the model adds to each row.
+
+    Rows missing from a response (eg. because the response was cut off) are sent again in smaller
+    batches, up to `retries` times.
+
+    :param rows: The rows to classify. Each row must have a unique id_key value.
+    :param prompt: The prompt sent with every batch.
+    :param system_instructions: The system instructions sent with every batch.
+    :param response_schema: The schema the model's response should follow.
+    :param result_key: The key the model adds to each row, eg. "migration_group".
+    :param max_input_tokens: Maximum estimated input tokens per batch.
+    :param max_output_tokens: Maximum estimated output tokens per batch.
+    :param reuse_labels: When True, the values returned by earlier batches are added to the prompt
+      of later batches so the labels stay consistent across batches. The first batch is sent on its
+      own to seed the labels. Each batch waits for the batches `concurrency` places before it and
+      uses their labels, so the prompts are the same on every run (see _BatchLabels).
+    :param concurrency: Maximum number of requests in flight.
+    :param expander: Optional streamlit expander for progress logs.
+    :param on_row: Optional callback to stream responses and receive each row as it arrives.
+    :param id_key: The key used to match the rows in a response to the rows sent (default is
+      "address").
+    :param seed_labels: Labels from earlier runs to reuse from the first batch on, when reuse_labels
+      is True.
+    :param checkpoint: Optional checkpoint. The results of each batch are saved to it as soon as the
+      batch completes, and rows with saved results are not sent again.
+    :param retries: Number of times rows missing from the responses are sent again.
+    :param payload_format: "json" to send each batch as a JSON array of the rows, or "compact" to
+      send it as a table with short row ids and get back only the id and result of each row (see
+      utilities/payload_encoder.py).
+    :param max_structure_chars: Maximum characters of each page structure in compact payloads, or
+      None to send them whole.
+    :return: A dictionary mapping each row's id_key value, as a string, to the value returned for it.
+    """
+    results: dict[str, Any] = {}
+    if not rows:
+        return results
+    if checkpoint is not None:
+        row_ids = {str(row.get(id_key)) for row in rows}
+        saved = checkpoint.load()
+        results.update({key: value for key, value in saved.items() if key in row_ids})
+        if results:
+            _log(
+                f"Resuming with {len(results)} rows saved by an earlier run.", expander
+            )
+    pending = [row for row in rows if str(row.get(id_key)) not in results]
+    seed_labels = seed_labels or []
+    payload = _payload(payload_format, id_key, result_key, max_structure_chars)
+    prompt_tokens = _prompt_tokens(prompt, system_instructions, payload)
+
+    # The labels of each run of batches, reset before every run with the labels of earlier runs.
+    labels = _BatchLabels(concurrency)
+
+    async def build_prompt(index: int) -> str:
+        if not reuse_labels:
+            return prompt
+        return _label_prompt(prompt, result_key, await labels.wait(index))
+
+    def collect(index: int, batch: list[dict], response: str):
+        batch_results = _batch_results(batch, response, id_key, result_key)
+        results.update(batch_results)
+        labels.complete(index, batch_results.values())
+        if checkpoint is not None:
+            checkpoint.append(batch_results)
+
+    started = time.perf_counter()
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        batches = _batches(
+            pending, max_input_tokens, max_output_tokens, prompt_tokens, payload
+        )
+        _log(
+            f"Sending {len(pending)} rows to the AI model in {len(batches)} batches "
+            f"({concurrency} at a time)...",
+            expander,
+        )
+        if reuse_labels and not (results or seed_labels) and len(batches) > 1:
+            labels = _BatchLabels(concurrency)
+            await run_batches_async(
+                batches[:1],
+                build_prompt,
+                system_instructions,
+                response_schema,
+                concurrency,
+                expander,
+                on_row,
+                on_response=collect,
+                payload=payload,
+            )
+            batches = batches[1:]
+        labels = _BatchLabels(concurrency, [*seed_labels, *results.values()])
+        await run_batches_async(
+            batches,
+            build_prompt,
+            system_instructions,
+            response_schema,
+            concurrency,
+            expander,
+            on_row,
+            on_response=collect,
+            payload=payload,
+        )
+
+        pending = [row for row in pending if str(row.get(id_key)) not in results]
+        if not pending or attempt == retries:
+            break
+        _log(
+            f"⚠️ {len(pending)} rows were missing from the AI responses. Retrying them in smaller "
+            f"batches.",
+            expander,
+        )
+        max_input_tokens = max(max_input_tokens // 2, 1)
+        max_output_tokens = max(max_output_tokens // 2, 1)
+
+    if pending:
+        _log(
+            f"⚠️ {len(pending)} rows did not get a {result_key} after {retries} retries.",
+            expander,
+        )
+    _log(f"AI batches completed in {time.perf_counter() - started:.1f}s", expander)
+    return results
+
+
+def classify_in_batches(*args, **kwargs) -> dict[str, Any]:
+    """
+    Synchronous wrapper around classify_in_batches_async. Takes the same parameters.
+    """
+    return asyncio.run(classify_in_batches_async(*args, **kwargs))
+
+
+async def classify_stream_async(
+    row_chunks: AsyncIterator[list[dict]],
+    prompt: str,
+    system_instructions: str,
+    response_schema: dict,
+    result_key: str,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    reuse_labels: bool = False,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    expander=None,
+    on_row: Callable[[dict], None] | None = None,
+    id_key: str = "address",
+    payload_format: str = "json",
+    max_structure_chars: int | None = DEFAULT_MAX_STRUCTURE_CHARS,
+) -> dict[str, Any]:
+    """
+    Send rows to the model in token-budgeted batches as they arrive, and collect the value the
+    model adds to each row.
+
+    A batch is sent as soon as enough rows have arrived to fill it, while the next rows are still
+    being produced. Rows missing from the responses are sent again with
+    classify_in_batches_async() once every row has arrived.
+
+    :param row_chunks: The rows to classify, a list of rows at a time.
+    The other parameters and the return value are those of classify_in_batches_async().
+    """
+    results: dict[str, Any] = {}
+    received: list[dict] = []
+    pending: list[dict] = []
+    tasks = []
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    payload = _payload(payload_format, id_key, result_key, max_structure_chars)
+    prompt_tokens = _prompt_tokens(prompt, system_instructions, payload)
+    started = time.perf_counter()
+
+    labels = _BatchLabels(concurrency)
+
+    async def send(index: int, batch: list[dict], labels: _BatchLabels):
+        batch_prompt = prompt
+        if reuse_labels:
+            batch_prompt = _label_prompt(prompt, result_key, await labels.wait(index))
+        async with semaphore:
+            response = await _send_batch(
+                batch,
+                str(index),
+                batch_prompt,
+                system_instructions,
+                response_schema,
+                expander,
+                on_row,
+                payload,
+            )
+        batch_results = _batch_results(batch, response, id_key, result_key)
+        results.update(batch_results)
+        labels.complete(index, batch_results.values())
+
+    batch_count = 0
+
+    async def dispatch(batches: list[list[dict]]):
+        nonlocal batch_count, labels
+        for batch in batches:
+            batch_count += 1
+            if reuse_labels and batch_count == 1:
+                # The first batch is sent on its own to seed the labels of the others.
+                await send(batch_count, batch, labels)
+                labels = _BatchLabels(concurrency, results.values(), start=2)
+            else:
+                tasks.append(asyncio.create_task(send(batch_count, batch, labels)))
+
+    async for rows in row_chunks:
+        received.extend(rows)
+        batches = _batches(
+            pending + rows,
+            max_input_tokens,
+            max_output_tokens,
+            prompt_tokens,
+            payload,
+        )
+        # The last batch may still have room for the next rows.
+        pending = batches.pop() if batches else []
+        await dispatch(batches)
+    if pending:
+        await dispatch([pending])
+    await asyncio.gather(*tasks)
+    _log(
+        f"Sent {len(received)} rows to the AI model in {batch_count} batches as they arrived, "
+        f"in {time.perf_counter() - started:.1f}s",
+        expander,
+    )
+
+    missing = [row for row in received if str(row.get(id_key)) not in results]
+    if missing:
+        _log(
+            f"⚠️ {len(missing)} rows were missing from the AI responses. Retrying them in smaller "
+            f"batches.",
+            expander,
+        )
+        results.update(
+            await classify_in_batches_async(
+                missing,
+                prompt=prompt,
+                system_instructions=system_instructions,
+                response_schema=response_schema,
+                result_key=result_key,
+                max_input_tokens=max(max_input_tokens // 2, 1),
+                max_output_tokens=max(max_output_tokens // 2, 1),
+                reuse_labels=reuse_labels,
+                concurrency=concurrency,
+                expander=expander,
+                on_row=on_row,
+                id_key=id_key,
+                seed_labels=sorted({str(value) for value in results.values()}),
+                retries=MAX_BATCH_RETRIES - 1,
+                payload_format=payload_format,
+                max_structure_chars=max_structure_chars,
+            )
+        )
+    return results
+
+
+async def _classify_expanding_crawl_async(
+    chunks: Iterator[pl.DataFrame],
+    columns: list,
+    max_input_tokens: int,
+    max_output_tokens: int,
+    concurrency: int,
+    stream: bool,
+    output_dir: str | Path,
+    payload_format: str,
+    max_structure_chars: int | None,
+) -> tuple[pl.DataFrame, dict[str, Any]]:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=OVERLAP_QUEUE_CHUNKS)
+    expanded_chunks = []
+
+    async def produce():
+        try:
+            # Each chunk is read and expanded in a worker thread, so the event loop keeps sending
+            # batches and receiving responses in the meantime.
+            while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                expanded_chunks.append(chunk)
+                typed = infer_csv_types(chunk)
+                await queue.put(
+                    typed.select(c for c in columns if c in typed.columns).to_dicts()
+                )
+        finally:
+            # The end of the rows is not marked when the producer was cancelled because the
+            # classification failed, since nothing reads the queue any more.
+            task = asyncio.current_task()
+            if task is None or not task.cancelling():
+                await queue.put(None)
+
+    async def row_chunks():
+        while (rows := await queue.get()) is not None:
+            yield rows
+
+    crawl_analysis_dir = Path(output_dir)
+    crawl_analysis_dir.mkdir(parents=True, exist_ok=True)
+    producer = asyncio.create_task(produce())
+    try:
+        with _streamed_rows(
+            crawl_analysis_dir / "migration_groups.stream.jsonl" if stream else None
+        ) as on_row:
+            migration_groups = await classify_stream_async(
+                row_chunks(),
+                prompt=load_prompt(MIGRATION_GROUPS_PROMPT_FILE),
+                system_instructions=migration_groups_system_instructions,
+                response_schema=load_schema(MIGRATION_GROUPS_SCHEMA_FILE),
+                result_key="migration_group",
+                max_input_tokens=max_input_tokens,
+                max_output_tokens=max_output_tokens,
+                reuse_labels=True,
+                concurrency=concurrency,
+                on_row=on_row,
+                payload_format=payload_format,
+                max_structure_chars=max_structure_chars,
+            )
+    except BaseException:
+        # The producer may be blocked on the full queue, so it is stopped and the chunks it queued
+        # are dropped. Its own error, if any, is not raised over the error of the classification.
+        producer.cancel()
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.gather(producer, return_exceptions=True)
+        raise
+    await producer
+    if not expanded_chunks:
+        return pl.DataFrame(schema=dict.fromkeys(columns, pl.Utf8)), migration_groups
+    expanded = infer_csv_types(pl.concat(expanded_chunks, how="diagonal"))
+    return expanded, migration_groups
+
+
+def classify_expanding_crawl(
+    chunks: Iterator[pl.DataFrame],
+    columns: list,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stream: bool = False,
+    output_dir: str | Path = "data/crawl-analysis",
+    payload_format: str = "json",
+    max_structure_chars: int | None = DEFAULT_MAX_STRUCTURE_CHARS,
+) -> tuple[pl.DataFrame, dict[str, Any]]:
+    """
+    Assign migration groups to the rows of a crawl while the crawl is still being expanded.
+
+    The chunks are produced in a worker thread, and their rows are sent to the AI model as soon as
+    they fill a batch, so reading and decoding the crawl overlaps with waiting for the model. Pass
+    the migration groups to crawl_analysis() to streamline the sidebars and save the analysis.
+
+    :param chunks: The expanded chunks of the crawl, as yielded by iter_expanded_chunks().
+    :param columns: The columns sent to the model.
+    :param max_input_tokens: Maximum estimated input tokens for each batch.
+    :param max_output_tokens: Maximum estimated output tokens for each batch.
+    :param concurrency: Maximum number of AI requests kept in flight at once.
+    :param stream: Stream the AI responses to migration_groups.stream.jsonl in output_dir.
+    :param output_dir: Directory for the analysis outputs.
+    :param payload_format: "json" or "compact", see classify_in_batches_async().
+    :param max_structure_chars: Maximum characters of each page structure in compact payloads.
+    :return: The expanded crawl, as returned by expand_json_frame(), and the migration group
+      returned for each address.
+    """
+    return asyncio.run(
+        _classify_expanding_crawl_async(
+            chunks,
+            columns,
+            max_input_tokens,
+            max_output_tokens,
+            concurrency,
+            stream,
+            output_dir,
+            payload_format,
+            max_structure_chars,
+        )
+    )
+
+
 def crawl_analysis(
-    input_csv: str, output_json: str, columns: list, is_web_app: bool = False
+    input_csv: str | pl.DataFrame,
+    output_json: str | Path | None,
+    columns: list,
+    is_web_app: bool = False,
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    stream: bool = False,
+    near_duplicates: bool = False,
+    url_templates: bool = False,
+    incremental: bool = False,
+    result_store: str | Path | None = None,
+    sidebar_mode: str = "ai",
+    output_dir: str | Path = "data/crawl-analysis",
+    intermediate_format: str = "text",
+    save_outputs: bool = True,
+    migration_groups: dict[str, Any] | None = None,
+    payload_format: str = "json",
+    max_structure_chars: int | None = DEFAULT_MAX_STRUCTURE_CHARS,
 ):
+    if sidebar_mode not in SIDEBAR_MODES:
+        raise ValueError(
+            f"Unknown sidebar mode {sidebar_mode!r}, expected one of {SIDEBAR_MODES}"
+        )
+    if payload_format not in PAYLOAD_FORMATS:
+        raise ValueError(
+            f"Unknown payload format {payload_format!r}, expected one of {PAYLOAD_FORMATS}"
+        )
 
-    data = extract_cols_to_json(input_csv, output_json, columns)
-    print(f"Extracted columns {columns} from {input_csv} to {output_json}")
+    if isinstance(input_csv, pl.DataFrame):
+        extracted = input_csv.select(columns)
+        if output_json is not None:
+            write_frame(extracted, output_json)
+            print(f"Extracted columns {columns} to {output_json}")
+        rows = extracted.to_dicts()
+    else:
+        if output_json is None:
+            raise ValueError(
+                "An output file is needed to extract the columns of a crawl file"
+            )
+        extract_cols_to_json(input_csv, output_json, columns)
+        print(f"Extracted columns {columns} from {input_csv} to {output_json}")
+        rows = read_rows(output_json)
+    expander = None
     if is_web_app:
         expander = st.expander("Detailed crawl analysis logs", expanded=True)
 
+    if not rows:
+        print("No rows found to analyze. Skipping crawl analysis.")
+        exit(0)
+
     # Load the migration groups prompt from the file.
     prompt = load_prompt(MIGRATION_GROUPS_PROMPT_FILE)
     migration_groups_schema = load_schema(MIGRATION_GROUPS_SCHEMA_FILE)
     system_instructions = migration_groups_system_instructions
-    if is_web_app:
+    if expander is not None:
         expander.write(
-            "Sending an AI call to analyze crawl data and assign migration groups to urls..."
+            "Sending AI calls to analyze crawl data and assign migration groups to urls..."
         )
-    response = call_ai(
-        prompt=prompt,
-        system_instructions=system_instructions,
-        file=str(data),
-        response_schema=migration_groups_schema,
-    )
+    crawl_analysis_dir = Path(output_dir)
+    crawl_analysis_dir.mkdir(parents=True, exist_ok=True)
+
+    # Rows that have not changed since they were last analyzed reuse their stored results.
+    store = None
+    if incremental:
+        store = ResultStore() if result_store is None else ResultStore(result_store)
+    stored = store.lookup(rows, columns) if store is not None else {}
+    rows_to_classify = [row for row in rows if str(row.get("address")) not in stored]
+    if store is not None:
+        _log(
+            f"Reusing stored results for {len(stored)} unchanged rows. Analyzing "
+            f"{len(rows_to_classify)} new or changed rows.",
+            expander,
+        )
+
+    checkpoint_dir = crawl_analysis_dir / "checkpoints"
+    checkpoints = []
+    if migration_groups is None:
+        # Near-duplicate pages only need one page of each group classified.
+        duplicates = None
+        if near_duplicates:
+            started = time.perf_counter()
+            duplicates = find_near_duplicates(rows_to_classify)
+            rows_to_classify = [
+                row
+                for row in rows_to_classify
+                if duplicates.get(str(row.get("address"))) == str(row.get("address"))
+            ]
+            payload_tokens = estimate_tokens(json.dumps(rows, ensure_ascii=False))
+            collapsed_tokens = estimate_tokens(
+                json.dumps(rows_to_classify, ensure_ascii=False)
+            )
+            _log(
+                f"Collapsed {len(rows)} pages into {len(rows_to_classify)} near-duplicate groups in "
+                f"{time.perf_counter() - started:.1f}s. The AI payload shrank from about "
+                f"{payload_tokens} to {collapsed_tokens} tokens.",
+                expander,
+            )
+
+        # URLs that share a path template only need a few representatives classified.
+        templates = None
+        if url_templates:
+            templates = assign_url_templates(
+                [str(row.get("address")) for row in rows_to_classify]
+            )
+            representatives = set(templates.filter(pl.col("representative"))["address"])
+            sent_rows = [
+                row
+                for row in rows_to_classify
+                if str(row.get("address")) in representatives
+            ]
+            _log(
+                f"Grouped {len(rows_to_classify)} URLs into "
+                f"{templates['template'].n_unique()} path templates. Sending {len(sent_rows)} "
+                f"representative URLs to the AI model (compression ratio "
+                f"{compression_ratio(templates):.1f}x).",
+                expander,
+            )
+            rows_to_classify = sent_rows
 
-    # Write the response to a new JSON file
+        # Completed batches are checkpointed so a crashed run does not pay for them again. The file
+        # name includes a hash of the rows and prompt, so a checkpoint is only reused for the same data.
+        checkpoints = [
+            BatchCheckpoint(
+                checkpoint_dir
+                / f"migration-groups-{response_cache_key(prompt=prompt, rows=rows_to_classify)}.jsonl"
+            )
+        ]
+        with _streamed_rows(
+            crawl_analysis_dir / "migration_groups.stream.jsonl" if stream else None,
+            expander,
+        ) as on_row:
+            migration_groups = classify_in_batches(
+                rows_to_classify,
+                prompt=prompt,
+                system_instructions=system_instructions,
+                response_schema=migration_groups_schema,
+                result_key="migration_group",
+                max_input_tokens=max_input_tokens,
+                max_output_tokens=max_output_tokens,
+                reuse_labels=True,
+                concurrency=concurrency,
+                expander=expander,
+                on_row=on_row,
+                seed_labels=_stored_values(stored, "migration_group"),
+                checkpoint=checkpoints[0],
+                payload_format=payload_format,
+                max_structure_chars=max_structure_chars,
+            )
+        if templates is not None:
+            migration_groups = propagate_template_groups(templates, migration_groups)
+        if duplicates is not None:
+            migration_groups = expand_near_duplicate_results(
+                migration_groups, duplicates
+            )
+    for address, result in stored.items():
+        if result["migration_group"]:
+            migration_groups[address] = result["migration_group"]
+
+    # Merge the migration groups back onto the extracted rows so every URL is kept, even when the
+    # model did not return it.
+    grouped_rows = [
+        {
+            **row,
+            "migration_group": migration_groups.get(
+                str(row.get("address")), UNCLASSIFIED_GROUP
+            ),
+        }
+        for row in rows
+    ]
+
+    # Write the merged rows to a new JSON file
     # Define the output path for migration groups analysis
-    migration_groups_path = Path("data/crawl-analysis/migration_groups.json")
-    if is_web_app:
+    migration_groups_path = intermediate_path(
+        crawl_analysis_dir / "migration_groups.json", intermediate_format
+    )
+    if expander is not None:
         expander.write(
             "✅ AI analysis to identify and assign migration groups completed."
         )
-    migration_groups_path.parent.mkdir(parents=True, exist_ok=True)
 
-    migration_groups_path.write_text(response, encoding="utf-8")
-    print(f"Migration groups assigned and saved to {migration_groups_path}")
+    if save_outputs:
+        _write_rows(grouped_rows, migration_groups_path)
+        print(f"Migration groups assigned and saved to {migration_groups_path}")
 
-    if not response:
+    if not migration_groups:
         print("No migration groups found. Skipping sidebar analysis.")
         exit(0)
 
     # Pass #2: If the sidebar column has content, analyze the content, rewrite the sidebar content
-    # so similar sidebars have the same description.
-    # Load the sidebar prompt
-    sidebar_prompt = load_prompt(SIDEBAR_GROUPS_PROMPT_FILE)
-    sidebar_schema = load_schema(SIDEBAR_GROUPS_SCHEMA_FILE)
-
-    # The schema generated by the LLM is wrapped in backticks. Read and clean the file content
-    cleaned_content = clean_json_file(migration_groups_path)
-    if is_web_app:
-        expander.write(
-            "Starting a second AI call to analyze sidebars within migration groups.."
+    # so similar sidebars have the same description. Only the unique sidebars are sent, and the
+    # rewritten descriptions are mapped back onto every row that uses them.
+    # With the local sidebar mode, similar sidebars are clustered without calling the model instead.
+    sidebars, sidebar_ids = unique_sidebars(grouped_rows)
+    _log(
+        f"Found {len(sidebars)} unique sidebars across {len(grouped_rows)} rows.",
+        expander,
+    )
+    # Sidebars already streamlined for unchanged rows keep their stored description.
+    stored_sidebars = _stored_sidebars(grouped_rows, sidebar_ids, stored)
+    sidebars = [sidebar for sidebar in sidebars if sidebar["id"] not in stored_sidebars]
+    if stored_sidebars:
+        _log(
+            f"Reusing stored descriptions for {len(stored_sidebars)} unique sidebars.",
+            expander,
         )
 
-    sidebar_response = call_ai(
-        prompt=sidebar_prompt,
-        system_instructions=sidebar_groups_system_instructions,
-        content=cleaned_content,
-        response_schema=sidebar_schema,
+    streamlined_sidebars: dict[str, Any] = {}
+    if sidebars and sidebar_mode == "local":
+        started = time.perf_counter()
+        streamlined_sidebars = cluster_sidebars(
+            sidebars, sidebar_counts(grouped_rows, sidebar_ids)
+        )
+        _log(
+            f"Clustered {len(sidebars)} unique sidebars into "
+            f"{len(set(streamlined_sidebars.values()))} descriptions locally in "
+            f"{time.perf_counter() - started:.2f}s.",
+            expander,
+        )
+    elif sidebars:
+        # Load the sidebar prompt
+        sidebar_prompt = load_prompt(SIDEBAR_GROUPS_PROMPT_FILE)
+        sidebar_schema = load_schema(SIDEBAR_GROUPS_SCHEMA_FILE)
+        if expander is not None:
+            expander.write(
+                "Starting a second AI call to analyze sidebars within migration groups.."
+            )
+        checkpoints.append(
+            BatchCheckpoint(
+                checkpoint_dir
+                / f"sidebars-{response_cache_key(prompt=sidebar_prompt, rows=sidebars)}.jsonl"
+            )
+        )
+        with _streamed_rows(
+            (
+                crawl_analysis_dir / "final-analysis-output.stream.jsonl"
+                if stream
+                else None
+            ),
+            expander,
+        ) as on_row:
+            streamlined_sidebars = classify_in_batches(
+                sidebars,
+                prompt=sidebar_prompt,
+                system_instructions=sidebar_groups_system_instructions,
+                response_schema=sidebar_schema,
+                result_key="streamlined_sidebar",
+                max_input_tokens=max_input_tokens,
+                max_output_tokens=max_output_tokens,
+                reuse_labels=True,
+                concurrency=concurrency,
+                expander=expander,
+                on_row=on_row,
+                id_key="id",
+                seed_labels=sorted(set(stored_sidebars.values())),
+                checkpoint=checkpoints[-1],
+                payload_format=payload_format,
+                max_structure_chars=max_structure_chars,
+            )
+    streamlined_sidebars = {**stored_sidebars, **streamlined_sidebars}
+    # Rows without a rewritten sidebar keep their original sidebar description.
+    final_rows = apply_streamlined_sidebars(
+        grouped_rows, sidebar_ids, streamlined_sidebars
     )
 
-    # Write the response to a new JSON file
-    sidebar_path = Path("data/crawl-analysis/final-analysis-output.json")
-    sidebar_path.write_text(sidebar_response, encoding="utf-8")
-    if is_web_app:
+    # Write the merged rows to a new JSON file
+    sidebar_path = intermediate_path(
+        crawl_analysis_dir / "final-analysis-output.json", intermediate_format
+    )
+    final_df = pl.DataFrame(final_rows, infer_schema_length=None, strict=False)
+    if save_outputs:
+        _write_rows(final_rows, sidebar_path, final_df)
+        print(f"Sidebar content rewritten and saved to {sidebar_path}")
+    if expander is not None:
         expander.write(
             "✅ All AI processing completed. Output saved for further sorting and grouping."
         )
-    print(f"Sidebar content rewritten and saved to {sidebar_path}")
+    # The results are saved, so the checkpoints of this run are no longer needed.
+    for checkpoint in checkpoints:
+        checkpoint.remove()
+    if store is not None:
+        # Unclassified rows are left out so they are analyzed again on the next run.
+        analyzed_rows = [
+            row for row in final_rows if row["migration_group"] != UNCLASSIFIED_GROUP
+        ]
+        store.save(analyzed_rows, columns)
+        print(f"Saved the results of {len(analyzed_rows)} rows to {store.path}")
+    cache_stats = get_response_cache().stats()
+    print(
+        f"AI response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses"
+    )
+    return final_df
 
 
 # Example usage
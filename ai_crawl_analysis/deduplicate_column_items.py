@@ -1,40 +1,80 @@
 import ast
-import csv
-from typing import List, Set
+import json
+from pathlib import Path
+from typing import Iterable, Iterator, List, Set
+
+import polars as pl
+
+from ai_crawl_analysis.utilities.frame_io import scan_frame
+
+
+def _column_values(filename: str, column_name: str) -> Iterator:
+    """
+    Yield the values of a column from an expanded CSV, Parquet or Arrow IPC file. Only the column
+    is parsed. CSV values are read as the strings they are in the file, so a column is not given
+    a type from its first rows, and values such as "None" and "NA" are items too.
+    """
+    if Path(filename).suffix.lower() == ".csv":
+        lf = pl.scan_csv(filename, infer_schema=False, null_values=[""])
+    else:
+        lf = scan_frame(filename)
+    if column_name in lf.collect_schema().names():
+        yield from lf.select(column_name).collect()[column_name].to_list()
+
+
+def _parse_value(value: str):
+    """
+    Parse a list written to the expanded CSV file: JSON, or a Python-style list in files expanded
+    before lists were written as JSON.
+    """
+    if value.lstrip().startswith(("[", "{")):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    return ast.literal_eval(value)
+
+
+def _items(values: Iterable) -> Iterator[str]:
+    """
+    Yield the items of each value, stripped of whitespace.
+    """
+    for value in values:
+        # Typed values such as False and 0 are items too, only missing values are skipped.
+        if value is None or value == "":
+            continue
+        if not isinstance(value, str):
+            # Values read from Parquet and Arrow IPC files are already typed.
+            parsed = value
+        else:
+            try:
+                parsed = _parse_value(value)
+            except Exception:
+                # Fallback: treat as a comma-separated string
+                for item in value.split(","):
+                    yield item.strip().strip("'\"")
+                continue
+        if isinstance(parsed, list):
+            for item in parsed:
+                yield str(item).strip()
+        else:
+            # Fallback: treat as a single string
+            yield str(parsed).strip()
 
 
 def get_deduplicated_items_from_column(
     csv_filename: str, column_name: str
 ) -> List[str]:
     """
-    Reads a CSV file, extracts all values from the specified column, parses Python-style list strings,
-    and returns a deduplicated list of items (stripped of whitespace).
-    """
-    items: Set[str] = set()
-    with open(csv_filename, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            value = row.get(column_name, "")
-            if value:
-                try:
-                    # Try to parse as a Python list
-                    parsed = ast.literal_eval(value)
-                    if isinstance(parsed, list):
-                        for item in parsed:
-                            cleaned = str(item).strip()
-                            if cleaned:
-                                items.add(cleaned)
-                    else:
-                        # Fallback: treat as a single string
-                        cleaned = str(parsed).strip()
-                        if cleaned:
-                            items.add(cleaned)
-                except Exception:
-                    # Fallback: treat as a comma-separated string
-                    for item in value.split(","):
-                        cleaned = item.strip().strip("'\"")
-                        if cleaned:
-                            items.add(cleaned)
+    Reads a CSV file, extracts all values from the specified column, parses JSON or Python-style
+    list strings, and returns a deduplicated list of items (stripped of whitespace).
+
+    Parquet and Arrow IPC files are read too, based on the file suffix. Their list columns are used
+    as they are. Only the column is read from the file.
+    """
+    items: Set[str] = {
+        item for item in _items(_column_values(csv_filename, column_name)) if item
+    }
     return sorted(items)
 
 
@@ -5,19 +5,89 @@ This module reads a CSV file, expands JSON data stored in a specified column,
 adds new columns for each key in the JSON objects, and writes the expanded data to a new CSV file.
 
 It also filters out non-HTML rows before processing.
+
+Lists and objects in the JSON data are written to the CSV file as JSON, so they can be read back
+with json.loads. The expanded file can also be written as Parquet or Arrow IPC, for pipelines that
+pass intermediate files in a columnar format (see utilities/frame_io.py). There, lists and objects
+are kept as typed list and struct columns, and the other columns get the types they would be read
+with from the CSV file.
+
+Two engines write the same output. The "polars" engine (default) strips code fences with regular
+expressions and decodes the JSON column with str.json_decode, so the work is done on whole columns.
+Values whose JSON type the decoded column does not tell apart (eg. the string "true" and the boolean
+true) are parsed again in Python, and if the column cannot be decoded as a whole, eg. because a cell
+holds invalid JSON, every object is parsed in Python. The "python" engine parses every row with
+json.loads.
+
+In streaming mode the file is filtered and expanded in chunks of rows, so memory use does not grow
+with the size of the input file. The new columns are found in a first pass over the JSON column,
+unless they are declared. With the typed decoder, the JSON objects are checked against the schema
+of the Screaming Frog prompt as they are decoded, and the problems are collected into a report
+instead of being printed row by row. With worker processes, the filtered file is split into shards
+that are expanded in parallel. expand_json_frame() expands rows already in memory without writing
+any file, for the fused pipeline in main.py.
 """
 
 import csv
 import json
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
+from typing import Iterable, Iterator, Mapping, Sequence
+
+import polars as pl
 
-from ai_crawl_analysis.utilities.filter_html_rows import filter_html_rows
-from ai_crawl_analysis.utilities.header_cleaner import clean_header
+from ai_crawl_analysis.utilities.crawl_json_schema import (
+    CRAWL_SCHEMA,
+    add_issue,
+    json_type,
+    merge_decode_report,
+    new_decode_report,
+    print_decode_report,
+    validate_object,
+    write_decode_report,
+)
+from ai_crawl_analysis.utilities.csv_shards import read_csv_range, record_ranges
+from ai_crawl_analysis.utilities.filter_html_rows import (
+    filter_html_rows,
+    iter_html_chunks,
+)
+from ai_crawl_analysis.utilities.frame_io import (
+    CSV_NULL_VALUES,
+    infer_csv_types,
+    intermediate_path,
+    is_text_file,
+    iter_csv_chunks,
+    read_frame,
+    scan_csv_typed,
+    sink_frame,
+    write_frame,
+)
+from ai_crawl_analysis.utilities.header_cleaner import clean_header, header_map
 from ai_crawl_analysis.utilities.json_cleaner import (
     extract_json_content,
     remove_code_fences,
 )
 
+# Column of the crawl export holding the JSON object of each page.
+JSON_COLUMN = "Gemini: JSON schema v5"
+ENGINES = ("polars", "python")
+# "typed" checks the JSON column against the crawl schema while decoding it.
+DECODERS = ("json", "typed")
+# Number of rows expanded at a time in streaming mode.
+CHUNK_ROWS = 50_000
+# Shards of the filtered file for each worker process in parallel mode, so the workers stay busy
+# when some shards take longer than others.
+SHARDS_PER_WORKER = 4
+# Parquet and Arrow IPC shards smaller than this are not worth a separate process.
+MIN_SHARD_ROWS = 10_000
+# Decoded string values that may have been a JSON boolean or number instead.
+_AMBIGUOUS_STRING = r"^(true|false|-?[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?)$"
+# Integers with this many digits may be beyond the Int64 range, which Polars decodes as nulls.
+_LONG_INTEGER = r"[0-9]{19}"
+
 
 def extract_json(text):
     """
@@ -42,101 +112,1183 @@ def extract_json(text):
         return {}
 
 
-def expand_json_csv(input_file, output_file, json_col="Gemini: JSON schema v5"):
+def _read_filtered_rows(filtered_input_file: Path) -> tuple[list[dict], list[str]]:
+    """
+    Read the rows of the filtered file as strings, the way csv.DictReader reads them.
+    """
+    if is_text_file(filtered_input_file):
+        with open(filtered_input_file, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            return list(reader), list(reader.fieldnames or [])
+    df = _read_filtered_frame(filtered_input_file)
+    return df.to_dicts(), df.columns
+
+
+def _read_filtered_frame(filtered_input_file: Path) -> pl.DataFrame:
+    """
+    Read the filtered file with every column as strings and missing values as empty strings.
+    """
+    if is_text_file(filtered_input_file):
+        df = pl.read_csv(filtered_input_file, infer_schema=False)
+    else:
+        df = read_frame(filtered_input_file)
+    return df.with_columns(pl.all().cast(pl.Utf8).fill_null(""))
+
+
+def _is_nested(value) -> bool:
+    return isinstance(value, (list, dict))
+
+
+def _csv_value(value):
+    """
+    Return a value as written to the expanded CSV file. Lists and objects are written as JSON.
+    """
+    return json.dumps(value, ensure_ascii=False) if _is_nested(value) else value
+
+
+def _csv_string(value) -> str:
+    """
+    Return the text csv.DictWriter writes for a value.
+    """
+    return "" if value is None else str(_csv_value(value))
+
+
+def _column_series(name: str, values: list) -> pl.Series:
+    """
+    Build a column of the columnar expanded file. Columns with lists or objects become list or
+    struct columns when Polars can hold every value as it is, and JSON strings otherwise.
+    """
+    if not any(_is_nested(value) for value in values):
+        return pl.Series(name, values, dtype=pl.Utf8)
+    try:
+        series = pl.Series(name, values, strict=False)
+        if series.dtype.is_nested() and series.to_list() == values:
+            return series
+    except (TypeError, ValueError, pl.exceptions.PolarsError):
+        pass
+    return pl.Series(name, [_csv_value(value) for value in values], dtype=pl.Utf8)
+
+
+def _columnar_frame(
+    columns: Mapping[str, list | pl.Series], infer_types: bool = True
+) -> pl.DataFrame:
+    """
+    Build the DataFrame of expanded columns written to a Parquet or Arrow IPC file. Scalar values
+    are kept as the strings csv.DictWriter would write, with values read as missing from the CSV
+    file as nulls, and the columns get the types they would be read with from the CSV file.
+
+    :param columns: The values of each column, in order. A Series holds the strings written to the
+      CSV file, and a list holds the values from the JSON data.
+    :param infer_types: Whether to give the columns their types, or keep scalar values as strings.
+    """
+    series = []
+    for name, values in columns.items():
+        if isinstance(values, pl.Series):
+            column = pl.col(name)
+            series.append(
+                values.alias(name)
+                .to_frame()
+                .select(pl.when(~column.is_in(CSV_NULL_VALUES)).then(column))
+                .to_series()
+            )
+            continue
+        values = [
+            (
+                value
+                if _is_nested(value)
+                else (None if _csv_string(value) in CSV_NULL_VALUES else str(value))
+            )
+            for value in values
+        ]
+        series.append(_column_series(name, values))
+    df = pl.DataFrame(series)
+    return infer_csv_types(df) if infer_types else df
+
+
+def _write_columnar(output_file: Path, columns: Mapping[str, list | pl.Series]):
+    """
+    Write expanded columns to a Parquet or Arrow IPC file, as built by _columnar_frame().
+    """
+    write_frame(_columnar_frame(columns), output_file)
+
+
+def _json_text_expr(column: pl.Expr) -> pl.Expr:
+    """
+    Apply remove_code_fences() and extract_json_content() to a column of JSON text.
+    """
+    text = column.str.strip_chars()
+    text = (
+        pl.when(text.str.starts_with("```"))
+        .then(text.str.replace(r"^[^\n]*\n", ""))
+        .otherwise(text)
+    )
+    text = (
+        pl.when(text.str.ends_with("```"))
+        .then(text.str.replace(r"\n[^\n]*$", ""))
+        .otherwise(text)
+        .str.strip_chars()
+    )
+    return text.str.replace(r"^[^\[{]*", "")
+
+
+def _field_tokens(
+    objects: pl.Series, key: str, matched: dict[str, pl.Series]
+) -> pl.Series:
+    """
+    Return the JSON text of one key of each object, with strings unquoted and nulls for missing
+    keys. Matching a key reads the whole column, so the tokens are kept for the next lookup.
+
+    :param objects: The JSON text of the objects.
+    :param key: The key.
+    :param matched: The tokens already matched, by key. Updated in place.
+    """
+    if key not in matched:
+        matched[key] = objects.str.json_path_match(f"$.{key}")
+    return matched[key]
+
+
+def _decode_field(
+    objects: pl.Series,
+    decoded: pl.Series,
+    key: str,
+    parsed: dict[int, dict],
+    matched: dict[str, pl.Series],
+) -> tuple[pl.Series, list | None]:
+    """
+    Return the values of one key of the decoded JSON objects.
+
+    :param objects: The JSON text of the objects.
+    :param decoded: The objects decoded into a struct column.
+    :param key: The key.
+    :param parsed: Objects already parsed with json.loads, by index. Updated in place.
+    :param matched: The tokens of the keys already matched, by key. Updated in place.
+    :return: A Series of the strings csv.DictWriter would write, and for keys holding floats, lists
+      or objects, a list of the values from the JSON data. Missing values are empty strings.
+    """
+    field = decoded.struct.field(key)
+    column = pl.col(key)
+    if field.dtype == pl.Null:
+        return pl.Series(key, [""] * len(objects), dtype=pl.Utf8), None
+    if field.dtype == pl.Utf8:
+        # Booleans and numbers are decoded as strings when other objects hold a string for the key,
+        # so the objects with a value that looks like one are parsed again.
+        values = field.fill_null("").to_list()
+        ambiguous = field.str.contains(_AMBIGUOUS_STRING).fill_null(False)
+        for index in ambiguous.arg_true().to_list():
+            if index not in parsed:
+                parsed[index] = json.loads(objects[index])
+            values[index] = _csv_string(parsed[index].get(key))
+        return pl.Series(key, values, dtype=pl.Utf8), None
+    if field.dtype == pl.Boolean:
+        strings = (
+            field.to_frame()
+            .select(
+                pl.when(column)
+                .then(pl.lit("True"))
+                .when(column.not_())
+                .then(pl.lit("False"))
+            )
+            .to_series()
+        )
+        return strings.fill_null(""), None
+    tokens = _field_tokens(objects, key, matched)
+    if field.dtype.is_integer():
+        # Booleans are decoded as 1 and 0 when other objects hold an integer for the key.
+        strings = (
+            pl.DataFrame({"token": tokens, key: field})
+            .select(
+                pl.when(pl.col("token") == "true")
+                .then(pl.lit("True"))
+                .when(pl.col("token") == "false")
+                .then(pl.lit("False"))
+                .otherwise(column.cast(pl.Utf8))
+            )
+            .to_series()
+        )
+        return strings.fill_null(""), None
+    # Floats, lists and objects are parsed in Python, once for each distinct value.
+    token_values = {
+        token: json.loads(token) for token in tokens.drop_nulls().unique().to_list()
+    }
+    strings = tokens.replace_strict(
+        {token: _csv_string(value) for token, value in token_values.items()},
+        default="",
+        return_dtype=pl.Utf8,
+    )
+    return strings, [token_values.get(token, "") for token in tokens.to_list()]
+
+
+def _field_json_types(
+    objects: pl.Series,
+    decoded: pl.Series,
+    key: str,
+    parsed: dict[int, dict],
+    matched: dict[str, pl.Series],
+) -> pl.Series:
+    """
+    Return the JSON type of one key of each decoded JSON object, as returned by json_type().
+
+    :param objects: The JSON text of the objects.
+    :param decoded: The objects decoded into a struct column.
+    :param key: The key.
+    :param parsed: Objects already parsed with json.loads, by index. Updated in place.
+    :param matched: The tokens of the keys already matched, by key. Updated in place.
+    """
+    field = decoded.struct.field(key)
+    if field.dtype == pl.Null:
+        return pl.Series(key, ["null"] * len(objects), dtype=pl.Utf8)
+    if field.dtype in (pl.Boolean, pl.Utf8):
+        name = "boolean" if field.dtype == pl.Boolean else "string"
+        types = (
+            field.is_null()
+            .to_frame()
+            .select(pl.when(pl.col(key)).then(pl.lit("null")).otherwise(pl.lit(name)))
+            .to_series()
+        )
+        if field.dtype == pl.Boolean:
+            return types
+        # Booleans and numbers are decoded as strings when other objects hold a string for the key.
+        ambiguous = field.str.contains(_AMBIGUOUS_STRING).fill_null(False).arg_true()
+        for index in ambiguous.to_list():
+            if index not in parsed:
+                parsed[index] = json.loads(objects[index])
+        fixed = [json_type(parsed[index].get(key)) for index in ambiguous.to_list()]
+        return types.scatter(ambiguous, pl.Series(fixed, dtype=pl.Utf8))
+    tokens = _field_tokens(objects, key, matched)
+    if field.dtype.is_numeric():
+        return (
+            pl.DataFrame({"token": tokens})
+            .select(
+                pl.when(pl.col("token").is_null())
+                .then(pl.lit("null"))
+                .when(pl.col("token").is_in(["true", "false"]))
+                .then(pl.lit("boolean"))
+                .otherwise(pl.lit("number"))
+            )
+            .to_series()
+        )
+    token_types = {}
+    for token in tokens.drop_nulls().unique().to_list():
+        try:
+            token_types[token] = json_type(json.loads(token))
+        except json.JSONDecodeError:
+            # Strings are matched without their quotes.
+            token_types[token] = "string"
+    return tokens.replace_strict(token_types, default="null", return_dtype=pl.Utf8)
+
+
+def _validate_decoded(
+    objects: pl.Series,
+    decoded: pl.Series,
+    rows: list[int],
+    parsed: dict[int, dict],
+    matched: dict[str, pl.Series],
+    report: dict,
+    python_objects: Sequence[int] = (),
+):
+    """
+    Check the decoded JSON objects against the crawl schema, and add the problems to a report.
+
+    :param objects: The JSON text of the objects.
+    :param decoded: The objects decoded into a struct column.
+    :param rows: The row of each object.
+    :param parsed: Objects already parsed with json.loads, by index. Updated in place.
+    :param matched: The tokens of the keys already matched, by key. Updated in place.
+    :param report: The decode report.
+    :param python_objects: The indexes of the objects parsed in Python, whose JSON types are taken
+      from parsed.
+    """
+    schema = CRAWL_SCHEMA
+    keys = decoded.struct.fields
+    for key in keys + [key for key in schema if key not in keys]:
+        if key in keys:
+            types = _field_json_types(objects, decoded, key, parsed, matched)
+        else:
+            types = pl.Series(key, ["null"] * len(objects), dtype=pl.Utf8)
+        if python_objects:
+            fixed = [json_type(parsed[index].get(key)) for index in python_objects]
+            types = types.scatter(python_objects, pl.Series(fixed, dtype=pl.Utf8))
+        spec = schema.get(key)
+        if spec is None:
+            add_issue(report, "unexpected_field", key, _rows(rows, types != "null"))
+            continue
+        if spec["required"]:
+            add_issue(report, "missing_field", key, _rows(rows, types == "null"))
+        wrong = (types != "null") & ~types.is_in(spec["types"])
+        if wrong.any():
+            index = wrong.arg_true()[0]
+            token = _field_tokens(objects, key, matched)[index]
+            example = f"{types[index]}: {token}"[:200]
+            add_issue(report, "wrong_type", key, _rows(rows, wrong), example)
+
+
+def _python_objects(objects: pl.Series, keys: list[str]) -> list[int]:
+    """
+    Find the objects Polars may decode differently from json.loads, which are parsed in Python:
+    objects with integers beyond the Int64 range, which Polars decodes as nulls, and objects with
+    a duplicate key, where Polars keeps the first value and json.loads the last.
+
+    Keys are counted in the whole text, so an object whose nested objects reuse a key is parsed in
+    Python too, which gives the same values.
+
+    :param objects: The JSON text of the objects.
+    :param keys: The keys of the decoded objects.
+    :return: The indexes of the objects.
+    """
+    frame = objects.to_frame("text")
+    text = pl.col("text")
+    mask = text.str.contains(_LONG_INTEGER)
+    for key in keys:
+        mask |= text.str.count_matches(f'"{re.escape(key)}"\\s*:') > 1
+    return frame.select(mask).to_series().arg_true().to_list()
+
+
+def _rows(rows: list[int], mask: pl.Series) -> list[int]:
+    """
+    Return the rows where a mask is true.
+    """
+    return [rows[index] for index in mask.arg_true().to_list()]
+
+
+def _new_columns(
+    keys: Iterable[str], existing_columns: list[str], columns: list[str] | None = None
+) -> list[str]:
+    """
+    Return the sorted cleaned names of the JSON keys that become new columns.
+
+    :param keys: The keys of the JSON objects.
+    :param existing_columns: The cleaned names of the other columns, which JSON keys do not replace.
+    :param columns: The new columns wanted, or None for every key.
+    """
+    return sorted(
+        {
+            clean_header(k)
+            for k in keys
+            if clean_header(k) not in existing_columns
+            and (columns is None or clean_header(k) in columns)
+        }
+    )
+
+
+def _set_python_values(
+    key: str,
+    strings: dict[str, pl.Series],
+    values: dict[str, list],
+    objects: list[dict],
+    rows: list[int],
+):
+    """
+    Replace the values Polars decoded for one key with the values of objects parsed in Python.
+
+    :param key: The key.
+    :param strings: The strings of each new column. Updated in place.
+    :param values: The values of the new columns holding floats, lists or objects. Updated in place.
+    :param objects: The objects parsed with json.loads.
+    :param rows: The row of each object.
+    """
+    object_values = [js.get(key, "") for js in objects]
+    strings[key] = strings[key].scatter(
+        rows, pl.Series([_csv_string(value) for value in object_values], dtype=pl.Utf8)
+    )
+    if key not in values and any(_is_nested(value) for value in object_values):
+        # The other rows only hold scalars, which are written as their strings.
+        values[key] = strings[key].to_list()
+    if key in values:
+        for row, value in zip(rows, object_values):
+            values[key][row] = value
+
+
+def _expand_json_column(
+    raw: pl.Series,
+    existing_columns: list[str],
+    report: dict | None = None,
+    row_offset: int = 0,
+    columns: list[str] | None = None,
+) -> tuple[list[str], dict[str, pl.Series], dict[str, list]] | None:
+    """
+    Decode a column of JSON objects with Polars.
+
+    :param raw: The JSON column, with empty strings for missing values.
+    :param existing_columns: The cleaned names of the other columns, which JSON keys do not replace.
+    :param report: A decode report, for the typed decoder. Cells that are not valid JSON objects are
+      then added to the report and left empty instead of being printed, so they do not stop the
+      column from being decoded as a whole, and the objects are checked against the crawl schema.
+    :param row_offset: The number of rows before raw, for the rows in the report.
+    :param columns: The new columns to decode, or None to decode every key. The objects are still
+      checked against the whole schema.
+    :return: The sorted new column names, the strings csv.DictWriter would write for each of them,
+      and for the columns holding floats, lists or objects, the values from the JSON data. Each
+      column has a value for every row. None if the column cannot be decoded as a whole.
+    """
+    texts = raw.to_frame("raw").select(_json_text_expr(pl.col("raw"))).to_series()
+    is_object = texts.str.starts_with("{")
+    chunk_report = new_decode_report()
+    decoded = None
+    if report is None:
+        # Cells without a JSON object add no columns, but invalid JSON in them is still reported.
+        for value in raw.filter(~is_object & (raw != "")):
+            extract_json(value)
+    else:
+        # The objects are only validated one by one when the column cannot be decoded as a whole,
+        # which parses every object again.
+        try:
+            decoded = texts.filter(is_object).str.json_decode(infer_schema_length=None)
+        except pl.exceptions.PolarsError:
+            is_object &= texts.str.json_path_match("$").is_not_null()
+        has_text = raw != ""
+        chunk_report["rows"] = has_text.sum()
+        invalid = (~is_object & has_text).arg_true().to_list()
+        example = raw[invalid[0]][:200] if invalid else ""
+        add_issue(chunk_report, "invalid_json", None, invalid, example)
+    objects = texts.filter(is_object)
+    if objects.is_empty():
+        if report is not None:
+            merge_decode_report(report, chunk_report, row_offset)
+        return [], {}, {}
+    try:
+        if decoded is None:
+            decoded = objects.str.json_decode(infer_schema_length=None)
+    except pl.exceptions.PolarsError:
+        return None
+    if not isinstance(decoded.dtype, pl.Struct):
+        return None
+
+    keys = decoded.struct.fields
+    json_keys = _new_columns(keys, existing_columns, columns)
+    rows = is_object.arg_true()
+    strings: dict[str, pl.Series] = {}
+    values: dict[str, list] = {}
+    parsed: dict[int, dict] = {}
+    matched: dict[str, pl.Series] = {}
+    try:
+        python_objects = _python_objects(objects, keys)
+        for index in python_objects:
+            parsed[index] = json.loads(objects[index])
+        for key in json_keys:
+            strings[key] = pl.Series(key, [""] * len(raw), dtype=pl.Utf8)
+            if key not in keys:
+                continue
+            key_strings, key_values = _decode_field(
+                objects, decoded, key, parsed, matched
+            )
+            strings[key] = strings[key].scatter(rows, key_strings)
+            if key_values is not None:
+                values[key] = [""] * len(raw)
+                for row, value in zip(rows.to_list(), key_values):
+                    values[key][row] = value
+            if python_objects:
+                _set_python_values(
+                    key,
+                    strings,
+                    values,
+                    [parsed[i] for i in python_objects],
+                    rows.gather(python_objects).to_list(),
+                )
+        if report is not None:
+            _validate_decoded(
+                objects,
+                decoded,
+                rows.to_list(),
+                parsed,
+                matched,
+                chunk_report,
+                python_objects,
+            )
+    except (json.JSONDecodeError, pl.exceptions.PolarsError):
+        return None
+    if report is not None:
+        merge_decode_report(report, chunk_report, row_offset)
+    return json_keys, strings, values
+
+
+def _load_object(text: str):
+    """
+    Parse the JSON in a cell like extract_json(), without printing invalid JSON.
+
+    :return: The parsed value, or None if the text is not valid JSON.
+    """
+    try:
+        return json.loads(extract_json_content(remove_code_fences(text)))
+    except json.JSONDecodeError:
+        return None
+
+
+def _expand_json_column_python(
+    raw: pl.Series,
+    existing_columns: list[str],
+    report: dict | None = None,
+    row_offset: int = 0,
+    columns: list[str] | None = None,
+) -> tuple[list[str], dict[str, pl.Series], dict[str, list]]:
+    """
+    Decode a column of JSON objects with json.loads, for columns Polars cannot decode as a whole.
+    Takes the same parameters and returns the same values as _expand_json_column().
+    """
+    if report is None:
+        objects = [extract_json(value) for value in raw.to_list()]
+    else:
+        objects = [_load_object(value) if value else {} for value in raw.to_list()]
+        chunk_report = new_decode_report()
+        chunk_report["rows"] = sum(1 for value in raw if value)
+        problems: dict[tuple[str, str | None], tuple[str, list[int]]] = {}
+        for row, (value, js) in enumerate(zip(raw, objects)):
+            if not value:
+                continue
+            found: list[tuple[str, str | None, str]]
+            if isinstance(js, dict):
+                found = list(validate_object(js, CRAWL_SCHEMA))
+            else:
+                found = [("invalid_json", None, value[:200])]
+            for kind, field, example in found:
+                problems.setdefault((kind, field), (example, []))[1].append(row)
+        for (kind, field), (example, rows) in problems.items():
+            add_issue(chunk_report, kind, field, rows, example)
+        merge_decode_report(report, chunk_report, row_offset)
+    json_keys = _new_columns(
+        {k for js in objects if isinstance(js, dict) for k in js.keys()},
+        existing_columns,
+        columns,
+    )
+    values = {
+        key: [js.get(key, "") if isinstance(js, dict) else "" for js in objects]
+        for key in json_keys
+    }
+    strings = {
+        key: pl.Series(
+            key, [_csv_string(value) for value in values[key]], dtype=pl.Utf8
+        )
+        for key in json_keys
+    }
+    return json_keys, strings, values
+
+
+def _expand_column(
+    raw: pl.Series,
+    existing_columns: list[str],
+    engine: str,
+    report: dict | None = None,
+    row_offset: int = 0,
+    columns: list[str] | None = None,
+) -> tuple[list[str], dict[str, pl.Series], dict[str, list]]:
+    """
+    Decode a column of JSON objects with an engine, with json.loads if Polars cannot decode it as
+    a whole. Takes the parameters of _expand_json_column() and returns the same values.
+    """
+    expanded = None
+    if engine == "polars":
+        expanded = _expand_json_column(
+            raw, existing_columns, report, row_offset, columns
+        )
+    if expanded is None:
+        expanded = _expand_json_column_python(
+            raw, existing_columns, report, row_offset, columns
+        )
+    return expanded
+
+
+def _output_strings(
+    df: pl.DataFrame,
+    headers: dict[str, str],
+    fieldnames: list[str],
+    json_strings: dict[str, pl.Series],
+) -> dict[str, pl.Series]:
+    """
+    Return the strings csv.DictWriter would write for each output column.
+
+    :param df: The filtered rows, as strings.
+    :param headers: The cleaned name of each column of df.
+    :param fieldnames: The output column names.
+    :param json_strings: The strings of the columns added from the JSON data.
+    """
+    # As with the dictionaries of the Python engine, the last column with a cleaned name wins.
+    source_columns = {
+        clean: orig for orig, clean in headers.items() if clean not in json_strings
+    }
+    return {
+        name: (
+            df[source_columns[name]].alias(name)
+            if name in source_columns
+            else json_strings[name]
+        )
+        for name in fieldnames
+    }
+
+
+def _write_csv_strings(strings: dict[str, pl.Series], file, include_header=True):
+    """
+    Write output columns to a CSV file the way csv.DictWriter writes them.
+
+    :param strings: The strings of each column, in order.
+    :param file: The path of the CSV file, or a file open for writing in binary mode.
+    :param include_header: Whether to write the column names.
+    """
+    # csv.DictWriter writes empty strings without quotes, as Polars writes nulls.
+    pl.DataFrame(list(strings.values())).select(
+        pl.when(pl.col(name) != "").then(pl.col(name)).alias(name) for name in strings
+    ).write_csv(
+        file,
+        include_header=include_header,
+        line_terminator="\r\n",
+        quote_style="necessary",
+    )
+
+
+def _expand_frame(
+    df: pl.DataFrame,
+    json_col: str,
+    engine: str,
+    report: dict | None = None,
+    columns: list[str] | None = None,
+    row_offset: int = 0,
+) -> tuple[list[str], list[str], dict[str, pl.Series], dict[str, list]]:
+    """
+    Expand the JSON column of filtered rows read as strings.
+
+    :param report: A decode report, for the typed decoder.
+    :param columns: The output columns wanted, or None for every column.
+    :param row_offset: The number of rows before df, for the rows in the report.
+    :return: The output column names, the new column names, the strings csv.DictWriter would write
+      for each output column, and for the new columns holding floats, lists or objects, the values
+      from the JSON data.
+    """
+    headers = header_map(df.columns)
+    cleaned_headers = list(headers.values())
+    json_col_clean = clean_header(json_col)
+    actual_json_col = _find_json_col(json_col, headers)
+
+    json_keys, json_strings, json_values = _expand_column(
+        df[actual_json_col], cleaned_headers, engine, report, row_offset, columns
+    )
+
+    fieldnames = [
+        h
+        for h in cleaned_headers
+        if h != json_col_clean and (columns is None or h in columns)
+    ] + json_keys
+    strings = _output_strings(df, headers, fieldnames, json_strings)
+    return fieldnames, json_keys, strings, json_values
+
+
+def _expand_polars(
+    filtered_input_file: Path,
+    output_file: Path,
+    json_col: str,
+    report: dict | None = None,
+) -> tuple[int, list[str], list[str]]:
+    """
+    Expand the JSON column of the filtered file with Polars expressions.
+
+    :param report: A decode report, for the typed decoder.
+    :return: The number of rows, the output column names and the new column names.
+    """
+    df = _read_filtered_frame(filtered_input_file)
+    fieldnames, json_keys, strings, json_values = _expand_frame(
+        df, json_col, "polars", report
+    )
+
+    if is_text_file(output_file):
+        _write_csv_strings(strings, output_file)
+    else:
+        _write_columnar(
+            output_file,
+            {name: json_values.get(name, strings[name]) for name in fieldnames},
+        )
+    return df.height, fieldnames, json_keys
+
+
+def _find_json_col(json_col: str, headers: dict[str, str]) -> str:
+    """
+    Find the column holding the JSON data, matching cleaned names without case.
+    """
+    json_col_clean = clean_header(json_col)
+    if json_col_clean.lower() not in [h.lower() for h in headers.values()]:
+        raise ValueError(
+            f"❌ Column '{json_col}' not found in CSV. Available columns: "
+            f"{list(headers.values())}"
+        )
+    # Find the actual column name with correct case (cleaned)
+    return next(
+        (
+            orig
+            for orig, clean in headers.items()
+            if clean.lower() == json_col_clean.lower()
+        ),
+        json_col,
+    )
+
+
+def _expand_python(
+    filtered_input_file: Path, output_file: Path, json_col: str
+) -> tuple[int, list[str], list[str]]:
+    """
+    Expand the JSON column of the filtered file row by row.
+
+    :return: The number of rows, the output column names and the new column names.
+    """
+    rows, original_headers = _read_filtered_rows(filtered_input_file)
+    # Clean headers
+    headers = header_map(original_headers)
+    cleaned_headers = list(headers.values())
+
+    # Clean the json_col name for matching
+    json_col_clean = clean_header(json_col)
+    actual_json_col = _find_json_col(json_col, headers)
+
+    # Collect all keys across all JSON objects
+    json_keys = set()
+    for row in rows:
+        js = extract_json(row.get(actual_json_col, ""))
+        if isinstance(js, dict):
+            for k in js.keys():
+                # Avoid overwriting existing CSV fields
+                if clean_header(k) not in cleaned_headers:
+                    json_keys.add(clean_header(k))
+
+    # === Write Expanded CSV ===
+    fieldnames = [h for h in cleaned_headers if h != json_col_clean] + sorted(json_keys)
+
+    def expand_row(row):
+        js = extract_json(row.get(actual_json_col, ""))
+        expanded = (
+            {clean_header(k): js.get(k, "") for k in json_keys}
+            if isinstance(js, dict)
+            else {}
+        )
+        # Don't modify original row dict directly
+        clean_row = {
+            clean_header(k): row.get(k, "")
+            for k in original_headers
+            if clean_header(k) in fieldnames and clean_header(k) not in json_keys
+        }
+        clean_row.update(expanded)
+        return clean_row
+
+    if is_text_file(output_file):
+        with open(output_file, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for row in rows:
+                expanded_row = expand_row(row)
+                writer.writerow({k: _csv_value(v) for k, v in expanded_row.items()})
+    else:
+        expanded_rows = [expand_row(row) for row in rows]
+        _write_columnar(
+            output_file,
+            {name: [row.get(name) for row in expanded_rows] for name in fieldnames},
+        )
+    return len(rows), fieldnames, sorted(json_keys)
+
+
+def _scan_filtered(filtered_input_file: Path) -> pl.LazyFrame:
+    """
+    Scan the filtered file with every column as strings, without reading it.
+    """
+    if is_text_file(filtered_input_file):
+        return pl.scan_csv(filtered_input_file, infer_schema=False)
+    if filtered_input_file.suffix.lower() == ".parquet":
+        return pl.scan_parquet(filtered_input_file)
+    return pl.scan_ipc(filtered_input_file, memory_map=True)
+
+
+def _iter_filtered_chunks(
+    filtered_input_file: Path, chunk_rows: int, columns: list[str] | None = None
+) -> Iterator[pl.DataFrame]:
+    """
+    Read the filtered file in chunks of about chunk_rows rows, with every column as strings and
+    missing values as empty strings.
+
+    :param filtered_input_file: The filtered file.
+    :param chunk_rows: The number of rows in a chunk.
+    :param columns: The columns to read, or None to read every column.
+    """
+    if is_text_file(filtered_input_file):
+        chunks = iter_csv_chunks(filtered_input_file, chunk_rows, columns)
+    else:
+        lf = _scan_filtered(filtered_input_file)
+        if columns is not None:
+            lf = lf.select(columns)
+        height = lf.select(pl.len()).collect().item()
+        chunks = (
+            lf.slice(offset, chunk_rows).collect()
+            for offset in range(0, height, chunk_rows)
+        )
+    for chunk in chunks:
+        yield chunk.with_columns(pl.all().cast(pl.Utf8).fill_null(""))
+
+
+def _object_keys(raw: pl.Series) -> set[str]:
+    """
+    Return the keys of the JSON objects in a column, without reporting invalid JSON.
+    """
+    texts = raw.to_frame("raw").select(_json_text_expr(pl.col("raw"))).to_series()
+    objects = texts.filter(texts.str.starts_with("{"))
+    if objects.is_empty():
+        return set()
+    try:
+        decoded = objects.str.json_decode(infer_schema_length=None)
+        return set(decoded.struct.fields)
+    except pl.exceptions.PolarsError:
+        pass
+    keys: set[str] = set()
+    for text in objects:
+        try:
+            js = json.loads(text)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(js, dict):
+            keys.update(js.keys())
+    return keys
+
+
+def _expand_streaming(
+    filtered_input_file: Path,
+    output_file: Path,
+    json_col: str,
+    engine: str,
+    json_keys: Iterable[str] | None = None,
+    chunk_rows: int = CHUNK_ROWS,
+    report: dict | None = None,
+) -> tuple[int, list[str], list[str]]:
+    """
+    Expand the JSON column of the filtered file one chunk of rows at a time, so memory use does
+    not grow with the size of the file.
+
+    The new columns are the keys found in a first pass over the JSON column, or the declared
+    json_keys. Each chunk is expanded with the engine and appended to the CSV file. Parquet and
+    Arrow IPC files are converted from a temporary CSV file with the Polars streaming engine, so
+    their lists and objects are kept as JSON strings.
+
+    :param report: A decode report, for the typed decoder.
+    :return: The number of rows, the output column names and the new column names.
+    """
+    original_headers = _scan_filtered(filtered_input_file).collect_schema().names()
+    headers = header_map(original_headers)
+    cleaned_headers = list(headers.values())
+    json_col_clean = clean_header(json_col)
+    actual_json_col = _find_json_col(json_col, headers)
+
+    if json_keys is None:
+        json_keys = set()
+        for chunk in _iter_filtered_chunks(
+            filtered_input_file, chunk_rows, [actual_json_col]
+        ):
+            json_keys |= _object_keys(chunk[actual_json_col])
+    json_keys = sorted(
+        {clean_header(k) for k in json_keys if clean_header(k) not in cleaned_headers}
+    )
+    fieldnames = [h for h in cleaned_headers if h != json_col_clean] + json_keys
+
+    csv_file = output_file
+    if not is_text_file(output_file):
+        csv_file = output_file.with_name(f"{output_file.name}.partial.csv")
+    row_count = 0
+    try:
+        with open(csv_file, "wb") as f:
+            _write_csv_strings(
+                {name: pl.Series(name, [], dtype=pl.Utf8) for name in fieldnames}, f
+            )
+            for chunk in _iter_filtered_chunks(filtered_input_file, chunk_rows):
+                _, chunk_strings, _ = _expand_column(
+                    chunk[actual_json_col], cleaned_headers, engine, report, row_count
+                )
+                json_strings = {
+                    key: chunk_strings.get(
+                        key, pl.Series(key, [""] * chunk.height, dtype=pl.Utf8)
+                    )
+                    for key in json_keys
+                }
+                strings = _output_strings(chunk, headers, fieldnames, json_strings)
+                _write_csv_strings(strings, f, include_header=False)
+                row_count += chunk.height
+        if csv_file != output_file:
+            sink_frame(scan_csv_typed(csv_file), output_file)
+    finally:
+        if csv_file != output_file:
+            csv_file.unlink(missing_ok=True)
+    return row_count, fieldnames, json_keys
+
+
+def _shards(filtered_input_file: Path, count: int) -> list[tuple]:
+    """
+    Split the filtered file into about count shards for _expand_shard(): record-aligned byte
+    ranges of a CSV file, or row ranges of a Parquet or Arrow IPC file.
+    """
+    if is_text_file(filtered_input_file):
+        header, ranges = record_ranges(filtered_input_file, count)
+        return [(header, start, end) for start, end in ranges]
+    height = _scan_filtered(filtered_input_file).select(pl.len()).collect().item()
+    count = max(1, min(count, height // MIN_SHARD_ROWS))
+    size = -(-height // count)
+    return [(offset, size) for offset in range(0, height, size)]
+
+
+def _expand_shard(
+    filtered_input_file: Path, shard: tuple, json_col: str, engine: str, typed: bool
+) -> tuple[pl.DataFrame, list[str], dict[str, pl.Series], dict[str, list], dict | None]:
+    """
+    Read one shard of the filtered file and expand its JSON column, in a worker process.
+
+    :return: The rows of the shard as strings, the new column names, strings and values returned
+      by _expand_json_column() for them, and the decode report of the shard for the typed decoder.
+    """
+    if is_text_file(filtered_input_file):
+        df = read_csv_range(filtered_input_file, *shard, infer_schema=False)
+    else:
+        df = _scan_filtered(filtered_input_file).slice(*shard).collect()
+    df = df.with_columns(pl.all().cast(pl.Utf8).fill_null(""))
+    headers = header_map(df.columns)
+    cleaned_headers = list(headers.values())
+    raw = df[_find_json_col(json_col, headers)]
+    report = new_decode_report() if typed else None
+    return (df, *_expand_column(raw, cleaned_headers, engine, report), report)
+
+
+def _expand_parallel(
+    filtered_input_file: Path,
+    output_file: Path,
+    json_col: str,
+    engine: str,
+    workers: int,
+    report: dict | None = None,
+) -> tuple[int, list[str], list[str]]:
+    """
+    Expand the JSON column of the filtered file in worker processes, one shard of rows at a time,
+    and write the shards in file order.
+
+    :param report: A decode report, for the typed decoder.
+    :return: The number of rows, the output column names and the new column names.
+    """
+    shards = _shards(filtered_input_file, workers * SHARDS_PER_WORKER)
+    if len(shards) <= 1:
+        if engine == "polars":
+            return _expand_polars(filtered_input_file, output_file, json_col, report)
+        return _expand_python(filtered_input_file, output_file, json_col)
+    # Polars' thread pool does not survive a fork, so the workers are spawned.
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(shards)),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        results = list(
+            executor.map(
+                _expand_shard,
+                repeat(filtered_input_file),
+                shards,
+                repeat(json_col),
+                repeat(engine),
+                repeat(report is not None),
+            )
+        )
+
+    df = pl.concat([result[0] for result in results])
+    if report is not None:
+        row_offset = 0
+        for shard, *_, shard_report in results:
+            if shard_report is not None:
+                merge_decode_report(report, shard_report, row_offset)
+            row_offset += shard.height
+    headers = header_map(df.columns)
+    json_col_clean = clean_header(json_col)
+    json_keys = sorted({key for result in results for key in result[1]})
+    fieldnames = [h for h in headers.values() if h != json_col_clean] + json_keys
+
+    json_strings = {}
+    json_values = {}
+    for key in json_keys:
+        json_strings[key] = pl.concat(
+            [
+                strings.get(key, pl.Series(key, [""] * shard.height, dtype=pl.Utf8))
+                for shard, _, strings, _, _ in results
+            ]
+        )
+        # Shards decode a key to values only when its JSON type needs them, so the values are
+        # used only when every shard with the key has them.
+        if all(key in values for _, keys, _, values, _ in results if key in keys):
+            json_values[key] = [
+                value
+                for shard, _, _, values, _ in results
+                for value in values.get(key, [""] * shard.height)
+            ]
+    strings = _output_strings(df, headers, fieldnames, json_strings)
+
+    if is_text_file(output_file):
+        _write_csv_strings(strings, output_file)
+    else:
+        _write_columnar(
+            output_file,
+            {name: json_values.get(name, strings[name]) for name in fieldnames},
+        )
+    return df.height, fieldnames, json_keys
+
+
+def expand_json_frame(
+    df: pl.DataFrame,
+    json_col: str = JSON_COLUMN,
+    engine: str = "polars",
+    report: dict | None = None,
+    columns: list[str] | None = None,
+) -> pl.DataFrame:
+    """
+    Expand the JSON column of filtered crawl rows in memory, without writing any file.
+
+    :param df: The filtered rows, as returned by filter_html_frame().
+    :param json_col: Name of the column containing JSON data to expand.
+    :param engine: One of ENGINES.
+    :param report: A decode report from new_decode_report(), to check the JSON objects against the
+      crawl schema with the typed decoder. Requires the polars engine.
+    :param columns: The output columns wanted, or None for every column. Only the JSON keys of
+      these columns are decoded.
+    :return: The expanded rows, as they are read back from the expanded CSV file: lists and
+      objects are JSON strings, and the other columns get the types read_frame() infers.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if report is not None and engine != "polars":
+        raise ValueError("The typed decoder needs the polars engine")
+    df = df.with_columns(pl.all().cast(pl.Utf8).fill_null(""))
+    fieldnames, json_keys, strings, _ = _expand_frame(
+        df, json_col, engine, report, columns
+    )
+    print(f"✅ Expanded {df.height} rows into {len(fieldnames)} columns")
+    print(
+        f"✅ Added {len(json_keys)} new columns from JSON data: {', '.join(json_keys)}"
+    )
+    # Building list and struct columns from the JSON values takes longer than the rest of the
+    # expansion, so the strings are kept.
+    return _columnar_frame(strings)
+
+
+def iter_expanded_chunks(
+    input_file,
+    json_col: str = JSON_COLUMN,
+    engine: str = "polars",
+    report: dict | None = None,
+    columns: list[str] | None = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[pl.DataFrame]:
+    """
+    Filter and expand a crawl file one chunk of rows at a time, without writing any file, so the
+    first rows can be used while the rest of the file is still being read.
+
+    Takes the parameters of expand_json_frame(), and chunk_rows, the number of rows read at a time.
+    :return: The expanded rows of each chunk with HTML rows, as the strings written to the expanded
+      CSV file, with nulls for missing values. Chunks may lack new columns whose keys they do not
+      hold. Concatenated and passed to infer_csv_types(), they are the rows expand_json_frame()
+      returns.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if report is not None and engine != "polars":
+        raise ValueError("The typed decoder needs the polars engine")
+    read_columns = None
+    if columns is not None:
+        read_columns = [*columns, clean_header(json_col)]
+    row_count = 0
+    for chunk in iter_html_chunks(input_file, chunk_rows, read_columns):
+        chunk = chunk.fill_null("")
+        _, _, strings, _ = _expand_frame(
+            chunk, json_col, engine, report, columns, row_count
+        )
+        row_count += chunk.height
+        yield _columnar_frame(strings, infer_types=False)
+
+
+def expand_json_csv(
+    input_file,
+    output_file,
+    json_col=JSON_COLUMN,
+    intermediate_format="text",
+    engine="polars",
+    streaming=False,
+    json_keys=None,
+    workers=None,
+    decoder="json",
+):
     """
     Expand JSON columns in a CSV file.
 
     Args:
         input_file (str or Path): Path to the input CSV file
-        output_file (str or Path): Path to the output expanded CSV file
+        output_file (str or Path): Path to the output expanded file. It is written as CSV, Parquet
+            or Arrow IPC depending on its suffix.
         json_col (str): Name of the column containing JSON data to expand
+        intermediate_format (str): Format of the filtered copy of the input file, from
+            INTERMEDIATE_FORMATS in utilities/frame_io.py. The copy is written next to the output
+            file, eg. "<input name>.filtered.csv".
+        engine (str): "polars" to expand the JSON column with Polars expressions, or "python" to
+            expand it row by row. Both write the same file.
+        streaming (bool): Filter and expand the file in chunks of CHUNK_ROWS rows, so memory use
+            stays flat whatever the size of the input file. The filtered and expanded files are
+            the same as without streaming, except that the filtered copy keeps every value as it
+            is in the input file, and Parquet and Arrow IPC files keep lists and objects as JSON.
+        json_keys (list of str): The keys of the JSON objects, for streaming mode. They are found
+            in a first pass over the JSON column when they are not given.
+        workers (int): Expand the file in this many worker processes. The filtered file is split
+            into shards of rows, record-aligned byte ranges for a CSV file, which are parsed and
+            expanded in parallel and written in order. Cannot be combined with streaming.
+        decoder (str): "json" to print each cell with invalid JSON, or "typed" to decode the
+            column with the Polars engine and check it against the schema of the Screaming Frog
+            prompt, CRAWL_SCHEMA in utilities/crawl_json_schema.py, in the same pass. Cells that
+            are not valid JSON objects are then left empty without stopping the column from being
+            decoded as a whole, and the problems are collected into a report, which is summarized
+            and written next to the output file as "<name>-decode-report.json". JSON extensions
+            such as NaN are invalid in typed mode.
 
     Returns:
-        Path: Path to the expanded CSV file
+        Path: Path to the expanded file
     """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if decoder not in DECODERS:
+        raise ValueError(f"Unknown decoder {decoder!r}, expected one of {DECODERS}")
+    if decoder == "typed" and engine != "polars":
+        raise ValueError("The typed decoder needs the polars engine")
+    if streaming and workers:
+        raise ValueError("Streaming mode cannot be combined with worker processes")
     input_file = Path(input_file)
     output_file = Path(output_file)
 
     # Create the parent directory if it doesn't exist
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # Filter the input file and overwrite it with only text/html rows before further processing
-    filtered_input_file = input_file.with_name(f"{input_file.name}.filtered.csv")
-    filter_html_rows(str(input_file), str(filtered_input_file))
-
-    # === Read and Parse CSV ===
-    with open(filtered_input_file, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-        # Clean headers
-        original_headers = reader.fieldnames
-        cleaned_headers = [clean_header(h) for h in original_headers]
-        header_map = dict(zip(original_headers, cleaned_headers))
-
-        # Clean the json_col name for matching
-        json_col_clean = clean_header(json_col)
-        lowercase_headers = [h.lower() for h in cleaned_headers]
-
-        if json_col_clean.lower() not in lowercase_headers:
-            raise ValueError(
-                f"❌ Column '{json_col}' not found in CSV. Available columns: {cleaned_headers}"
-            )
+    # Filter the input file into a copy with only text/html rows before further processing. The
+    # copy is written next to the output file rather than the input file, so two sites whose crawl
+    # files have the same name do not overwrite each other's copy.
+    filtered_input_file = intermediate_path(
+        output_file.with_name(f"{input_file.name}.filtered.csv"), intermediate_format
+    )
+    filter_html_rows(str(input_file), str(filtered_input_file), streaming=streaming)
 
-        else:
-            # Find the actual column name with correct case (cleaned)
-            actual_json_col = next(
-                (
-                    orig
-                    for orig, clean in header_map.items()
-                    if clean.lower() == json_col_clean.lower()
-                ),
-                json_col,
-            )
+    report = new_decode_report() if decoder == "typed" else None
+    if streaming:
+        row_count, fieldnames, json_keys = _expand_streaming(
+            filtered_input_file, output_file, json_col, engine, json_keys, report=report
+        )
+    elif workers:
+        row_count, fieldnames, json_keys = _expand_parallel(
+            filtered_input_file, output_file, json_col, engine, workers, report
+        )
+    elif engine == "polars":
+        row_count, fieldnames, json_keys = _expand_polars(
+            filtered_input_file, output_file, json_col, report
+        )
+    else:
+        row_count, fieldnames, json_keys = _expand_python(
+            filtered_input_file, output_file, json_col
+        )
 
-            # Collect all keys across all JSON objects
-            json_keys = set()
-            for row in rows:
-                js = extract_json(row.get(actual_json_col, ""))
-                if isinstance(js, dict):
-                    for k in js.keys():
-                        # Avoid overwriting existing CSV fields
-                        if clean_header(k) not in cleaned_headers:
-                            json_keys.add(clean_header(k))
-
-            # === Write Expanded CSV ===
-            fieldnames = [h for h in cleaned_headers if h != json_col_clean] + sorted(
-                json_keys
-            )
-
-            with open(output_file, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-
-                for row in rows:
-                    js = extract_json(row.get(actual_json_col, ""))
-                    expanded = (
-                        {clean_header(k): js.get(k, "") for k in json_keys}
-                        if isinstance(js, dict)
-                        else {}
-                    )
-                    # Don't modify original row dict directly
-                    clean_row = {
-                        clean_header(k): row.get(k, "")
-                        for k in original_headers
-                        if clean_header(k) in fieldnames
-                        and clean_header(k) not in json_keys
-                    }
-                    clean_row.update(expanded)
-                    writer.writerow(clean_row)
-
-            print(
-                f"✅ Expanded CSV with {len(rows)} rows and {len(fieldnames)} columns written to "
-                f"{output_file}"
-            )
-            print(
-                f"✅ Added {len(json_keys)} new columns from JSON data: {', '.join(sorted(json_keys))}"
-            )
-            return output_file
+    print(
+        f"✅ Expanded file with {row_count} rows and {len(fieldnames)} columns written to "
+        f"{output_file}"
+    )
+    print(
+        f"✅ Added {len(json_keys)} new columns from JSON data: {', '.join(json_keys)}"
+    )
+    if report is not None:
+        print_decode_report(report)
+        write_decode_report(
+            report, output_file.with_name(f"{output_file.stem}-decode-report.json")
+        )
+    return output_file
 
 
 if __name__ == "__main__":
@@ -1,22 +1,31 @@
 import logging
-from io import StringIO
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict
 
 import polars as pl
 
-from ai_crawl_analysis.utilities.json_cleaner import clean_json_file
+from ai_crawl_analysis.utilities.frame_io import is_text_file, read_frame, write_frame
+from ai_crawl_analysis.utilities.json_cleaner import json_response_to_dataframe
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
+# File formats each migration group can be exported to.
+GROUP_FORMATS = ("csv", "json", "parquet")
+# Number of files written at the same time. Polars releases the GIL while writing.
+WRITE_WORKERS = min(8, os.cpu_count() or 1)
 
-def group_migration_paths(analysis_output: str | Path) -> Dict[str, Any]:
+
+def group_migration_paths(analysis_output: str | Path | pl.DataFrame) -> Dict[str, Any]:
     """
     Group migration paths by the 'migration_group' column.
 
     Args:
-        analysis_output (str | Path): Path to cleaned JSON file containing migration path data.
+        analysis_output (str | Path | pl.DataFrame): Path to the JSON file containing migration path
+            data (or a Parquet or Arrow IPC file), or the analysis DataFrame returned by
+            crawl_analysis().
 
     Returns:
         dict: {
@@ -25,15 +34,25 @@ def group_migration_paths(analysis_output: str | Path) -> Dict[str, Any]:
             "groups": Dict[str, Polars DataFrame]
         }
     """
-    cleaned_json = clean_json_file(str(analysis_output))
-    df = pl.read_json(StringIO(cleaned_json))
+    if isinstance(analysis_output, pl.DataFrame):
+        df = analysis_output
+    elif not is_text_file(analysis_output):
+        df = read_frame(analysis_output)
+    else:
+        # Rows written by crawl_analysis are already complete, so no trailing row is dropped.
+        df = json_response_to_dataframe(
+            Path(analysis_output).read_text(encoding="utf-8"), expected_keys=0
+        )
     # Count total URLs
     grouped = df.group_by("migration_group").agg(pl.len().alias("url_count"))
     logging.info("\nMigration Groups Summary:\n%s", grouped)
 
+    # Split the rows into groups in a single pass, keeping the row order within each group.
     groups_dict = {
-        group: df.filter(pl.col("migration_group") == group)
-        for group in df["migration_group"].unique().to_list()
+        key[0]: group
+        for key, group in df.partition_by(
+            "migration_group", maintain_order=True, as_dict=True
+        ).items()
     }
 
     return {"all_data": df, "grouped_summary": grouped, "groups": groups_dict}
@@ -43,14 +62,26 @@ def _sanitize_filename(name: str) -> str:
     return "".join(c if c.isalnum() else "_" for c in name)
 
 
-def export_migration_groups(result: Dict[str, Any], output_dir: str | Path) -> None:
+def export_migration_groups(
+    result: Dict[str, Any],
+    output_dir: str | Path,
+    formats: tuple[str, ...] = ("csv",),
+    max_workers: int = WRITE_WORKERS,
+) -> None:
     """
-    Export migration groups to CSV and JSON files.
+    Export migration groups to CSV, JSON and Parquet files.
+
+    The files are written in parallel on a thread pool.
 
     Args:
         result (dict): Dictionary from group_migration_paths()
         output_dir (str | Path): Directory to save the output files
+        formats (tuple[str, ...]): Formats each group is exported to, from GROUP_FORMATS
+        max_workers (int): Maximum number of files written at the same time
     """
+    unsupported = set(formats) - set(GROUP_FORMATS)
+    if unsupported:
+        raise ValueError(f"Unsupported export formats: {sorted(unsupported)}")
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     # Empty the output directory if it exists
@@ -61,28 +92,41 @@ def export_migration_groups(result: Dict[str, Any], output_dir: str | Path) -> N
         except Exception as e:
             logging.warning(f"Could not delete {file}: {e}")
 
-    # Save grouped summary
-    summary_path = output_dir / "summary.csv"
-    result["grouped_summary"].write_csv(summary_path)
-    logging.info(f"Summary saved to {summary_path}")
-
-    # Save complete dataset
-    json_path = output_dir / "all_data.json"
-    result["all_data"].write_json(json_path)
-    logging.info(f"Complete dataset saved to {json_path}")
-
-    # Export all data sorted by group
-    all_sorted = result["all_data"].sort("migration_group")
-    sorted_csv_path = output_dir / "all_data_by_group.csv"
-    all_sorted.write_csv(sorted_csv_path)
-    logging.info(f"All data sorted by migration group saved to {sorted_csv_path}")
-
-    # Export each group
-    for group_name, df_group in result["groups"].items():
-        safe_name = _sanitize_filename(group_name)
-        file_path = output_dir / f"{safe_name}.csv"
-        df_group.write_csv(file_path)
-        logging.info(f"Group '{group_name}' saved to {file_path}")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Save grouped summary
+        summary_path = output_dir / "summary.csv"
+        summary = executor.submit(write_frame, result["grouped_summary"], summary_path)
+
+        # Save complete dataset
+        json_path = output_dir / "all_data.json"
+        all_data = executor.submit(write_frame, result["all_data"], json_path)
+
+        # Export all data sorted by group
+        sorted_csv_path = output_dir / "all_data_by_group.csv"
+        all_sorted = executor.submit(
+            lambda: write_frame(
+                result["all_data"].sort("migration_group"), sorted_csv_path
+            )
+        )
+
+        # Export each group
+        group_files = {
+            executor.submit(
+                write_frame,
+                df_group,
+                output_dir / f"{_sanitize_filename(str(group_name))}.{file_format}",
+            ): group_name
+            for group_name, df_group in result["groups"].items()
+            for file_format in formats
+        }
+
+        logging.info(f"Summary saved to {summary.result()}")
+        logging.info(f"Complete dataset saved to {all_data.result()}")
+        logging.info(
+            f"All data sorted by migration group saved to {all_sorted.result()}"
+        )
+        for future, group_name in group_files.items():
+            logging.info(f"Group '{group_name}' saved to {future.result()}")
 
 
 if __name__ == "__main__":
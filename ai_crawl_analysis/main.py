@@ -7,6 +7,14 @@ This script coordinates the execution of the entire data processing pipeline:
 3. Analyze crawl data and extract descriptive columns: crawl_analysis.py
 4. Group data by migration paths: grouped_migration_paths.py
 
+Steps whose input files, parameters and outputs have not changed since the last run are skipped
+automatically. Use --force to run every step.
+
+With --fused, the crawl file is parsed once and the steps pass the rows to each other in memory.
+Only the migration group exports are written, and the intermediate files listed with
+--keep-artifacts. With --overlap, the fused pipeline also sends the rows to the AI model in batches
+while the rest of the crawl file is still being read and expanded.
+
 Usage:
     python -m ai_crawl_analysis.main input_file
 
@@ -17,17 +25,53 @@ Example:
 import argparse
 import logging
 import sys
+import time
 from pathlib import Path
 
-from ai_crawl_analysis.crawl_analysis import crawl_analysis
+from ai_crawl_analysis.crawl_analysis import (
+    DEFAULT_CONCURRENCY,
+    SIDEBAR_MODES,
+    classify_expanding_crawl,
+    crawl_analysis,
+)
 
 # Import processing modules
-from ai_crawl_analysis.expand_json_csv import expand_json_csv
+from ai_crawl_analysis.expand_json_csv import (
+    DECODERS,
+    JSON_COLUMN,
+    expand_json_csv,
+    expand_json_frame,
+    iter_expanded_chunks,
+)
 from ai_crawl_analysis.grouped_migration_paths import (
+    GROUP_FORMATS,
     export_migration_groups,
     group_migration_paths,
 )
+from ai_crawl_analysis.utilities.batching import (
+    DEFAULT_MAX_INPUT_TOKENS,
+    DEFAULT_MAX_OUTPUT_TOKENS,
+)
+from ai_crawl_analysis.utilities.crawl_json_schema import (
+    new_decode_report,
+    print_decode_report,
+    write_decode_report,
+)
 from ai_crawl_analysis.utilities.create_output_dirs import create_output_dirs
+from ai_crawl_analysis.utilities.filter_html_rows import filter_html_frame
+from ai_crawl_analysis.utilities.frame_io import (
+    INTERMEDIATE_FORMATS,
+    intermediate_path,
+    write_frame,
+)
+from ai_crawl_analysis.utilities.header_cleaner import clean_header
+from ai_crawl_analysis.utilities.payload_encoder import (
+    DEFAULT_MAX_STRUCTURE_CHARS,
+    PAYLOAD_FORMATS,
+)
+from ai_crawl_analysis.utilities.response_cache import get_response_cache
+from ai_crawl_analysis.utilities.result_store import RESULT_STORE_FILE
+from ai_crawl_analysis.utilities.run_manifest import RunManifest
 
 # Setup logging
 logging.basicConfig(
@@ -37,18 +81,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# File in the output directory that records the inputs and outputs of each step.
+RUN_MANIFEST_FILE = "run-manifest.json"
+PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
+# Columns of the expanded crawl sent to the AI model.
+COLUMNS_TO_EXTRACT = [
+    "address",
+    "page_description",
+    "page_structure",
+    "sidebar",
+    "sidebar_has_menu",
+]
+# Intermediate files the fused pipeline writes only when asked to.
+FUSED_ARTIFACTS = ("filtered", "expanded", "extracted", "analysis")
+# Rows read and expanded at a time with --overlap. Smaller chunks start the first AI batches sooner.
+OVERLAP_CHUNK_ROWS = 10_000
 
-def main():
+
+def add_pipeline_arguments(parser: argparse.ArgumentParser):
     """
-    Orchestrates the execution of the AI migrations processing pipeline.
+    Add the options of the processing pipeline to a command-line parser.
+
+    :param parser: The parser to add the options to.
     """
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(
-        description="Process crawled site data for AI-assisted migration."
-    )
-    parser.add_argument(
-        "input_file", help="Path to the input CSV file with crawled data"
-    )
     parser.add_argument(
         "--skip-steps",
         type=int,
@@ -56,11 +111,155 @@ def main():
         help="Skip the first N processing steps. There are 3 steps in total. --skip-steps=2 will "
         "skip the first two steps and only run the third step.",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every step even when its inputs have not changed since the last run.",
+    )
     parser.add_argument(
         "--output-dir",
         default="data",
         help="Base output directory for all generated files",
     )
+    parser.add_argument(
+        "--max-input-tokens",
+        type=int,
+        default=DEFAULT_MAX_INPUT_TOKENS,
+        help="Maximum estimated input tokens for each batch of rows sent to the AI model.",
+    )
+    parser.add_argument(
+        "--max-output-tokens",
+        type=int,
+        default=DEFAULT_MAX_OUTPUT_TOKENS,
+        help="Maximum estimated output tokens for each batch of rows sent to the AI model.",
+    )
+    parser.add_argument(
+        "--payload-format",
+        choices=PAYLOAD_FORMATS,
+        default="json",
+        help="compact sends each batch to the AI model as a table with one header row, addresses "
+        "relative to the site's origin and short row ids, and asks for only the id and result of "
+        "each row, so more rows fit in each request.",
+    )
+    parser.add_argument(
+        "--max-structure-chars",
+        type=int,
+        default=DEFAULT_MAX_STRUCTURE_CHARS,
+        help="Maximum characters of each page structure sent with --payload-format compact.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Maximum number of AI requests kept in flight at once.",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream AI responses and write each row to disk as soon as it arrives.",
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        action="store_true",
+        help="Only send one page of each group of near-duplicate pages to the AI model and give "
+        "its migration group to the rest of the group.",
+    )
+    parser.add_argument(
+        "--url-templates",
+        action="store_true",
+        help="Only send a few URLs of each path template (eg. /grants/{id}) to the AI model and "
+        "give their migration group to the rest of the template.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse the stored results of URLs that have not changed since the last run and only "
+        "analyze new or changed URLs.",
+    )
+    parser.add_argument(
+        "--sidebar-mode",
+        choices=SIDEBAR_MODES,
+        default="ai",
+        help="Streamline sidebar descriptions with a second AI call (ai) or by clustering similar "
+        "sidebars locally without calling the model (local).",
+    )
+    parser.add_argument(
+        "--intermediate-format",
+        choices=INTERMEDIATE_FORMATS,
+        default="text",
+        help="Format of the files passed between steps: CSV and JSON (text), compressed Parquet "
+        "(parquet) or memory-mapped Arrow IPC (ipc). The migration group exports are not affected.",
+    )
+    parser.add_argument(
+        "--group-formats",
+        nargs="+",
+        choices=GROUP_FORMATS,
+        default=["csv"],
+        help="File formats each migration group is exported to.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Filter and expand the crawl file in chunks, so memory use stays flat for "
+        "multi-gigabyte crawl exports.",
+    )
+    parser.add_argument(
+        "--json-keys",
+        nargs="+",
+        help="Keys of the crawl's JSON objects, for --streaming. Found in a first pass over the "
+        "JSON column when not given.",
+    )
+    parser.add_argument(
+        "--expand-workers",
+        type=int,
+        help="Expand the crawl's JSON column in this many worker processes.",
+    )
+    parser.add_argument(
+        "--json-decoder",
+        choices=DECODERS,
+        default="json",
+        help="typed checks the crawl's JSON column against the schema of the Screaming Frog "
+        "prompt, and writes the problems found to a decode report next to the expanded CSV.",
+    )
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Parse the crawl file once and pass the rows from step to step in memory, writing "
+        "only the migration group exports. Steps are not skipped one by one.",
+    )
+    parser.add_argument(
+        "--overlap",
+        action="store_true",
+        help="Implies --fused, and sends AI batches while the crawl is still being read and "
+        "expanded. Cannot be combined with --near-duplicates, --url-templates, --incremental or "
+        "keeping the filtered or expanded rows.",
+    )
+    parser.add_argument(
+        "--keep-artifacts",
+        nargs="+",
+        choices=FUSED_ARTIFACTS,
+        default=[],
+        help="Intermediate files to write anyway with --fused, in --intermediate-format.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Call the AI model even when a cached response exists for the same request.",
+    )
+
+
+def main():
+    """
+    Orchestrates the execution of the AI migrations processing pipeline.
+    """
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(
+        description="Process crawled site data for AI-assisted migration."
+    )
+    parser.add_argument(
+        "input_file", help="Path to the input CSV file with crawled data"
+    )
+    add_pipeline_arguments(parser)
     args = parser.parse_args()
 
     # Resolve input file path
@@ -69,62 +268,159 @@ def main():
         logger.error(f"Input file not found: {input_file}")
         sys.exit(1)
 
+    run_pipeline(input_file, args)
+
+
+def run_pipeline(
+    input_file: Path, args: argparse.Namespace, namespace: str | None = None
+):
+    """
+    Run the processing pipeline on one crawl file.
+
+    :param input_file: Path to the input CSV file with crawled data.
+    :param args: The pipeline options, as parsed by a parser set up with add_pipeline_arguments().
+    :param namespace: Optional subdirectory of the output directory for this crawl's files, so
+      several crawls can be processed at the same time.
+    """
+    if args.fused or args.overlap:
+        run_fused_pipeline(input_file, args, namespace)
+        return
+    if args.no_cache:
+        get_response_cache().enabled = False
+
     # Create output directories if they don't exist
-    audit_outputs_dir, crawl_analysis_dir, migration_groups_dir = create_output_dirs()
+    audit_outputs_dir, crawl_analysis_dir, migration_groups_dir = create_output_dirs(
+        args.output_dir, namespace
+    )
 
     # Get the base name of the input file for naming outputs
     input_name = input_file.stem
 
+    # Steps whose inputs, parameters and outputs have not changed since the last run are skipped.
+    manifest = RunManifest(audit_outputs_dir.parent / RUN_MANIFEST_FILE)
+
+    def is_up_to_date(step, inputs, params, outputs=None):
+        return not args.force and manifest.is_up_to_date(step, inputs, params, outputs)
+
     # STEP 1: Expand JSON columns in the CSV file
-    if args.skip_steps < 1:
+    intermediate_format = args.intermediate_format
+    expanded_csv = intermediate_path(
+        audit_outputs_dir / f"{input_name}-expanded.csv", intermediate_format
+    )
+    expand_inputs = [input_file]
+    expand_params = {
+        "intermediate_format": intermediate_format,
+        "streaming": args.streaming,
+        "json_keys": sorted(args.json_keys) if args.json_keys else None,
+        "json_decoder": args.json_decoder,
+    }
+    if args.skip_steps < 1 and not is_up_to_date(
+        "expand", expand_inputs, expand_params, [expanded_csv]
+    ):
         logger.info("Step 1: Expanding JSON columns in CSV")
-        expanded_csv = audit_outputs_dir / f"{input_name}-expanded.csv"
         try:
-            expand_json_csv(input_file, expanded_csv)
+            expand_json_csv(
+                input_file,
+                expanded_csv,
+                intermediate_format=intermediate_format,
+                streaming=args.streaming,
+                json_keys=args.json_keys,
+                workers=args.expand_workers,
+                decoder=args.json_decoder,
+            )
             logger.info(f"Expanded CSV saved to: {expanded_csv}")
         except Exception as e:
             logger.error(f"Error during Step 1 (expand_json_csv): {e}")
             sys.exit(1)
+        manifest.record("expand", expand_inputs, expand_params, [expanded_csv])
+        # The later steps must run again on the new expanded CSV.
+        manifest.invalidate("analyze")
+        manifest.invalidate("group")
     else:
-        expanded_csv = audit_outputs_dir / f"{input_name}-expanded.csv"
         if not expanded_csv.exists():
             logger.error(f"Expanded CSV not found: {expanded_csv}")
             sys.exit(1)
         logger.info(f"Skipped step 1, using existing file: {expanded_csv}")
 
     # STEP 2: Analyze crawl data and extract descriptive columns
-    if args.skip_steps < 2:
+    crawl_analysis_output = intermediate_path(
+        crawl_analysis_dir / "final-analysis-output.json", intermediate_format
+    )
+    extracted_columns_file = intermediate_path(
+        audit_outputs_dir / "extracted_columns.json", intermediate_format
+    )
+    columns_to_extract = COLUMNS_TO_EXTRACT
+    # The prompts are inputs too, so editing a prompt reruns the analysis.
+    analyze_inputs = [expanded_csv, *sorted(PROMPTS_DIR.glob("*"))]
+    analyze_params = {
+        "columns": columns_to_extract,
+        "max_input_tokens": args.max_input_tokens,
+        "max_output_tokens": args.max_output_tokens,
+        "near_duplicates": args.near_duplicates,
+        "url_templates": args.url_templates,
+        "incremental": args.incremental,
+        "sidebar_mode": args.sidebar_mode,
+        "payload_format": args.payload_format,
+        "max_structure_chars": args.max_structure_chars,
+        "intermediate_format": intermediate_format,
+    }
+    analyze_outputs = [
+        extracted_columns_file,
+        intermediate_path(
+            crawl_analysis_dir / "migration_groups.json", intermediate_format
+        ),
+        crawl_analysis_output,
+    ]
+    if args.skip_steps < 2 and not is_up_to_date(
+        "analyze", analyze_inputs, analyze_params, analyze_outputs
+    ):
         logger.info("Step 2: Analyzing crawl data")
-        extracted_columns_file = audit_outputs_dir / "extracted_columns.json"
-        columns_to_extract = [
-            "address",
-            "page_description",
-            "page_structure",
-            "sidebar",
-            "sidebar_has_menu",
-        ]
-
-        crawl_analysis(
-            str(expanded_csv), str(extracted_columns_file), columns_to_extract
+        analysis_result = crawl_analysis(
+            str(expanded_csv),
+            str(extracted_columns_file),
+            columns_to_extract,
+            max_input_tokens=args.max_input_tokens,
+            max_output_tokens=args.max_output_tokens,
+            concurrency=args.concurrency,
+            stream=args.stream,
+            near_duplicates=args.near_duplicates,
+            url_templates=args.url_templates,
+            incremental=args.incremental,
+            result_store=audit_outputs_dir.parent / RESULT_STORE_FILE,
+            sidebar_mode=args.sidebar_mode,
+            output_dir=crawl_analysis_dir,
+            intermediate_format=intermediate_format,
+            payload_format=args.payload_format,
+            max_structure_chars=args.max_structure_chars,
         )
-        crawl_analysis_output = crawl_analysis_dir / "final-analysis-output.json"
+        manifest.record("analyze", analyze_inputs, analyze_params, analyze_outputs)
+        manifest.invalidate("group")
         logger.info(
             f"Crawl analysis completed, migration groups saved to: {crawl_analysis_output}"
         )
     else:
-        crawl_analysis_output = crawl_analysis_dir / "final-analysis-output.json"
         if not crawl_analysis_output.exists():
             logger.error(
                 f"Crawl analysis output file not found: {crawl_analysis_output}"
             )
             sys.exit(1)
         logger.info(f"Skipped step 2, using existing file: {crawl_analysis_output}")
+        analysis_result = crawl_analysis_output
 
     # STEP 3: Group data by migration paths
-    if args.skip_steps < 3:
+    group_inputs = [crawl_analysis_output]
+    group_formats = tuple(sorted(set(args.group_formats)))
+    group_params = {"formats": group_formats}
+    if args.skip_steps < 3 and not is_up_to_date("group", group_inputs, group_params):
         logger.info("Step 3: Grouping data by migration paths")
-        result = group_migration_paths(crawl_analysis_output)
-        export_migration_groups(result, migration_groups_dir)
+        result = group_migration_paths(analysis_result)
+        export_migration_groups(result, migration_groups_dir, formats=group_formats)
+        manifest.record(
+            "group",
+            group_inputs,
+            group_params,
+            sorted(migration_groups_dir.glob("*")),
+        )
         logger.info(f"Migration paths grouped and exported to: {migration_groups_dir}")
     else:
         logger.info(f"Skipped step 3, using existing files in: {migration_groups_dir}")
@@ -132,5 +428,169 @@ def main():
     logger.info("Processing pipeline completed successfully.")
 
 
+def run_fused_pipeline(
+    input_file: Path, args: argparse.Namespace, namespace: str | None = None
+):
+    """
+    Run the processing pipeline on one crawl file in memory. The crawl file is parsed once, and the
+    filtered and expanded rows and the analysis are passed from step to step as DataFrames, so
+    only the migration group exports and the files in args.keep_artifacts are written.
+
+    The run is skipped when the crawl file, the prompts and the options have not changed since the
+    last fused run and the files it wrote are unchanged. Takes the parameters of run_pipeline().
+    """
+    if args.streaming or args.expand_workers or args.skip_steps:
+        logger.error(
+            "--fused cannot be combined with --streaming, --expand-workers or --skip-steps"
+        )
+        sys.exit(1)
+    if args.overlap and (
+        args.near_duplicates
+        or args.url_templates
+        or args.incremental
+        or {"filtered", "expanded"} & set(args.keep_artifacts)
+    ):
+        logger.error(
+            "--overlap cannot be combined with --near-duplicates, --url-templates, "
+            "--incremental or keeping the filtered or expanded rows"
+        )
+        sys.exit(1)
+    if args.no_cache:
+        get_response_cache().enabled = False
+
+    audit_outputs_dir, crawl_analysis_dir, migration_groups_dir = create_output_dirs(
+        args.output_dir, namespace
+    )
+    input_name = input_file.stem
+    manifest = RunManifest(audit_outputs_dir.parent / RUN_MANIFEST_FILE)
+    intermediate_format = args.intermediate_format
+    keep = set(args.keep_artifacts)
+    group_formats = tuple(sorted(set(args.group_formats)))
+
+    inputs = [input_file, *sorted(PROMPTS_DIR.glob("*"))]
+    params = {
+        "columns": COLUMNS_TO_EXTRACT,
+        "max_input_tokens": args.max_input_tokens,
+        "max_output_tokens": args.max_output_tokens,
+        "near_duplicates": args.near_duplicates,
+        "url_templates": args.url_templates,
+        "incremental": args.incremental,
+        "sidebar_mode": args.sidebar_mode,
+        "json_decoder": args.json_decoder,
+        "overlap": args.overlap,
+        "payload_format": args.payload_format,
+        "max_structure_chars": args.max_structure_chars,
+        "formats": group_formats,
+        "intermediate_format": intermediate_format,
+        "keep_artifacts": sorted(keep),
+    }
+    if not args.force and manifest.is_up_to_date("fused", inputs, params):
+        logger.info(
+            f"Skipped the fused run, using existing files in: {migration_groups_dir}"
+        )
+        return
+
+    started = time.perf_counter()
+    artifacts = []
+
+    def keep_frame(name, df, path):
+        if name in keep:
+            artifacts.append(
+                write_frame(df, intermediate_path(path, intermediate_format))
+            )
+            logger.info(f"Kept {name} rows in: {artifacts[-1]}")
+
+    report = new_decode_report() if args.json_decoder == "typed" else None
+    migration_groups = None
+    if args.overlap:
+        logger.info(
+            "Step 1: Filtering, expanding and classifying the crawl in overlapping chunks"
+        )
+        expanded, migration_groups = classify_expanding_crawl(
+            iter_expanded_chunks(
+                input_file,
+                report=report,
+                columns=COLUMNS_TO_EXTRACT,
+                chunk_rows=OVERLAP_CHUNK_ROWS,
+            ),
+            COLUMNS_TO_EXTRACT,
+            max_input_tokens=args.max_input_tokens,
+            max_output_tokens=args.max_output_tokens,
+            concurrency=args.concurrency,
+            stream=args.stream,
+            output_dir=crawl_analysis_dir,
+            payload_format=args.payload_format,
+            max_structure_chars=args.max_structure_chars,
+        )
+    else:
+        logger.info("Step 1: Filtering HTML rows and expanding JSON columns in memory")
+        # Only the extracted columns are read and decoded, unless the whole crawl is kept.
+        columns = None
+        if not keep & {"filtered", "expanded"}:
+            columns = [*COLUMNS_TO_EXTRACT, clean_header(JSON_COLUMN)]
+        filtered = filter_html_frame(input_file, columns)
+        keep_frame(
+            "filtered",
+            filtered,
+            audit_outputs_dir / f"{input_file.name}.filtered.csv",
+        )
+        expanded = expand_json_frame(filtered, report=report, columns=columns)
+        keep_frame(
+            "expanded", expanded, audit_outputs_dir / f"{input_name}-expanded.csv"
+        )
+    if report is not None:
+        print_decode_report(report)
+        report_file = audit_outputs_dir / f"{input_name}-expanded-decode-report.json"
+        write_decode_report(report, report_file)
+        artifacts.append(report_file)
+
+    logger.info("Step 2: Analyzing crawl data")
+    extracted_columns_file = None
+    if "extracted" in keep:
+        extracted_columns_file = intermediate_path(
+            audit_outputs_dir / "extracted_columns.json", intermediate_format
+        )
+        artifacts.append(extracted_columns_file)
+    analysis = crawl_analysis(
+        expanded,
+        extracted_columns_file,
+        COLUMNS_TO_EXTRACT,
+        max_input_tokens=args.max_input_tokens,
+        max_output_tokens=args.max_output_tokens,
+        concurrency=args.concurrency,
+        stream=args.stream,
+        near_duplicates=args.near_duplicates,
+        url_templates=args.url_templates,
+        incremental=args.incremental,
+        result_store=audit_outputs_dir.parent / RESULT_STORE_FILE,
+        sidebar_mode=args.sidebar_mode,
+        output_dir=crawl_analysis_dir,
+        intermediate_format=intermediate_format,
+        save_outputs="analysis" in keep,
+        migration_groups=migration_groups,
+        payload_format=args.payload_format,
+        max_structure_chars=args.max_structure_chars,
+    )
+    if "analysis" in keep:
+        artifacts += [
+            intermediate_path(crawl_analysis_dir / name, intermediate_format)
+            for name in ("migration_groups.json", "final-analysis-output.json")
+        ]
+
+    logger.info("Step 3: Grouping data by migration paths")
+    result = group_migration_paths(analysis)
+    export_migration_groups(result, migration_groups_dir, formats=group_formats)
+    manifest.record(
+        "fused",
+        inputs,
+        params,
+        sorted(migration_groups_dir.glob("*")) + artifacts,
+    )
+    logger.info(
+        f"Fused pipeline completed in {time.perf_counter() - started:.1f}s, migration groups "
+        f"exported to: {migration_groups_dir}"
+    )
+
+
 if __name__ == "__main__":
     main()
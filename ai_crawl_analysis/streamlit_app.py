@@ -157,7 +157,12 @@ def main():
         and expanded_csv.stat().st_size > 0
     ):
         crawl_analysis(
-            str(expanded_csv), str(extracted_columns_file), columns_to_extract, True
+            str(expanded_csv),
+            str(extracted_columns_file),
+            columns_to_extract,
+            True,
+            stream=True,
+            output_dir=crawl_analysis_dir,
         )
         st.session_state.crawl_analysis_complete = True
         crawl_analysis_output = crawl_analysis_dir / "final-analysis-output.json"
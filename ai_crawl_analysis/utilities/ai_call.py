@@ -9,24 +9,55 @@ Parameters:
   :param content: Optional JSON content as string to provide directly instead of reading from a file.
   :param model: The AI model to use (default is "gemini-2.5-pro-preview-06-05").
   :param temperature: The temperature for the model's response (default is 0.3).
+  :param use_cache: Return a stored response for an identical earlier request instead of calling the
+    model (default is True). See response_cache.py for the cache settings.
   :return: The response from the AI model.
 
+Requests share one client per process, wait for the model's rate limits (see rate_limiter.py) and are
+retried with exponential backoff on rate limit, server and timeout errors. Optional environment
+variables:
+  AI_MAX_RETRIES: Number of retries for a failed request (default is 5).
+  AI_REQUEST_TIMEOUT_SECONDS: Timeout for a single request (default is 600).
+
 Usage:
   from ai_crawl_analysis.utilities.ai_call import call_ai
   # With file:
   response = call_ai(prompt=prompt, file=json_file_path)
   # With direct content:
   response = call_ai(prompt=prompt, content=json_content)
+  # From async code:
+  response = await call_ai_async(prompt=prompt, content=json_content)
+  # Streaming the response in chunks:
+  for chunk in call_ai_stream(prompt=prompt, content=json_content):
+      print(chunk)
 
   Run directly to test: python run ai_crawl_analysis.utilities.ai_call OR
   uv run -m ai_crawl_analysis.utilities.ai_call
 """
 
+import asyncio
 import os
+import random
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Iterator
 
+import httpx
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+
+from ai_crawl_analysis.utilities.batching import estimate_tokens
+from ai_crawl_analysis.utilities.rate_limiter import (
+    get_rate_limiter,
+    request_slot,
+    request_slot_async,
+)
+from ai_crawl_analysis.utilities.response_cache import (
+    get_response_cache,
+    response_cache_key,
+)
 
 load_dotenv()
 
@@ -41,22 +72,50 @@ DEFAULT_RESPONSE_SCHEMA = {
     "properties": {"insights": {"type": "string"}},
 }
 
+# Retry settings for rate limit (429), server (5xx) and timeout errors.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", 5))
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+REQUEST_TIMEOUT_SECONDS = int(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", 600))
+
+# Clients are created once and reused so HTTP connections are pooled across calls.
+_clients: dict[str, genai.Client] = {}
+_clients_lock = threading.Lock()
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+# Jitter only spreads out retries, it does not need to be cryptographically secure.
+_random = random.SystemRandom()
+
+
+def _read_content(file: str | None, content: str | None) -> str | None:
+    """Return the JSON content to send with the prompt, read from a file if needed."""
+    # If direct content is provided, use it
+    if content:
+        return content
+    # If a file is provided, read its content
+    if file:
+        # Check if it's a file path or actual JSON content
+        if os.path.exists(file) and file.lower().endswith(".json"):
+            try:
+                with open(file, "r", encoding="utf-8") as f:
+                    return f.read()
+            except FileNotFoundError:
+                raise FileNotFoundError(f"The file '{file}' was not found.")
+            except Exception as e:
+                raise Exception(f"Error reading the JSON file: {str(e)}")
+        # Assume it's direct JSON content
+        return file
+    return None
 
-def call_ai(
-    prompt: str,
-    file: str | None = None,
-    content: str | None = None,
-    system_instructions: str = DEFAULT_SYSTEM_INSTRUCTIONS,
-    model: str = DEFAULT_MODEL,
-    temperature: float = 0.3,
-    response_schema=DEFAULT_RESPONSE_SCHEMA,
-) -> str:
 
+def _validate_arguments(prompt: str, temperature: float):
     if not prompt:
         raise ValueError("Prompt cannot be empty.")
     if not (0.0 <= temperature <= 1.0):
         raise ValueError("Temperature must be between 0.0 and 1.0.")
 
+
+def _api_key() -> str:
     # Load the API key from environment variables
     api_key = os.getenv(API_KEY)
 
@@ -64,42 +123,336 @@ def call_ai(
         raise ValueError(
             "API key for the AI model is not set in environment variables."
         )
+    return api_key
 
-    # Initialize the AI client with the API key
-    client = genai.Client(api_key=api_key)
 
-    json_content = None
+def _new_client(api_key: str) -> genai.Client:
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(timeout=REQUEST_TIMEOUT_SECONDS * 1000),
+    )
 
-    # If direct content is provided, use it
-    if content:
-        json_content = content
-    # If a file is provided, read its content
-    elif file:
-        # Check if it's a file path or actual JSON content
-        if os.path.exists(file) and file.lower().endswith(".json"):
+
+def get_client() -> genai.Client:
+    """
+    Return the process-wide AI client, so connections are reused across calls.
+    """
+    api_key = _api_key()
+    with _clients_lock:
+        if api_key not in _clients:
+            _clients[api_key] = _new_client(api_key)
+        return _clients[api_key]
+
+
+def get_async_client() -> genai.Client:
+    """
+    Return the AI client for the running event loop. The async HTTP connections of a client are
+    bound to the event loop that opened them, so each loop gets its own client.
+    """
+    api_key = _api_key()
+    loop = asyncio.get_running_loop()
+    loop_clients = _async_clients.setdefault(loop, {})
+    if api_key not in loop_clients:
+        loop_clients[api_key] = _new_client(api_key)
+    return loop_clients[api_key]
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Return True for rate limit, server and timeout errors that may succeed when retried."""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Return the seconds to wait before retrying: exponential backoff with full jitter, or the delay
+    requested by the API if that is longer.
+    """
+    delay = _random.uniform(
+        0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+    )
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", {}).get("details", []):
+            retry_delay = str(detail.get("retryDelay", "")).rstrip("s")
             try:
-                with open(file, "r", encoding="utf-8") as f:
-                    json_content = f.read()
-            except FileNotFoundError:
-                raise FileNotFoundError(f"The file '{file}' was not found.")
-            except Exception as e:
-                raise Exception(f"Error reading the JSON file: {str(e)}")
-        else:
-            # Assume it's direct JSON content
-            json_content = file
+                delay = max(delay, float(retry_delay))
+            except ValueError:
+                continue
+    return delay
+
+
+def _log_retry(error: Exception, attempt: int, delay: float):
+    print(
+        f"⚠️ AI call failed ({error}). Retrying in {delay:.1f}s "
+        f"(attempt {attempt + 1} of {MAX_RETRIES})."
+    )
+
+
+def _build_config(
+    system_instructions: str, temperature: float, response_schema
+) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        system_instruction=system_instructions,
+        response_schema=response_schema,
+    )
+
+
+def _contents(prompt: str, json_content: str | None) -> types.ContentListUnion:
+    """Return the contents of a request: the content and then the prompt, or only the prompt."""
+    if not json_content:
+        return prompt
+    parts: list[types.PartUnion] = [json_content, prompt]
+    return parts
+
+
+def _estimate_request_tokens(
+    prompt: str, json_content: str | None, system_instructions: str
+) -> int:
+    return (
+        estimate_tokens(prompt)
+        + estimate_tokens(json_content or "")
+        + estimate_tokens(system_instructions)
+    )
+
 
-    # Generate content using the specified model and prompt.
-    response = client.models.generate_content(
+def _cache_key(
+    prompt: str,
+    json_content: str | None,
+    system_instructions: str,
+    model: str,
+    temperature: float,
+    response_schema,
+) -> str:
+    return response_cache_key(
         model=model,
-        contents=[json_content, prompt] if json_content else prompt,
-        config=types.GenerateContentConfig(
-            temperature=temperature,
-            system_instruction=system_instructions,
-            response_schema=response_schema,
-        ),
+        temperature=temperature,
+        system_instructions=system_instructions,
+        prompt=prompt,
+        response_schema=response_schema,
+        content=json_content,
+    )
+
+
+def call_ai(
+    prompt: str,
+    file: str | None = None,
+    content: str | None = None,
+    system_instructions: str = DEFAULT_SYSTEM_INSTRUCTIONS,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.3,
+    response_schema=DEFAULT_RESPONSE_SCHEMA,
+    use_cache: bool = True,
+) -> str:
+
+    _validate_arguments(prompt, temperature)
+    json_content = _read_content(file, content)
+
+    # Return the stored response if the same request was made before.
+    cache = get_response_cache()
+    use_cache = use_cache and cache.enabled
+    key = _cache_key(
+        prompt, json_content, system_instructions, model, temperature, response_schema
     )
+    if use_cache and (cached := cache.get(key)) is not None:
+        return cached
+
+    client = get_client()
+    limiter = get_rate_limiter(model)
+    tokens = _estimate_request_tokens(prompt, json_content, system_instructions)
+
+    # Generate content using the specified model and prompt, retrying transient errors.
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(tokens)
+        try:
+            with request_slot():
+                response = client.models.generate_content(
+                    model=model,
+                    contents=_contents(prompt, json_content),
+                    config=_build_config(
+                        system_instructions, temperature, response_schema
+                    ),
+                )
+            break
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            _log_retry(e, attempt, delay)
+            time.sleep(delay)
+    if use_cache and response.text:
+        cache.set(key, response.text)
     # Return the text response from the AI model.
-    return response.text
+    return response.text or ""
+
+
+async def call_ai_async(
+    prompt: str,
+    file: str | None = None,
+    content: str | None = None,
+    system_instructions: str = DEFAULT_SYSTEM_INSTRUCTIONS,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.3,
+    response_schema=DEFAULT_RESPONSE_SCHEMA,
+    use_cache: bool = True,
+) -> str:
+    """
+    Async counterpart of call_ai, built on the genai async client so several calls can be in flight
+    at once. Takes the same parameters as call_ai.
+    """
+    _validate_arguments(prompt, temperature)
+    json_content = _read_content(file, content)
+
+    cache = get_response_cache()
+    use_cache = use_cache and cache.enabled
+    key = _cache_key(
+        prompt, json_content, system_instructions, model, temperature, response_schema
+    )
+    if use_cache and (cached := cache.get(key)) is not None:
+        return cached
+
+    client = get_async_client()
+    limiter = get_rate_limiter(model)
+    tokens = _estimate_request_tokens(prompt, json_content, system_instructions)
+
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire_async(tokens)
+        try:
+            async with request_slot_async():
+                response = await client.aio.models.generate_content(
+                    model=model,
+                    contents=_contents(prompt, json_content),
+                    config=_build_config(
+                        system_instructions, temperature, response_schema
+                    ),
+                )
+            break
+        except Exception as e:
+            if attempt == MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            _log_retry(e, attempt, delay)
+            await asyncio.sleep(delay)
+    if use_cache and response.text:
+        cache.set(key, response.text)
+    return response.text or ""
+
+
+def call_ai_stream(
+    prompt: str,
+    file: str | None = None,
+    content: str | None = None,
+    system_instructions: str = DEFAULT_SYSTEM_INSTRUCTIONS,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.3,
+    response_schema=DEFAULT_RESPONSE_SCHEMA,
+    use_cache: bool = True,
+) -> Iterator[str]:
+    """
+    Stream the response text in chunks as the model generates it, using generate_content_stream.
+    Takes the same parameters as call_ai. A cached response is returned as a single chunk.
+
+    Use json_stream.iter_json_rows to get each row of a JSON array response as soon as it is
+    complete.
+    """
+    _validate_arguments(prompt, temperature)
+    json_content = _read_content(file, content)
+
+    cache = get_response_cache()
+    use_cache = use_cache and cache.enabled
+    key = _cache_key(
+        prompt, json_content, system_instructions, model, temperature, response_schema
+    )
+    if use_cache and (cached := cache.get(key)) is not None:
+        yield cached
+        return
+
+    client = get_client()
+    limiter = get_rate_limiter(model)
+    tokens = _estimate_request_tokens(prompt, json_content, system_instructions)
+
+    chunks: list[str] = []
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(tokens)
+        try:
+            with request_slot():
+                for response in client.models.generate_content_stream(
+                    model=model,
+                    contents=_contents(prompt, json_content),
+                    config=_build_config(
+                        system_instructions, temperature, response_schema
+                    ),
+                ):
+                    if response.text:
+                        chunks.append(response.text)
+                        yield response.text
+            break
+        except Exception as e:
+            # Once text has been yielded a retry would repeat it, so only retry empty streams.
+            if chunks or attempt == MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            _log_retry(e, attempt, delay)
+            time.sleep(delay)
+    if use_cache and chunks:
+        cache.set(key, "".join(chunks))
+
+
+async def call_ai_stream_async(
+    prompt: str,
+    file: str | None = None,
+    content: str | None = None,
+    system_instructions: str = DEFAULT_SYSTEM_INSTRUCTIONS,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.3,
+    response_schema=DEFAULT_RESPONSE_SCHEMA,
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    """
+    Async counterpart of call_ai_stream. Takes the same parameters as call_ai.
+    """
+    _validate_arguments(prompt, temperature)
+    json_content = _read_content(file, content)
+
+    cache = get_response_cache()
+    use_cache = use_cache and cache.enabled
+    key = _cache_key(
+        prompt, json_content, system_instructions, model, temperature, response_schema
+    )
+    if use_cache and (cached := cache.get(key)) is not None:
+        yield cached
+        return
+
+    client = get_async_client()
+    limiter = get_rate_limiter(model)
+    tokens = _estimate_request_tokens(prompt, json_content, system_instructions)
+
+    chunks: list[str] = []
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire_async(tokens)
+        try:
+            async with request_slot_async():
+                async for response in await client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=_contents(prompt, json_content),
+                    config=_build_config(
+                        system_instructions, temperature, response_schema
+                    ),
+                ):
+                    if response.text:
+                        chunks.append(response.text)
+                        yield response.text
+            break
+        except Exception as e:
+            if chunks or attempt == MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            _log_retry(e, attempt, delay)
+            await asyncio.sleep(delay)
+    if use_cache and chunks:
+        cache.set(key, "".join(chunks))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+"""
+Utilities for splitting crawl rows into batches that fit a model's token budget.
+
+Token counts are estimated from the length of the serialized JSON, which is close enough to size
+batches safely without a round trip to the model's token counting endpoint.
+
+Usage:
+  from ai_crawl_analysis.utilities.batching import batch_rows
+  batches = batch_rows(rows, max_input_tokens=100_000, max_output_tokens=32_000)
+"""
+
+import json
+from typing import Callable
+
+# Rough number of characters per token for English text and JSON.
+CHARS_PER_TOKEN = 4
+DEFAULT_MAX_INPUT_TOKENS = 100_000
+DEFAULT_MAX_OUTPUT_TOKENS = 32_000
+# Extra output tokens per row for the key the model adds to each echoed row (eg. migration_group).
+ROW_OUTPUT_OVERHEAD_TOKENS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text.
+
+    :param text: The text to estimate.
+    :return: The estimated token count.
+    """
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def batch_rows(
+    rows: list[dict],
+    max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+    max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+    prompt_tokens: int = 0,
+    output_tokens_per_row: int | None = None,
+    row_text: Callable[[dict], str] | None = None,
+) -> list[list[dict]]:
+    """
+    Split rows into consecutive batches that stay within the input and output token budgets.
+
+    :param rows: The rows to split.
+    :param max_input_tokens: Maximum estimated input tokens for the rows in one batch.
+    :param max_output_tokens: Maximum estimated output tokens for the response to one batch.
+    :param prompt_tokens: Tokens used by the prompt and system instructions sent with every batch.
+    :param output_tokens_per_row: Fixed output estimate per row. When None, the model is assumed to
+      echo each row back with one extra key.
+    :param row_text: Returns the text a row adds to the payload, when the rows are not sent as JSON
+      objects (eg. CompactPayload.row_text). Defaults to the row serialized as JSON.
+    :return: A list of batches, each a list of rows. A row that exceeds the budget on its own is
+      placed in a batch by itself.
+    """
+    input_budget = max(max_input_tokens - prompt_tokens, 1)
+    batches: list[list[dict]] = []
+    current: list[dict] = []
+    current_input = 0
+    current_output = 0
+
+    for row in rows:
+        text = row_text(row) if row_text else json.dumps(row, ensure_ascii=False)
+        row_tokens = estimate_tokens(text)
+        row_output = (
+            output_tokens_per_row
+            if output_tokens_per_row is not None
+            else row_tokens + ROW_OUTPUT_OVERHEAD_TOKENS
+        )
+        if current and (
+            current_input + row_tokens > input_budget
+            or current_output + row_output > max_output_tokens
+        ):
+            batches.append(current)
+            current, current_input, current_output = [], 0, 0
+
+        current.append(row)
+        current_input += row_tokens
+        current_output += row_output
+
+    if current:
+        batches.append(current)
+
+    return batches
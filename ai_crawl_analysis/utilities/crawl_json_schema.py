@@ -0,0 +1,206 @@
+"""
+Declares the schema of the crawl's JSON column, and collects the problems found while decoding the
+column into a report.
+
+CRAWL_SCHEMA lists the fields the Screaming Frog prompt asks for, with the JSON types allowed for
+each and whether it is required. The prompt lists the required fields as "- name: description"
+lines, and introduces a few conditional fields as "<name> must be a non-empty string".
+prompt_fields() reads the fields back from the prompt, and tests/test_crawl_json_schema.py checks
+that they match CRAWL_SCHEMA, so the schema is updated whenever the prompt adds or removes a field.
+
+The report counts the rows of each kind of problem, with the first rows and an example of each, so
+it stays small for any number of rows:
+- invalid_json: the cell holds text that is not a valid JSON object.
+- missing_field: a required field is missing or null.
+- wrong_type: a field holds a value of a JSON type its schema does not allow.
+- unexpected_field: a field that is not in the schema.
+
+Usage:
+  from ai_crawl_analysis.utilities.crawl_json_schema import CRAWL_SCHEMA, new_decode_report
+  CRAWL_SCHEMA["has_tabs"]  # {"types": ["boolean"], "required": True}
+"""
+
+import json
+import re
+
+SCREAMING_FROG_PROMPT_FILE = "screaming-frog-prompt.txt"
+# Number of rows kept in the report for each problem.
+MAX_REPORTED_ROWS = 100
+
+
+def _field(*types: str, required: bool = True) -> dict:
+    return {"types": list(types), "required": required}
+
+
+# The fields of the JSON object, in prompt order. Fields that are "otherwise false" in the prompt
+# are strings or false.
+CRAWL_SCHEMA = {
+    "page_description": _field("string"),
+    "page_structure": _field("object"),
+    "slideshows": _field("array"),
+    "has_tabs": _field("boolean"),
+    "tab_class": _field("string", required=False),
+    "has_accordions": _field("boolean"),
+    "accordion_class": _field("string", required=False),
+    "dynamic_content": _field("array"),
+    "content_tags": _field("array"),
+    "interactive_elements": _field("array"),
+    "is_listing_page": _field("boolean"),
+    "listing_type": _field("string", required=False),
+    "css_files": _field("array"),
+    "js_files": _field("array"),
+    "js_libraries": _field("array"),
+    "sidebar": _field("string", "boolean"),
+    "sidebar_has_menu": _field("boolean"),
+    "manual_review": _field("boolean"),
+}
+
+_FIELD = re.compile(r"^\s*-\s+(\w+):")
+_CONDITIONAL_STRING_FIELD = re.compile(r"\b(\w+) must be a non-empty string")
+
+
+def prompt_fields(prompt: str) -> dict[str, bool]:
+    """
+    Read the fields of the JSON object from the "JSON schema:" section of a prompt.
+
+    :param prompt: The prompt text.
+    :return: Whether each field is required, in prompt order.
+    """
+    _, _, section = prompt.partition("JSON schema:")
+    fields = {}
+    for line in section.splitlines():
+        if match := _FIELD.match(line):
+            fields[match[1]] = True
+        for name in _CONDITIONAL_STRING_FIELD.findall(line):
+            fields.setdefault(name, False)
+    return fields
+
+
+def json_type(value) -> str:
+    """
+    Return the JSON type of a decoded value: "null", "boolean", "number", "string", "array" or
+    "object".
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+
+def new_decode_report() -> dict:
+    """
+    Return an empty decode report.
+    """
+    return {"rows": 0, "invalid_rows": 0, "issues": {}}
+
+
+def add_issue(
+    report: dict,
+    kind: str,
+    field: str | None,
+    rows: list[int],
+    example: str = "",
+    count: int | None = None,
+):
+    """
+    Add the rows with a problem to a decode report.
+
+    :param report: The report.
+    :param kind: The kind of problem, eg. "wrong_type".
+    :param field: The field with the problem, or None for problems with the whole object.
+    :param rows: The rows with the problem, counted from 0.
+    :param example: An example of the problem, eg. the start of the invalid text.
+    :param count: The number of rows with the problem, if rows holds only some of them.
+    """
+    count = len(rows) if count is None else count
+    if not count:
+        return
+    issue = report["issues"].setdefault(
+        f"{kind}:{field or ''}",
+        {"kind": kind, "field": field, "count": 0, "rows": [], "example": example},
+    )
+    issue["count"] += count
+    issue["rows"].extend(rows[: MAX_REPORTED_ROWS - len(issue["rows"])])
+    if kind == "invalid_json":
+        report["invalid_rows"] += count
+
+
+def validate_object(obj: dict, schema: dict[str, dict]) -> list[tuple[str, str, str]]:
+    """
+    Check a decoded JSON object against a schema.
+
+    :return: The kind, field and an example of each problem.
+    """
+    problems = []
+    for field, spec in schema.items():
+        value_type = json_type(obj.get(field))
+        if value_type == "null":
+            if spec["required"]:
+                problems.append(("missing_field", field, ""))
+        elif value_type not in spec["types"]:
+            problems.append(
+                ("wrong_type", field, f"{value_type}: {obj[field]!r}"[:200])
+            )
+    for field in obj.keys() - schema.keys():
+        problems.append(("unexpected_field", field, ""))
+    return problems
+
+
+def merge_decode_report(report: dict, other: dict, row_offset: int = 0):
+    """
+    Add the problems of another report to a report, eg. for the next chunk of rows.
+
+    :param report: The report to update.
+    :param other: The report to add.
+    :param row_offset: The number of rows before the rows of the other report.
+    """
+    report["rows"] += other["rows"]
+    for issue in other["issues"].values():
+        rows = [row + row_offset for row in issue["rows"]]
+        add_issue(
+            report,
+            issue["kind"],
+            issue["field"],
+            rows,
+            issue["example"],
+            issue["count"],
+        )
+
+
+def print_decode_report(report: dict):
+    """
+    Print a summary of a decode report, with one line for each kind of problem.
+    """
+    if not report["issues"]:
+        print(f"✅ Decoded {report['rows']} JSON objects with no schema problems")
+        return
+    print(
+        f"⚠️ Decoded {report['rows']} JSON objects, {report['invalid_rows']} with invalid JSON:"
+    )
+    for issue in sorted(report["issues"].values(), key=lambda i: -i["count"]):
+        field = f" {issue['field']}" if issue["field"] else ""
+        example = f" (eg. {issue['example'][:80]!r})" if issue["example"] else ""
+        print(
+            f"  {issue['kind']}{field}: {issue['count']} rows, first rows "
+            f"{issue['rows'][:5]}{example}"
+        )
+
+
+def write_decode_report(report: dict, path):
+    """
+    Write a decode report to a JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {**report, "issues": list(report["issues"].values())},
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )
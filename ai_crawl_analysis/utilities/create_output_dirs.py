@@ -1,22 +1,28 @@
 from pathlib import Path
 
 
-def create_output_dirs():
+def create_output_dirs(base_dir: str | Path = "data", namespace: str | None = None):
     """
     Create necessary output directories for the application.
 
+    Args:
+        base_dir (str | Path): Base directory for all generated files (default is "data").
+        namespace (str | None): Optional subdirectory of base_dir, eg. the name of a site, so
+            several sites can be processed at the same time without overwriting each other's files.
+
     Returns:
         tuple: Paths to the audit outputs, crawl analysis, and migration groups directories.
     """
+    root = Path(base_dir) / namespace if namespace else Path(base_dir)
 
     # Create the base directory if it doesn't exist
-    audit_outputs_dir = Path("data/audit-outputs")
+    audit_outputs_dir = root / "audit-outputs"
     audit_outputs_dir.mkdir(parents=True, exist_ok=True)
 
-    crawl_analysis_dir = Path("data/crawl-analysis")
+    crawl_analysis_dir = root / "crawl-analysis"
     crawl_analysis_dir.mkdir(parents=True, exist_ok=True)
 
-    migration_groups_dir = Path("data/migration_groups")
+    migration_groups_dir = root / "migration_groups"
     migration_groups_dir.mkdir(parents=True, exist_ok=True)
 
     return audit_outputs_dir, crawl_analysis_dir, migration_groups_dir
@@ -0,0 +1,99 @@
+"""
+Splits a CSV file into byte ranges that start and end on record boundaries, so the ranges can be
+parsed in parallel.
+
+A newline ends a record only when it is outside a quoted field. Quotes inside a quoted field are
+doubled, so a newline is outside quotes when the number of quotes before it is even. Each range
+ends after such a newline, and the header is read separately and prepended to every range when it
+is parsed.
+
+Usage:
+  from ai_crawl_analysis.utilities.csv_shards import read_csv_range, record_ranges
+  header, ranges = record_ranges("data/audit-outputs/site.csv.filtered.csv", 8)
+  df = read_csv_range("data/audit-outputs/site.csv.filtered.csv", header, *ranges[0])
+"""
+
+import io
+import mmap
+from pathlib import Path
+
+import polars as pl
+
+# Ranges smaller than this are not worth a separate process.
+MIN_RANGE_BYTES = 1 << 20
+
+_QUOTE = b'"'
+_NEWLINE = b"\n"
+
+
+def _record_end(data, position: int, quotes: int) -> tuple[int, int]:
+    """
+    Find the end of the record that contains a position.
+
+    :param data: The file contents.
+    :param position: The position to start from.
+    :param quotes: The number of quotes before the position.
+    :return: The position after the newline ending the record, or the end of the file, and the
+      number of quotes before it.
+    """
+    while True:
+        newline = data.find(_NEWLINE, position)
+        if newline == -1:
+            return len(data), quotes + data[position:].count(_QUOTE)
+        quotes += data[position:newline].count(_QUOTE)
+        position = newline + 1
+        if quotes % 2 == 0:
+            return position, quotes
+
+
+def record_ranges(
+    path: str | Path, count: int, min_bytes: int = MIN_RANGE_BYTES
+) -> tuple[bytes, list[tuple[int, int]]]:
+    """
+    Split the records of a CSV file into byte ranges of about the same size.
+
+    :param path: The CSV file.
+    :param count: The number of ranges wanted.
+    :param min_bytes: The minimum size of a range, so small files are not split into many ranges.
+    :return: The header line, and the start and end of each range, in file order. The ranges cover
+      every record after the header.
+    """
+    with open(path, "rb") as f:
+        if Path(path).stat().st_size == 0:
+            return b"", []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end, quotes = _record_end(data, 0, 0)
+            header = data[:header_end]
+            size = len(data) - header_end
+            count = max(1, min(count, size // max(1, min_bytes)))
+            ranges = []
+            start = header_end
+            counted = header_end
+            for i in range(1, count + 1):
+                if start >= len(data):
+                    break
+                target = header_end + size * i // count
+                if target <= start:
+                    continue
+                quotes += data[counted:target].count(_QUOTE)
+                end, quotes = _record_end(data, target, quotes)
+                ranges.append((start, end))
+                start = counted = end
+    return header, ranges
+
+
+def read_csv_range(path: str | Path, header: bytes, start: int, end: int, **kwargs):
+    """
+    Parse the records in a byte range of a CSV file.
+
+    :param path: The CSV file.
+    :param header: The header line returned by record_ranges().
+    :param start: The start of the range.
+    :param end: The end of the range.
+    :param kwargs: Options passed to pl.read_csv().
+    :return: The DataFrame.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pl.read_csv(io.BytesIO(header + data), **kwargs)
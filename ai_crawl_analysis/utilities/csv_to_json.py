@@ -1,27 +1,25 @@
 import json
 
-import polars as pl
+from .frame_io import scan_frame
 
 
-def csv_to_json(input_csv: str):
+def csv_to_json(input_csv: str, columns: list[str] | None = None):
     """
     Convert a CSV file to a JSON file.
 
     :param input_csv: Path to the input CSV file.
+    :param columns: The columns to convert, or None to convert every column. Only these columns
+      are parsed.
     :return: Path to the output JSON file.
     """
 
-    # Read the CSV file using Polars with proper handling for "None" values and HTTP Version
-    df = pl.read_csv(
-        input_csv,
-        null_values=["None", "null", "NA", "N/A", ""],
-        schema_overrides={
-            "HTTP Version": pl.Utf8
-        },  # Ensure HTTP Version is always read as string
-    )
+    # Scan the CSV file using Polars with proper handling for "None" values and HTTP Version
+    lf = scan_frame(input_csv)
+    if columns is not None:
+        lf = lf.select(columns)
 
     # Convert the DataFrame to a list of dictionaries
-    data = df.to_dicts()
+    data = lf.collect().to_dicts()
 
     # Define the output JSON file path
     output_json = input_csv.replace(".csv", ".json")
@@ -3,9 +3,12 @@ This script extracts specific columns from a CSV file containing site crawl data
 to a new JSON file.
 
 Parameters:
-  :param input_csv: Path to the input CSV file containing site crawl data.
-  :param output_json: Path to the output JSON file where extracted columns will be saved.
-  :param columns: List of column names to extract from the CSV file.
+  :param input_csv: Path to the input CSV file containing site crawl data. Parquet and Arrow IPC
+    files are read too, based on the file suffix.
+  :param output_json: Path to the output JSON file where extracted columns will be saved. It is
+    written as Parquet or Arrow IPC instead if it has a .parquet or .arrow suffix.
+  :param columns: List of column names to extract from the CSV file. The other columns are not
+    parsed.
   :return: Path to the output JSON file with the extracted columns.
 
 Usage:
@@ -13,24 +16,17 @@ from ai_crawl_analysis.utilities.extract_cols_to_json import extract_cols_to_jso
 
 """
 
-import polars
+from pathlib import Path
 
+from ai_crawl_analysis.utilities.frame_io import read_frame, write_frame
 
-def extract_cols_to_json(input_csv: str, output_json: str, columns: list):
 
-    # Read the input CSV file with proper handling for "None" values and HTTP Version
-    df = polars.read_csv(
-        input_csv,
-        null_values=["None", "null", "NA", "N/A", ""],
-        schema_overrides={
-            "HTTP Version": polars.Utf8
-        },  # Ensure HTTP Version is always read as string
-    )
+def extract_cols_to_json(input_csv: str | Path, output_json: str | Path, columns: list):
 
-    # Select the specified columns
-    selected_df = df.select(columns)
+    # Read only the specified columns, with proper handling for "None" values and HTTP Version
+    selected_df = read_frame(input_csv, columns)
 
     # Write the selected columns to the output JSON file
-    selected_df.write_json(output_json)
+    write_frame(selected_df, output_json)
 
     return output_json
@@ -1,26 +1,96 @@
+from typing import Iterator
+
 import polars as pl
 
-from .header_cleaner import clean_header
+from .frame_io import (
+    CSV_NULL_VALUES,
+    is_text_file,
+    iter_csv_chunks,
+    scan_frame,
+    sink_frame,
+    write_frame,
+)
+from .header_cleaner import header_map
+
+# Number of rows filtered at a time in streaming mode.
+CHUNK_ROWS = 50_000
+
+_IS_HTML = pl.col("content_type").str.contains("text/html")
+
+
+def filter_html_frame(input_file, columns=None) -> pl.DataFrame:
+    """
+    Read the rows of a CSV file where the 'content_type' column contains 'text/html', with cleaned
+    column names, as filter_html_rows() writes them.
+    :param input_file: Path to the input CSV file.
+    :param columns: The cleaned names of the columns to read, or None to read every column. Only
+      these columns are parsed, and names not in the file are ignored.
+    :return: The filtered rows.
+    """
+    # Scan the CSV with proper handling of "None" values and HTTP Version read as a string, and
+    # clean the column names. The text/html filter is applied while the file is read.
+    lf = scan_frame(input_file)
+    lf = lf.rename(header_map(lf.collect_schema().names()))
+    lf = lf.filter(_IS_HTML)
+    if columns is not None:
+        lf = lf.select(name for name in lf.collect_schema().names() if name in columns)
+    return lf.collect()
+
+
+def iter_html_chunks(
+    input_file, chunk_rows=CHUNK_ROWS, columns=None
+) -> Iterator[pl.DataFrame]:
+    """
+    Read the rows of a CSV file where the 'content_type' column contains 'text/html' in chunks of
+    rows, with cleaned column names and every column as strings. Chunks without such rows are
+    skipped.
+    :param input_file: Path to the input CSV file.
+    :param chunk_rows: The number of rows read at a time.
+    :param columns: The cleaned names of the columns to read, or None to read every column. Names not
+      in the file are ignored.
+    """
+    lf = pl.scan_csv(input_file, null_values=CSV_NULL_VALUES, infer_schema=False)
+    headers = header_map(lf.collect_schema().names())
+    if columns is not None:
+        headers = {
+            orig: clean
+            for orig, clean in headers.items()
+            if clean in columns or clean == "content_type"
+        }
+    for chunk in iter_csv_chunks(
+        input_file, chunk_rows, list(headers), null_values=CSV_NULL_VALUES
+    ):
+        chunk = chunk.rename(headers).filter(_IS_HTML)
+        if columns is not None and "content_type" not in columns:
+            chunk = chunk.drop("content_type")
+        if not chunk.is_empty():
+            yield chunk
 
 
-def filter_html_rows(input_file, output_file):
+def filter_html_rows(input_file, output_file, streaming=False):
     """
     Filter rows in a CSV file where the 'content_type' column contains 'text/html'.
     :param input_file: Path to the input CSV file.
-    :param output_file: Path to the output CSV file.
-    :return: Path to the output CSV file with filtered rows.
+    :param output_file: Path to the output file. It is written as CSV, Parquet or Arrow IPC
+      depending on its suffix.
+    :param streaming: Filter the file in chunks, so memory use does not grow with the size of the
+      file. Every column is then read as strings and copied as it is, instead of being read with
+      inferred types.
+    :return: Path to the output file with filtered rows.
     """
-    # Read CSV with proper handling of "None" values and ensuring HTTP Version is a string
-    df = pl.read_csv(
-        input_file,
-        null_values=["None", "null", "NA", "N/A", ""],
-        schema_overrides={
-            "HTTP Version": pl.Utf8
-        },  # Ensure HTTP Version is always read as string
-    )
-    # Clean column names to match the cleaned headers
-    df.columns = [clean_header(col) for col in df.columns]
-    # Filter rows where content_type contains 'text/html'
-    filtered_df = df.filter(df["content_type"].str.contains("text/html"))
-    filtered_df.write_csv(output_file)
+    if streaming:
+        lf = pl.scan_csv(input_file, null_values=CSV_NULL_VALUES, infer_schema=False)
+        headers = header_map(lf.collect_schema().names())
+        columns = list(headers.values())
+        if not is_text_file(output_file):
+            sink_frame(lf.rename(headers).filter(_IS_HTML), output_file)
+            return output_file
+        # Appending chunks to the CSV file takes less memory than sink_frame().
+        with open(output_file, "wb") as f:
+            pl.DataFrame(schema=dict.fromkeys(columns, pl.Utf8)).write_csv(f)
+            for chunk in iter_html_chunks(input_file):
+                chunk.write_csv(f, include_header=False)
+        return output_file
+
+    write_frame(filter_html_frame(input_file), output_file)
     return output_file
@@ -0,0 +1,281 @@
+"""
+Reads and writes the intermediate files passed between pipeline steps.
+
+By default the steps hand off through text files: CSV for tables and JSON for lists of rows. With
+the "parquet" or "ipc" intermediate format they are written as compressed Parquet or as Arrow IPC
+files instead. Both keep the column types, so the next step does not parse and infer them again.
+IPC files are left uncompressed so they can be memory-mapped when they are read. The format of a
+file is taken from its suffix.
+
+Usage:
+  from ai_crawl_analysis.utilities.frame_io import intermediate_path, read_frame, write_frame
+  path = intermediate_path(audit_outputs_dir / "extracted_columns.json", "parquet")
+  write_frame(df, path)
+  df = read_frame(path, columns=["address", "migration_group"])
+
+Files are scanned lazily, so only the columns a step asks for are parsed. Files too large for
+memory can be read with iter_csv_chunks() and written from a lazy query with sink_frame().
+"""
+
+import json
+from pathlib import Path
+from typing import Iterator
+
+import polars as pl
+
+# Formats of the files passed between pipeline steps. "text" keeps the CSV and JSON files.
+INTERMEDIATE_FORMATS = ("text", "parquet", "ipc")
+FORMAT_SUFFIXES = {"parquet": ".parquet", "ipc": ".arrow"}
+# Values read as missing from CSV files.
+CSV_NULL_VALUES = ["None", "null", "NA", "N/A", ""]
+# Columns always read as strings from CSV files.
+CSV_STRING_COLUMNS = {"HTTP Version": pl.Utf8}
+
+_INTEGER = r"^[+-]?\d+$"
+_FLOAT = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+
+def intermediate_path(path: str | Path, intermediate_format: str = "text") -> Path:
+    """
+    Return the path of an intermediate file in the given format.
+
+    :param path: The path of the file as a text file, eg. "data/audit-outputs/extracted_columns.json".
+    :param intermediate_format: One of INTERMEDIATE_FORMATS.
+    :return: The path unchanged for the text format, otherwise with the suffix of the format.
+    """
+    if intermediate_format not in INTERMEDIATE_FORMATS:
+        raise ValueError(
+            f"Unknown intermediate format {intermediate_format!r}, expected one of "
+            f"{INTERMEDIATE_FORMATS}"
+        )
+    path = Path(path)
+    if intermediate_format == "text":
+        return path
+    return path.with_suffix(FORMAT_SUFFIXES[intermediate_format])
+
+
+def is_text_file(path: str | Path) -> bool:
+    """
+    Return True if a file is a CSV or JSON file.
+    """
+    return Path(path).suffix.lower() in (".csv", ".json")
+
+
+def _csv_type_casts(lf: pl.LazyFrame) -> list[pl.Expr]:
+    """
+    Return the casts giving the string columns of a query the types infer_csv_types() infers,
+    checked in one pass over its rows.
+
+    Integer columns with a value outside the Int64 range are left as strings, as a cast would
+    turn the value into null or fail.
+    """
+    names = [
+        name
+        for name, dtype in lf.collect_schema().items()
+        if dtype == pl.Utf8 and name not in CSV_STRING_COLUMNS
+    ]
+    checks = []
+    for i, name in enumerate(names):
+        column = pl.col(name)
+        missing = column.is_null()
+        checks += [
+            column.is_not_null().any().alias(f"{i}:any"),
+            (missing | column.str.contains(_INTEGER)).all().alias(f"{i}:integer"),
+            (column.cast(pl.Int64, strict=False).is_null() == missing)
+            .all()
+            .alias(f"{i}:int64"),
+            (missing | column.str.contains(_FLOAT)).all().alias(f"{i}:float"),
+            (missing | column.str.to_lowercase().is_in(["true", "false"]))
+            .all()
+            .alias(f"{i}:boolean"),
+        ]
+    if not checks:
+        return []
+    found = lf.select(checks).collect(engine="streaming").row(0, named=True)
+
+    casts = []
+    for i, name in enumerate(names):
+        column = pl.col(name)
+        if not found[f"{i}:any"]:
+            continue
+        if found[f"{i}:integer"]:
+            if found[f"{i}:int64"]:
+                casts.append(column.cast(pl.Int64))
+        elif found[f"{i}:float"]:
+            casts.append(column.cast(pl.Float64))
+        elif found[f"{i}:boolean"]:
+            casts.append(column.str.to_lowercase() == "true")
+    return casts
+
+
+def infer_csv_types(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Give string columns the integer, float or boolean type read_frame() would infer for them from a
+    CSV file, so a Parquet or IPC file built from strings reads back like the CSV file. Integers
+    too large for Int64 are kept as strings.
+
+    :param df: A DataFrame with string columns.
+    :return: The DataFrame with the inferred column types.
+    """
+    return df.with_columns(_csv_type_casts(df.lazy()))
+
+
+def scan_csv_typed(path: str | Path) -> pl.LazyFrame:
+    """
+    Scan a CSV file with the column types infer_csv_types() would give it, for files too large to
+    read into memory. The file is read once to find the types and again when the query runs.
+
+    :param path: The CSV file.
+    :return: A lazy query over the typed rows of the file.
+    """
+    lf = pl.scan_csv(path, null_values=CSV_NULL_VALUES, infer_schema=False)
+    return lf.with_columns(_csv_type_casts(lf))
+
+
+def encode_nested_columns(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Replace list and struct columns with their values encoded as JSON, so they can be written to
+    a CSV file and read back with json.loads.
+    """
+    encoded = [
+        pl.Series(
+            name,
+            [
+                None if value is None else json.dumps(value, ensure_ascii=False)
+                for value in df[name].to_list()
+            ],
+            dtype=pl.Utf8,
+        )
+        for name, dtype in df.schema.items()
+        if dtype.is_nested()
+    ]
+    return df.with_columns(encoded) if encoded else df
+
+
+def write_frame(df: pl.DataFrame, path: str | Path) -> Path:
+    """
+    Write a DataFrame in the format given by the file suffix. List and struct columns are written
+    to CSV files as JSON.
+
+    :param df: The DataFrame to write.
+    :param path: The output file: .csv, .json, .parquet or .arrow.
+    :return: The path of the written file.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        encode_nested_columns(df).write_csv(path)
+    elif suffix == ".json":
+        df.write_json(path)
+    elif suffix == ".parquet":
+        df.write_parquet(path, compression="zstd")
+    elif suffix == ".arrow":
+        df.write_ipc(path, compression="uncompressed")
+    else:
+        raise ValueError(f"Unsupported file format: {path}")
+    return path
+
+
+def iter_csv_chunks(
+    path: str | Path,
+    chunk_rows: int,
+    columns: list[str] | None = None,
+    null_values: list[str] | None = None,
+) -> Iterator[pl.DataFrame]:
+    """
+    Read a CSV file in chunks of about chunk_rows rows, with every column as strings, so memory use
+    does not grow with the size of the file.
+
+    :param path: The CSV file.
+    :param chunk_rows: The number of rows in a chunk.
+    :param columns: The columns to read, or None to read every column.
+    :param null_values: Values read as missing.
+    """
+    reader = pl.read_csv_batched(
+        path,
+        columns=columns,
+        null_values=null_values,
+        infer_schema_length=0,
+        batch_size=chunk_rows,
+    )
+    while batches := reader.next_batches(1):
+        yield from batches
+
+
+def sink_frame(lf: pl.LazyFrame, path: str | Path) -> Path:
+    """
+    Run a query with the streaming engine and write its result in the format given by the file
+    suffix, without holding the whole result in memory. Nested columns are not encoded for CSV
+    files, unlike in write_frame().
+
+    :param lf: The query.
+    :param path: The output file: .csv, .parquet or .arrow.
+    :return: The path of the written file.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        lf.sink_csv(path)
+    elif suffix == ".parquet":
+        lf.sink_parquet(path, compression="zstd")
+    elif suffix == ".arrow":
+        lf.sink_ipc(path, compression="uncompressed")
+    else:
+        raise ValueError(f"Unsupported file format for streaming: {path}")
+    return path
+
+
+def scan_frame(path: str | Path) -> pl.LazyFrame:
+    """
+    Scan a file in the format given by the file suffix without reading it, so the columns and rows
+    a query does not use are not parsed.
+
+    CSV files are read with the same options as the rest of the pipeline: common placeholders for
+    missing values are read as nulls, and the HTTP Version column is always read as a string.
+
+    :param path: The input file: .csv, .json, .parquet or .arrow.
+    :return: The LazyFrame.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        return pl.scan_csv(
+            path,
+            null_values=CSV_NULL_VALUES,
+            schema_overrides=CSV_STRING_COLUMNS,
+        )
+    if suffix == ".json":
+        return pl.read_json(path).lazy()
+    if suffix == ".parquet":
+        return pl.scan_parquet(path)
+    if suffix == ".arrow":
+        return pl.scan_ipc(path, memory_map=True)
+    raise ValueError(f"Unsupported file format: {path}")
+
+
+def read_frame(path: str | Path, columns: list[str] | None = None) -> pl.DataFrame:
+    """
+    Read a DataFrame in the format given by the file suffix, with the options of scan_frame().
+
+    :param path: The input file: .csv, .json, .parquet or .arrow.
+    :param columns: The columns to read, or None to read every column. Only these columns are
+      parsed.
+    :return: The DataFrame.
+    """
+    lf = scan_frame(path)
+    if columns is not None:
+        lf = lf.select(columns)
+    return lf.collect()
+
+
+def read_rows(path: str | Path) -> list[dict]:
+    """
+    Read the rows of an intermediate file as a list of dictionaries.
+
+    :param path: A JSON file with a list of rows, or a file that read_frame() can read.
+    :return: The rows.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        return json.loads(path.read_text(encoding="utf-8"))
+    return read_frame(path).to_dicts()
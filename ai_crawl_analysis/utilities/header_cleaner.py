@@ -1,6 +1,9 @@
 import re
+from functools import lru_cache
+from typing import Iterable
 
 
+@lru_cache(maxsize=4096)
 def clean_header(header):
     """
     Clean a CSV header by removing non-alphanumeric characters (except underscores and spaces),
@@ -16,3 +19,13 @@ def clean_header(header):
     cleaned = re.sub(r"[^a-zA-Z0-9_ ]", "", header)
     cleaned = cleaned.lower().replace(" ", "_")
     return cleaned
+
+
+def header_map(headers: Iterable[str]) -> dict[str, str]:
+    """
+    Map the headers of a file to their cleaned names, so they are cleaned once for every reader of
+    the file.
+    :param headers: The headers, in order.
+    :return: The cleaned name of each header, in the same order.
+    """
+    return {header: clean_header(header) for header in headers}
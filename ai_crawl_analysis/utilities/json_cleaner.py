@@ -8,8 +8,17 @@ This cleans JSON files that may contain:
 """
 
 import json
+import re
 from pathlib import Path
 
+import polars as pl
+
+from ai_crawl_analysis.utilities.json_stream import JsonArrayStreamParser
+
+_decoder = json.JSONDecoder()
+# Whitespace and commas between the items of an array.
+_ITEM_SEPARATOR = re.compile(r"[\s,]*")
+
 
 def clean_json_file(file_path: str | Path, expected_keys: int = 6) -> str:
     """
@@ -29,20 +38,61 @@ def clean_json_file(file_path: str | Path, expected_keys: int = 6) -> str:
     if isinstance(file_path, str):
         file_path = Path(file_path)
 
-    # Step 1: Read the file
+    # Read the file
     content = file_path.read_text(encoding="utf-8")
 
-    # Step 2: Remove code fences
+    cleaned_json = clean_json_text(content, expected_keys)
+
+    # Write the cleaned content back to the file
+    file_path.write_text(cleaned_json, encoding="utf-8")
+
+    return cleaned_json
+
+
+def clean_json_text(content: str, expected_keys: int = 6) -> str:
+    """
+    Clean JSON text returned by an LLM without reading or writing a file. Applies the same steps
+    as clean_json_file.
+
+    Parameters:
+        content (str): The raw text that should contain a JSON array
+        expected_keys (int): Expected number of non-null keys each object should have
+
+    Returns:
+        str: The cleaned JSON content
+    """
+    return json.dumps(
+        parse_json_response(content, expected_keys), indent=2, ensure_ascii=False
+    )
+
+
+def parse_json_response(
+    content: str, expected_keys: int = 6, output_path: str | Path | None = None
+) -> list:
+    """
+    Parse the JSON array in an LLM response once, applying the same cleaning steps as
+    clean_json_file, and return the rows without re-serializing them.
+
+    Parameters:
+        content (str): The raw text that should contain a JSON array
+        expected_keys (int): Expected number of non-null keys each object should have
+        output_path (str | Path | None): Optional path to also save the cleaned rows to, as compact
+            JSON
+
+    Returns:
+        list: The parsed rows
+    """
+    # Step 1: Remove code fences
     content = remove_code_fences(content)
 
-    # Step 3: Extract JSON content (find JSON array/object)
+    # Step 2: Extract JSON content (find JSON array/object)
     content = extract_json_content(content)
 
     # Ensure we have a JSON array specifically
     if not content.startswith("["):
         raise ValueError("No JSON array found in file")
 
-    # Step 4: Try to parse and clean incomplete objects
+    # Step 3: Try to parse and clean incomplete objects
     try:
         # If it parses successfully, check the last object
         data = json.loads(content)
@@ -56,42 +106,71 @@ def clean_json_file(file_path: str | Path, expected_keys: int = 6) -> str:
                 if len(non_null_keys) < expected_keys:
                     data.pop()  # Remove incomplete last object
 
-            # Convert back to clean JSON
-            cleaned_json = json.dumps(data, indent=2, ensure_ascii=False)
-
-        else:
-            cleaned_json = content
-
     except json.JSONDecodeError:
-        # Step 5: Handle malformed JSON by finding the last complete object
-        lines = content.strip().split("\n")
-
-        # Work backwards to find a valid structure
-        for i in range(len(lines) - 1, -1, -1):
-            test_content = "\n".join(lines[:i]).strip()
-
-            # Try to create valid JSON
-            if test_content.endswith("}"):
-                test_content += "\n]"
-            elif test_content.endswith(","):
-                test_content = test_content.rstrip(",") + "\n]"
-            else:
-                continue
-
-            try:
-                test_data = json.loads(test_content)
-                if isinstance(test_data, list) and test_data:
-                    cleaned_json = json.dumps(test_data, indent=2, ensure_ascii=False)
-                    break
-            except json.JSONDecodeError:
-                continue
-        else:
+        # Step 4: Handle malformed JSON by keeping every complete object
+        data = recover_json_objects(content)
+        if not data:
             raise ValueError("Could not fix malformed JSON")
 
-    # Step 6: Write the cleaned content back to the file
-    file_path.write_text(cleaned_json, encoding="utf-8")
+    if output_path is not None:
+        Path(output_path).write_text(
+            json.dumps(data, ensure_ascii=False), encoding="utf-8"
+        )
 
-    return cleaned_json
+    return data
+
+
+def json_response_to_dataframe(
+    content: str, expected_keys: int = 6, output_path: str | Path | None = None
+) -> pl.DataFrame:
+    """
+    Parse the JSON array in an LLM response straight into a Polars DataFrame.
+
+    Parameters:
+        content (str): The raw text that should contain a JSON array
+        expected_keys (int): Expected number of non-null keys each object should have
+        output_path (str | Path | None): Optional path to also save the cleaned rows to
+
+    Returns:
+        pl.DataFrame: One row per object in the array
+    """
+    rows = parse_json_response(content, expected_keys, output_path)
+    return pl.DataFrame(rows, infer_schema_length=None, strict=False)
+
+
+def recover_json_objects(content: str) -> list[dict]:
+    """
+    Recover every complete object from a JSON array that is cut off or malformed.
+
+    Objects are decoded one after another with JSONDecoder.raw_decode. If an object cannot be
+    decoded, the rest of the text is scanned once, tracking string, escape and bracket state, to
+    find the remaining complete objects. The cost is linear in the size of the text and does not
+    depend on how the objects are split across lines.
+
+    Parameters:
+        content (str): Text containing a JSON array of objects, possibly incomplete.
+
+    Returns:
+        list[dict]: The complete objects, in order. Objects that are cut off or invalid are skipped.
+    """
+    objects: list[dict] = []
+    position = content.find("[") + 1
+    length = len(content)
+    while position and position < length:
+        match = _ITEM_SEPARATOR.match(content, position)
+        # The separator pattern also matches an empty string, so there is always a match.
+        assert match is not None
+        position = match.end()
+        if position >= length or content[position] == "]":
+            return objects
+        try:
+            item, position = _decoder.raw_decode(content, position)
+        except json.JSONDecodeError:
+            # Cut off or malformed: find the remaining complete objects with the scanner.
+            return objects + JsonArrayStreamParser().feed("[" + content[position:])
+        if isinstance(item, dict):
+            objects.append(item)
+    return objects
 
 
 def validate_json_file(file_path: str | Path, expected_keys: int = 6) -> bool:
@@ -0,0 +1,129 @@
+"""
+Incremental parser for JSON arrays of objects returned by an LLM in chunks.
+
+The parser skips any text or code fence before the opening bracket of the array and returns each
+object as soon as its closing brace arrives, so rows can be used before the response is complete.
+If the stream is cut off, only the last partial object is lost.
+
+Usage:
+  from ai_crawl_analysis.utilities.json_stream import JsonArrayStreamParser
+  parser = JsonArrayStreamParser()
+  for chunk in chunks:
+      for row in parser.feed(chunk):
+          print(row)
+"""
+
+import json
+import re
+from typing import AsyncIterator, Iterable, Iterator
+
+_SPECIAL_CHARS = re.compile(r'["\\{}\[\]]')
+
+
+class JsonArrayStreamParser:
+    """
+    Tracks bracket depth and string/escape state across chunks to find complete array items.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        # Position in the buffer up to which characters have been scanned.
+        self._position = 0
+        self._in_array = False
+        self._closed = False
+        self._depth = 0
+        self._in_string = False
+        # Buffer position before which characters are escaped and must not be checked.
+        self._skip_until = 0
+        # Start of the object being read, or -1 when between objects.
+        self._object_start = -1
+
+    def feed(self, chunk: str) -> list[dict]:
+        """
+        Add a chunk of text and return the objects completed by it.
+
+        :param chunk: The next piece of the response text.
+        :return: The complete objects found, in order.
+        """
+        if self._closed:
+            return []
+        self._buffer += chunk
+        buffer = self._buffer
+        objects: list[dict] = []
+        position = self._position
+
+        if not self._in_array:
+            start = buffer.find("[", position)
+            if start == -1:
+                self._position = len(buffer)
+                return objects
+            self._in_array = True
+            position = start + 1
+
+        # Only quotes, backslashes and brackets change the state, so jump between them.
+        skip_until = self._skip_until
+        for match in _SPECIAL_CHARS.finditer(buffer, position):
+            index = match.start()
+            if index < skip_until:
+                # The character after a backslash inside a string.
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == "\\":
+                    skip_until = index + 2
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = index
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start != -1:
+                    start, end = self._object_start, index + 1
+                    item = _loads(buffer[start:end])
+                    if isinstance(item, dict):
+                        objects.append(item)
+                    self._object_start = -1
+                elif self._depth < 0:
+                    # The closing bracket of the array. Anything after it is ignored.
+                    self._closed = True
+                    self._buffer = ""
+                    return objects
+
+        # Drop text that has been fully consumed to keep the buffer small.
+        keep_from = self._object_start if self._object_start != -1 else len(buffer)
+        self._buffer = buffer[keep_from:]
+        if self._object_start != -1:
+            self._object_start = 0
+        self._position = len(self._buffer)
+        self._skip_until = max(skip_until - keep_from, 0)
+        return objects
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def iter_json_rows(chunks: Iterable[str]) -> Iterator[dict]:
+    """
+    Yield each object of a JSON array as soon as it is complete in a stream of text chunks.
+    """
+    parser = JsonArrayStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+async def aiter_json_rows(chunks: AsyncIterator[str]) -> AsyncIterator[dict]:
+    """
+    Async counterpart of iter_json_rows.
+    """
+    parser = JsonArrayStreamParser()
+    async for chunk in chunks:
+        for row in parser.feed(chunk):
+            yield row
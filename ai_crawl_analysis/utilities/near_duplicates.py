@@ -0,0 +1,197 @@
+"""
+Finds near-duplicate pages so only one page of each group needs to be sent to the AI model.
+
+Pagination pages, tag archives and templated detail pages often have almost the same page
+structure and description. Each row's text is split into overlapping word shingles with Polars, and
+MinHash signatures are computed for all rows at once with NumPy. Locality-sensitive hashing then buckets
+the signatures by band, and rows in the same bucket whose signatures agree on at least the
+similarity threshold are merged into one group. The first row of each group, in crawl order,
+represents the group.
+
+Usage:
+  from ai_crawl_analysis.utilities.near_duplicates import (
+      expand_near_duplicate_results,
+      find_near_duplicates,
+  )
+  representatives = find_near_duplicates(rows)
+  results = expand_near_duplicate_results(results, representatives)
+"""
+
+from typing import Any
+
+import numpy as np
+import polars as pl
+
+# Columns compared to find near-duplicate rows.
+NEAR_DUPLICATE_COLUMNS = ("page_structure", "page_description")
+# Minimum estimated Jaccard similarity for two rows to be near-duplicates.
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+# Number of MinHash permutations, split into LSH bands of equal size. With 16 bands of 4 values,
+# pairs with a similarity of 0.8 share a bucket in at least one band more than 99% of the time.
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16
+# Number of consecutive words in a shingle.
+SHINGLE_SIZE = 3
+# Number of shingles hashed at once. Small chunks keep the intermediate arrays in the CPU cache.
+CHUNK_SHINGLES = 4_096
+
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def shingle_hashes(texts: list[str], seed: int = 0) -> pl.DataFrame:
+    """
+    Hash the overlapping word shingles of every text at once.
+
+    :param texts: The texts to split into shingles.
+    :param seed: Seed for the hash, so hashes are the same across runs.
+    :return: A DataFrame with the "row" index of the text and the 32-bit "shingle" hash, ordered by
+      row. Texts with fewer words than a shingle have one shingle for each of their words, and texts
+      without words have no rows.
+    """
+    word_hash = pl.col("word_hash")
+    shifted = [
+        word_hash.shift(-offset).over("row").alias(f"word_{offset}")
+        for offset in range(SHINGLE_SIZE)
+    ]
+    return (
+        pl.DataFrame({"text": texts}, schema={"text": pl.Utf8})
+        .with_row_index("row")
+        .select("row", word=pl.col("text").str.to_lowercase().str.extract_all(r"\w+"))
+        .explode("word")
+        .drop_nulls("word")
+        .select("row", word_hash=pl.col("word").hash(seed))
+        .filter(shifted[-1].is_not_null() | (pl.len().over("row") < SHINGLE_SIZE))
+        .select("row", shingle=pl.struct(shifted).hash(seed))
+    )
+
+
+def minhash_signatures(
+    texts: list[str], num_permutations: int = NUM_PERMUTATIONS, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute MinHash signatures for a list of texts.
+
+    :param texts: The texts to sign.
+    :param num_permutations: Number of hash functions in each signature.
+    :param seed: Seed for the hash functions, so signatures are the same across runs.
+    :return: A matrix of signatures with one row per text, and a boolean array that is False for
+      texts without any words. Those texts have no meaningful signature.
+    """
+    # Multiply-shift hash functions: the top 32 bits of (a * x + b) modulo 2**64, with odd a.
+    generator = np.random.default_rng(seed)
+    multipliers = generator.integers(0, 1 << 63, num_permutations, dtype=np.uint64)
+    multipliers = multipliers * np.uint64(2) + np.uint64(1)
+    offsets = generator.integers(0, 1 << 63, num_permutations, dtype=np.uint64)
+
+    shingles = shingle_hashes(texts, seed)
+    rows = shingles["row"].to_numpy()
+    # Keep the top 32 bits of each shingle hash so the products below fit the hash functions.
+    values: np.ndarray = shingles["shingle"].to_numpy() >> np.uint64(32)
+    signatures = np.full((len(texts), num_permutations), _MAX_HASH, np.uint64)
+    has_words = np.zeros(len(texts), dtype=bool)
+    has_words[rows] = True
+
+    # Hash the shingles in chunks that end on a row boundary, then take the minimum for each row.
+    row_starts: np.ndarray = np.flatnonzero(np.diff(rows, prepend=-1))
+    start = 0
+    while start < len(row_starts):
+        limit = row_starts[start] + CHUNK_SHINGLES
+        end = max(int(np.searchsorted(row_starts, limit, side="right")), start + 1)
+        first = int(row_starts[start])
+        last = int(row_starts[end]) if end < len(row_starts) else len(values)
+        chunk = values[first:last, None]
+        hashed = chunk * multipliers
+        hashed += offsets
+        # Shifting keeps the order of the hashes, so it is applied to the minimums only.
+        minimums = np.minimum.reduceat(hashed, row_starts[start:end] - first, axis=0)
+        signatures[rows[row_starts[start:end]]] = minimums >> np.uint64(32)
+        start = end
+    return signatures, has_words
+
+
+def near_duplicate_labels(
+    signatures: np.ndarray,
+    has_words: np.ndarray,
+    num_bands: int = NUM_BANDS,
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+) -> np.ndarray:
+    """
+    Group rows with similar MinHash signatures.
+
+    :param signatures: The signatures from minhash_signatures().
+    :param has_words: The mask from minhash_signatures(). Rows without words are never grouped.
+    :param num_bands: Number of LSH bands the signatures are split into.
+    :param threshold: Minimum fraction of matching signature values for two rows to be grouped.
+    :return: For each row, the index of the first row of its group.
+    """
+    parents: np.ndarray = np.arange(len(signatures))
+
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = int(parents[index])
+        return index
+
+    candidates: np.ndarray = np.flatnonzero(has_words)
+    candidate_signatures = signatures[candidates]
+    buckets: np.ndarray
+    for band in np.array_split(np.arange(signatures.shape[1]), num_bands):
+        _, buckets = np.unique(
+            candidate_signatures[:, band], axis=0, return_inverse=True
+        )
+        order = np.argsort(buckets, kind="stable")
+        splits = np.flatnonzero(np.diff(buckets[order])) + 1
+        for bucket in np.split(candidates[order], splits):
+            if len(bucket) < 2:
+                continue
+            leader = bucket[0]
+            similarities = (signatures[bucket[1:]] == signatures[leader]).mean(axis=1)
+            for member in bucket[1:][similarities >= threshold]:
+                # Keep the lowest index as the root so it represents the group.
+                root, other = sorted((find(leader), find(member)))
+                parents[other] = root
+    return np.array([find(index) for index in range(len(signatures))])
+
+
+def find_near_duplicates(
+    rows: list[dict],
+    columns: tuple[str, ...] = NEAR_DUPLICATE_COLUMNS,
+    id_key: str = "address",
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+) -> dict[str, str]:
+    """
+    Find the representative of each row among its near-duplicates.
+
+    :param rows: The rows to compare.
+    :param columns: The columns whose text is compared.
+    :param id_key: The key that identifies each row (default is "address").
+    :param threshold: Minimum estimated Jaccard similarity for two rows to be near-duplicates.
+    :return: A dictionary mapping each row's id to the id of the row that represents it. Rows that
+      represent themselves map to their own id.
+    """
+    if not rows:
+        return {}
+    texts = [" ".join(str(row.get(column) or "") for column in columns) for row in rows]
+    signatures, has_words = minhash_signatures(texts)
+    labels = near_duplicate_labels(signatures, has_words, threshold=threshold)
+    return {
+        str(row.get(id_key)): str(rows[label].get(id_key))
+        for row, label in zip(rows, labels)
+    }
+
+
+def expand_near_duplicate_results(
+    results: dict[str, Any], representatives: dict[str, str]
+) -> dict[str, Any]:
+    """
+    Give every row the result of the row that represents it.
+
+    :param results: A dictionary mapping representative ids to their results.
+    :param representatives: The mapping returned by find_near_duplicates().
+    :return: A dictionary mapping every row id whose representative has a result to that result.
+    """
+    expanded = dict(results)
+    for row_id, representative in representatives.items():
+        if representative in results:
+            expanded[row_id] = results[representative]
+    return expanded
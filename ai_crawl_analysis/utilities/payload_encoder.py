@@ -0,0 +1,181 @@
+"""
+Encodes batches of rows for the AI model as a compact table instead of a JSON array of objects.
+
+A JSON array of objects repeats every key name on every row, and every address repeats the scheme
+and host of the site. The compact payload sends the key names once as a header, each row as a list
+of values, and the addresses relative to the origin most rows share. Long page structures are cut
+to a character budget, since the first part of the structure is enough to tell page types apart.
+
+Each row gets a short id, its position in the batch, and the model returns only the id and the
+value it adds to each row instead of echoing the rows back. The ids are mapped back to the rows
+sent, so the results are matched by id rather than by addresses the model may have rewritten.
+
+Usage:
+  from ai_crawl_analysis.utilities.payload_encoder import CompactPayload
+  payload = CompactPayload(id_key="address", result_key="migration_group")
+  content, row_ids = payload.encode(batch)
+  result = payload.decode({"id": 0, "migration_group": "News"}, row_ids)
+"""
+
+import json
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Ways to send the rows of a batch: a JSON array of objects, or the compact table.
+PAYLOAD_FORMATS = ("json", "compact")
+# Keys cut to the character budget, and the default budget.
+TRUNCATED_KEYS = ("page_structure",)
+DEFAULT_MAX_STRUCTURE_CHARS = 600
+# Marks a value that was cut to the budget.
+TRUNCATION_MARK = "…"
+# Estimated output tokens for each row of the response: the id and a short label.
+OUTPUT_TOKENS_PER_ROW = 20
+
+_ROW_ID_KEY = "id"
+_FORMAT_INSTRUCTIONS = """
+The rows are sent as a JSON table instead of an array of objects: "columns" names the keys, and \
+each item of "rows" holds the values of one row in the same order. Addresses that start with "/" \
+are relative to "origin". Values that end with "{mark}" were shortened.
+Instead of returning the rows, return a JSON array with one object per row holding only the \
+row's "{id_key}" and the "{result_key}" key. Return every {id_key} exactly once."""
+
+
+def url_origin(address) -> str | None:
+    """
+    Return the scheme and host of a URL, eg. "https://www.example.gov", or None if it has none.
+    """
+    if not isinstance(address, str):
+        return None
+    parts = urlsplit(address)
+    if not parts.scheme or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CompactPayload:
+    """
+    Encodes the batches of one classification call and maps the model's results back to the rows.
+    """
+
+    def __init__(
+        self,
+        id_key: str = "address",
+        result_key: str = "migration_group",
+        max_structure_chars: int | None = DEFAULT_MAX_STRUCTURE_CHARS,
+    ):
+        """
+        :param id_key: The key that identifies each row, eg. "address".
+        :param result_key: The key the model adds to each row, eg. "migration_group".
+        :param max_structure_chars: Maximum characters kept of each value in TRUNCATED_KEYS, or
+          None to send them whole.
+        """
+        self.id_key = id_key
+        self.result_key = result_key
+        self.max_structure_chars = max_structure_chars
+        self.output_tokens_per_row = OUTPUT_TOKENS_PER_ROW
+
+    def _value(self, key: str, value):
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        if (
+            key in TRUNCATED_KEYS
+            and self.max_structure_chars is not None
+            and isinstance(value, str)
+            and len(value) > self.max_structure_chars
+        ):
+            value = value[: self.max_structure_chars] + TRUNCATION_MARK
+        return value
+
+    def _columns(self, rows: list[dict]) -> list[str]:
+        # The row id replaces any "id" key of the rows, which is mapped back instead.
+        columns = dict.fromkeys(key for row in rows for key in row)
+        columns.pop(_ROW_ID_KEY, None)
+        return list(columns)
+
+    def prompt(self, prompt: str) -> str:
+        """
+        Add the description of the compact table and of the expected response to a prompt.
+        """
+        return prompt + _FORMAT_INSTRUCTIONS.format(
+            mark=TRUNCATION_MARK, id_key=_ROW_ID_KEY, result_key=self.result_key
+        )
+
+    def response_schema(self, schema: dict) -> dict:
+        """
+        Return the schema of one row of the compact response, with the row id and the result key
+        of a schema for the full rows.
+        """
+        result = schema.get("properties", {}).get(self.result_key, {"type": "string"})
+        return {
+            "type": "object",
+            "properties": {
+                _ROW_ID_KEY: {"type": "integer", "description": "The id of the row."},
+                self.result_key: result,
+            },
+        }
+
+    def row_text(self, row: dict) -> str:
+        """
+        Return the text a row adds to a payload, to estimate its tokens when batching. The address is
+        counted without its origin.
+        """
+        values = []
+        for key, value in row.items():
+            if key == _ROW_ID_KEY:
+                continue
+            origin = url_origin(value) if key == "address" else None
+            if origin:
+                value = value.removeprefix(origin)
+            values.append(self._value(key, value))
+        return json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+
+    def encode(self, batch: list[dict]) -> tuple[str, list]:
+        """
+        Encode a batch of rows.
+
+        :param batch: The rows.
+        :return: The content to send, and the id_key value of each row, by row id.
+        """
+        columns = self._columns(batch)
+        origins = Counter(url_origin(row.get("address")) for row in batch)
+        origins.pop(None, None)
+        origin = origins.most_common(1)[0][0] if origins else ""
+        rows = []
+        for row_id, row in enumerate(batch):
+            values = [row_id]
+            for key in columns:
+                value = row.get(key)
+                if (
+                    key == "address"
+                    and isinstance(value, str)
+                    and origin
+                    and url_origin(value) == origin
+                ):
+                    value = value.removeprefix(origin) or "/"
+                values.append(self._value(key, value))
+            rows.append(values)
+        content = json.dumps(
+            {"origin": origin, "columns": [_ROW_ID_KEY, *columns], "rows": rows},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return content, [row.get(self.id_key) for row in batch]
+
+    def decode(self, item: dict, row_ids: list) -> dict | None:
+        """
+        Map one row of the compact response back to the row it was returned for.
+
+        :param item: The row returned by the model, with the row id and the result key.
+        :param row_ids: The id_key values returned by encode().
+        :return: The row's id_key value and the result, or None if the row id is not in the batch.
+        """
+        try:
+            row_id = int(str(item.get(_ROW_ID_KEY)).strip())
+        except ValueError:
+            return None
+        if not 0 <= row_id < len(row_ids):
+            return None
+        return {
+            self.id_key: row_ids[row_id],
+            self.result_key: item.get(self.result_key),
+        }
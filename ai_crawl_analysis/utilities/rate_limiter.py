@@ -0,0 +1,182 @@
+"""
+Token-bucket rate limiting for AI model requests.
+
+Each model has a requests-per-minute and tokens-per-minute quota. A RateLimiter keeps one bucket for
+each quota, and callers wait until both buckets have room before sending a request. Waiting is
+reserved up front, so concurrent callers are spread out instead of all retrying at once.
+
+The quotas are read from MODEL_QUOTAS, matched by model name prefix, and can be overridden with the
+GEMINI_RPM and GEMINI_TPM environment variables.
+
+When several processes call the model at the same time (see batch_runner.py), they can share a
+semaphore that limits the number of requests in flight across all of them. Requests hold one of its
+slots with request_slot() or request_slot_async().
+
+Usage:
+  from ai_crawl_analysis.utilities.rate_limiter import get_rate_limiter
+  limiter = get_rate_limiter(model)
+  limiter.acquire(estimated_tokens)
+  # From async code:
+  await limiter.acquire_async(estimated_tokens)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Requests per minute and tokens per minute for each model family (Gemini API paid tier 1).
+# Model names are matched by prefix, so more specific names must come first.
+MODEL_QUOTAS = {
+    "gemini-2.5-pro": (150, 2_000_000),
+    "gemini-2.5-flash-lite": (4_000, 4_000_000),
+    "gemini-2.5-flash": (1_000, 1_000_000),
+    "gemini-2.0-flash-lite": (4_000, 4_000_000),
+    "gemini-2.0-flash": (2_000, 4_000_000),
+}
+DEFAULT_QUOTA = (60, 1_000_000)
+
+
+class TokenBucket:
+    """
+    A bucket that holds up to `capacity` units and refills at `rate` units per second.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self._available = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` units from the bucket, going into debt if needed.
+
+        :param amount: Units to take. Amounts larger than the capacity are capped to it.
+        :return: The number of seconds the caller must wait before the units are available.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(
+                self.capacity, self._available + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._available -= amount
+            if self._available >= 0:
+                return 0.0
+            return -self._available / self.rate
+
+
+class RateLimiter:
+    """
+    Limits requests and tokens per minute with one token bucket for each.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def _reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens: int = 0):
+        """
+        Block until a request with `tokens` estimated tokens can be sent.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        """
+        Wait without blocking the event loop until a request with `tokens` estimated tokens can be
+        sent.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def get_model_quota(model: str) -> tuple[int, int]:
+    """
+    Return the (requests per minute, tokens per minute) quota for a model.
+
+    :param model: The model name, eg. "gemini-2.5-pro-preview-06-05".
+    :return: The quota from the GEMINI_RPM and GEMINI_TPM environment variables if set, otherwise
+      from MODEL_QUOTAS.
+    """
+    requests_per_minute, tokens_per_minute = next(
+        (quota for prefix, quota in MODEL_QUOTAS.items() if model.startswith(prefix)),
+        DEFAULT_QUOTA,
+    )
+    requests_per_minute = int(os.getenv("GEMINI_RPM", requests_per_minute))
+    tokens_per_minute = int(os.getenv("GEMINI_TPM", tokens_per_minute))
+    return requests_per_minute, tokens_per_minute
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> RateLimiter:
+    """
+    Return the process-wide rate limiter for a model, creating it on first use.
+    """
+    with _rate_limiters_lock:
+        if model not in _rate_limiters:
+            _rate_limiters[model] = RateLimiter(*get_model_quota(model))
+        return _rate_limiters[model]
+
+
+# A semaphore shared between processes, eg. from multiprocessing.Manager().Semaphore(), or None
+# when requests are only limited within this process.
+_shared_request_slots = None
+
+
+def set_shared_request_slots(semaphore):
+    """
+    Limit the requests in flight across processes with a semaphore shared between them.
+
+    :param semaphore: A semaphore proxy shared by the processes, or None to remove the limit.
+    """
+    global _shared_request_slots
+    _shared_request_slots = semaphore
+
+
+@contextmanager
+def request_slot():
+    """
+    Hold a slot of the shared semaphore, if any, while a request is in flight.
+    """
+    slots = _shared_request_slots
+    if slots is None:
+        yield
+        return
+    slots.acquire()
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+@asynccontextmanager
+async def request_slot_async():
+    """
+    Async counterpart of request_slot. Waiting for a slot does not block the event loop.
+    """
+    slots = _shared_request_slots
+    if slots is None:
+        yield
+        return
+    await asyncio.to_thread(slots.acquire)
+    try:
+        yield
+    finally:
+        slots.release()
@@ -0,0 +1,177 @@
+"""
+Content-addressed on-disk cache for AI model responses.
+
+Each response is stored under a SHA-256 hash of everything that affects it: the model, temperature,
+system instructions, prompt, response schema and content. Reruns over identical data return the
+stored response instead of calling the model again.
+
+Entries older than the maximum age are removed, and the least recently used entries are removed
+once the cache grows beyond the maximum size. The size of the cache is counted once per process and
+then kept up to date as entries are written, so the directory is only scanned again when the cache
+is full.
+
+Settings can be changed with environment variables:
+  AI_CACHE_DIR: Directory for the cache files (default is data/ai-cache).
+  AI_CACHE_MAX_BYTES: Maximum total size of the cache (default is 500 MB).
+  AI_CACHE_MAX_AGE_DAYS: Maximum age of an entry in days (default is 30).
+  AI_CACHE_DISABLED: Set to 1 to bypass the cache.
+
+Usage:
+  from ai_crawl_analysis.utilities.response_cache import get_response_cache, response_cache_key
+  cache = get_response_cache()
+  key = response_cache_key(model=model, prompt=prompt, content=content)
+  response = cache.get(key)
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CACHE_DIR = os.getenv("AI_CACHE_DIR", "data/ai-cache")
+DEFAULT_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+DEFAULT_MAX_AGE_SECONDS = int(float(os.getenv("AI_CACHE_MAX_AGE_DAYS", 30)) * 86400)
+CACHE_DISABLED = os.getenv("AI_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+# Fraction of max_bytes the cache is reduced to when it is full, so the next writes do not scan the
+# directory again right away.
+EVICT_TO_FRACTION = 0.9
+
+
+def response_cache_key(**parts) -> str:
+    """
+    Build a cache key from the parts of a model request.
+
+    :param parts: The values that affect the response, eg. model, temperature, prompt.
+    :return: A SHA-256 hex digest of the parts.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    A directory of cached responses, one text file per cache key.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_seconds: int = DEFAULT_MAX_AGE_SECONDS,
+        enabled: bool = not CACHE_DISABLED,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # Total size of the entries, or None until the directory is first scanned.
+        self._size: int | None = None
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> str | None:
+        """
+        Return the cached response for a key, or None if it is missing or expired.
+        """
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                if self._size is not None:
+                    self._size -= stat.st_size
+                raise FileNotFoundError(path)
+            response = path.read_text(encoding="utf-8")
+            # Touch the entry so eviction removes the least recently used entries first.
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    def set(self, key: str, response: str):
+        """
+        Store a response and evict old entries if the cache is over its limits.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial entry.
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(response, encoding="utf-8")
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+        if self._size is None:
+            self.evict()
+            return
+        self._size += path.stat().st_size - replaced_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then, if the cache is over max_bytes, the least recently used
+        entries until it fits in EVICT_TO_FRACTION of max_bytes. Scans the whole directory, and
+        resets the size kept up to date by set().
+        """
+        if not self.cache_dir.exists():
+            self._size = 0
+            return
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*/*.txt"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        if total_size > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_bytes * EVICT_TO_FRACTION:
+                    break
+                path.unlink(missing_ok=True)
+                total_size -= size
+        self._size = total_size
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for path in self.cache_dir.glob("*/*.txt"):
+            path.unlink(missing_ok=True)
+        self._size = 0
+
+    def stats(self) -> dict:
+        """
+        Return the hit and miss counters for this process.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide response cache, creating it on first use.
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
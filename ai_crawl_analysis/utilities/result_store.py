@@ -0,0 +1,138 @@
+"""
+Persistent per-URL store of crawl analysis results, so re-crawls only analyze new or changed URLs.
+
+Each URL's migration group and streamlined sidebar are stored in a SQLite database together with a
+hash of the extracted columns they were computed from. On the next run, rows whose address and
+column hash match a stored entry reuse the stored results instead of being sent to the AI model.
+
+The database location can be changed with the AI_RESULT_STORE environment variable (default is
+data/result-store.sqlite). The pipeline in main.py keeps a RESULT_STORE_FILE in the output directory
+of each site instead, so sites processed in parallel by the batch runner never write to the same
+database.
+
+Usage:
+  from ai_crawl_analysis.utilities.result_store import ResultStore
+  store = ResultStore()
+  stored = store.lookup(rows, columns)
+  store.save(final_rows, columns)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import batched
+from pathlib import Path
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_RESULT_STORE = os.getenv("AI_RESULT_STORE", "data/result-store.sqlite")
+# File name of the result store in the output directory of a site.
+RESULT_STORE_FILE = "result-store.sqlite"
+# Result columns kept for each URL.
+RESULT_KEYS = ("migration_group", "streamlined_sidebar")
+# Addresses looked up per query, below SQLite's limit on the number of query parameters.
+LOOKUP_CHUNK_SIZE = 500
+
+# The query of lookup(), completed with one "?" placeholder for each address of a chunk.
+_LOOKUP_QUERY = (
+    "SELECT address, row_hash, migration_group, streamlined_sidebar FROM results "
+    "WHERE address IN ({placeholders})"
+)
+
+
+def row_hash(row: dict, columns: list[str]) -> str:
+    """
+    Hash the extracted columns of a row.
+
+    :param row: The row to hash.
+    :param columns: The columns to include.
+    :return: A SHA-256 hex digest of the column values.
+    """
+    values = {column: row.get(column) for column in columns}
+    payload = json.dumps(values, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    """
+    A SQLite table of analysis results with one entry per address.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_RESULT_STORE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "address TEXT PRIMARY KEY, row_hash TEXT NOT NULL, migration_group TEXT, "
+                "streamlined_sidebar TEXT, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a connection that commits on success and is always closed.
+        """
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def lookup(self, rows: list[dict], columns: list[str]) -> dict[str, dict]:
+        """
+        Find the stored results of rows that have not changed since they were analyzed.
+
+        :param rows: The extracted rows, each with an "address".
+        :param columns: The extracted columns, hashed to detect changes.
+        :return: A dictionary mapping the address of each unchanged row to its stored results.
+          Addresses shared by rows with different column values are never matched, since only one
+          result is stored per address.
+        """
+        hashes: dict[str, set[str]] = {}
+        for row in rows:
+            hashes.setdefault(str(row.get("address")), set()).add(
+                row_hash(row, columns)
+            )
+        stored = {}
+        with self._connect() as connection:
+            # Only the rows' addresses are read, so a lookup does not load the whole store.
+            for chunk in batched(hashes, LOOKUP_CHUNK_SIZE):
+                # Only "?" placeholders are added to the constant query, and the addresses are
+                # passed as parameters.
+                query = _LOOKUP_QUERY.format(
+                    placeholders=", ".join("?" * len(chunk))
+                )  # nosec B608
+                for address, stored_hash, *results in connection.execute(query, chunk):
+                    if hashes[address] == {stored_hash}:
+                        stored[address] = dict(zip(RESULT_KEYS, results))
+        return stored
+
+    def save(self, rows: list[dict], columns: list[str]):
+        """
+        Store the results of analyzed rows, replacing older results for the same addresses.
+
+        :param rows: The analyzed rows, with the extracted columns and the result keys.
+        :param columns: The columns hashed to detect changes, as passed to lookup().
+        """
+        now = time.time()
+        entries = [
+            (
+                str(row.get("address")),
+                row_hash(row, columns),
+                *(row.get(key) for key in RESULT_KEYS),
+                now,
+            )
+            for row in rows
+        ]
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", entries
+            )
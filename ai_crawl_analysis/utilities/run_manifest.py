@@ -0,0 +1,170 @@
+"""
+Run manifest and batch checkpoints, so pipeline steps are only rerun when their inputs change.
+
+The manifest records, for each pipeline step, the SHA-256 hashes of its input files, its parameters
+and the hashes of the output files it wrote. A step is up to date when its inputs and parameters
+are unchanged and its outputs are still the files it wrote, so stale outputs from another site or an
+older run are never reused.
+
+Batch checkpoints keep the results of each completed AI batch in a JSON Lines file, so a crashed run
+resumes with the batches that did not complete.
+
+Usage:
+  from ai_crawl_analysis.utilities.run_manifest import RunManifest
+  manifest = RunManifest("data/run-manifest.json")
+  if not manifest.is_up_to_date("expand", inputs, params, outputs):
+      ...
+      manifest.record("expand", inputs, params, outputs)
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Sequence
+
+# Size of the blocks read when hashing a file.
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path: str | Path) -> str | None:
+    """
+    Return the SHA-256 hex digest of a file, or None if it does not exist.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as file:
+            while block := file.read(HASH_BLOCK_SIZE):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def _hashes(paths: Sequence[str | Path]) -> dict[str, str | None]:
+    return {str(path): file_hash(path) for path in paths}
+
+
+class RunManifest:
+    """
+    A JSON file with the inputs, parameters and outputs of the last successful run of each step.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        try:
+            self.steps = json.loads(self.path.read_text(encoding="utf-8"))["steps"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self.steps = {}
+
+    def is_up_to_date(
+        self,
+        step: str,
+        inputs: Sequence[str | Path],
+        params: dict[str, Any],
+        outputs: Sequence[str | Path] | None = None,
+    ) -> bool:
+        """
+        Check whether a step can be skipped.
+
+        :param step: The name of the step.
+        :param inputs: The files the step reads.
+        :param params: The parameters of the step. They must be JSON serializable.
+        :param outputs: The files the step is expected to write. The outputs recorded for the step
+          are always checked too.
+        :return: True if the step ran before with the same inputs and parameters, and its outputs
+          have not changed since.
+        """
+        entry = self.steps.get(step)
+        if entry is None:
+            return False
+        if entry["inputs"] != _hashes(inputs) or entry["params"] != _normalize(params):
+            return False
+        recorded_outputs = entry["outputs"]
+        if any(str(path) not in recorded_outputs for path in outputs or []):
+            return False
+        return recorded_outputs == _hashes(list(recorded_outputs))
+
+    def record(
+        self,
+        step: str,
+        inputs: Sequence[str | Path],
+        params: dict[str, Any],
+        outputs: Sequence[str | Path],
+    ):
+        """
+        Record a successful run of a step and save the manifest.
+
+        :param step: The name of the step.
+        :param inputs: The files the step read.
+        :param params: The parameters of the step. They must be JSON serializable.
+        :param outputs: The files the step wrote.
+        """
+        self.steps[step] = {
+            "inputs": _hashes(inputs),
+            "params": _normalize(params),
+            "outputs": _hashes(outputs),
+            "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps({"steps": self.steps}, indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+    def invalidate(self, step: str):
+        """
+        Forget a step so it runs again, eg. after one of the steps it depends on ran.
+        """
+        self.steps.pop(step, None)
+
+
+def _normalize(params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Return the parameters as they are stored in the manifest, so they can be compared.
+    """
+    return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+
+class BatchCheckpoint:
+    """
+    A JSON Lines file with the results of completed AI batches, one {"id", "value"} object per line.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def load(self) -> dict[str, Any]:
+        """
+        Return the results saved so far. A line cut off by a crash is ignored.
+        """
+        results = {}
+        try:
+            with self.path.open(encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    results[entry["id"]] = entry["value"]
+        except FileNotFoundError:
+            pass
+        return results
+
+    def append(self, results: dict[str, Any]):
+        """
+        Save the results of a completed batch.
+        """
+        if not results:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as file:
+            for row_id, value in results.items():
+                entry = {"id": row_id, "value": value}
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def remove(self):
+        """
+        Delete the checkpoint once the results it holds are no longer needed.
+        """
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,126 @@
+"""
+Consolidates similar sidebar descriptions locally, without calling the AI model.
+
+Each unique sidebar is turned into a TF-IDF vector of its words and word pairs, and sidebars are
+grouped by cosine similarity. The most common sidebars are considered first and start a new cluster
+when they are not similar enough to an existing one, so a chain of slightly different sidebars does
+not end up in one cluster. Every sidebar in a cluster is then given the description of the cluster's
+medoid: the sidebar most similar to the rest of the cluster, weighted by how many rows use each one.
+
+The result has the same shape as the AI sidebar pass, so it can be passed straight to
+apply_streamlined_sidebars().
+
+Usage:
+  from ai_crawl_analysis.utilities.sidebar_clustering import cluster_sidebars
+  sidebars, sidebar_ids = unique_sidebars(rows)
+  streamlined = cluster_sidebars(sidebars, counts)
+  rows = apply_streamlined_sidebars(rows, sidebar_ids, streamlined)
+"""
+
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# Minimum cosine similarity for a sidebar to join a cluster.
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+# Maximum number of shared terms kept as vector columns. Terms used by a single sidebar never add to
+# the similarity between two sidebars, so they only count towards the vector lengths.
+MAX_SHARED_TERMS = 4096
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _terms(text: str) -> Counter:
+    """
+    Count the words and pairs of consecutive words in a sidebar description.
+    """
+    words = _WORD.findall(text.casefold())
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def tfidf_vectors(texts: list[str]) -> np.ndarray:
+    """
+    Build L2-normalized TF-IDF vectors for a list of texts.
+
+    :param texts: The texts to vectorize.
+    :return: A matrix with one row per text. The dot product of two rows is the cosine similarity
+      of the texts. Texts without any words have a zero vector.
+    """
+    term_counts = [_terms(text) for text in texts]
+    document_frequency = Counter(term for counts in term_counts for term in counts)
+    shared_terms = [term for term, df in document_frequency.most_common() if df > 1]
+    columns = {term: i for i, term in enumerate(shared_terms[:MAX_SHARED_TERMS])}
+
+    vectors = np.zeros((len(texts), len(columns)), dtype=np.float32)
+    norms = np.zeros(len(texts), dtype=np.float64)
+    for i, counts in enumerate(term_counts):
+        for term, count in counts.items():
+            # Smoothed inverse document frequency with sublinear term frequency.
+            idf = math.log((1 + len(texts)) / (1 + document_frequency[term])) + 1
+            weight = (1 + math.log(count)) * idf
+            norms[i] += weight * weight
+            if term in columns:
+                vectors[i, columns[term]] = weight
+    norms = np.sqrt(norms)
+    norms[norms == 0] = 1
+    return vectors / norms[:, None].astype(np.float32)
+
+
+def _medoid(vectors: np.ndarray, weights: np.ndarray) -> int:
+    """
+    Return the index of the row with the highest weighted similarity to all the rows.
+    """
+    return int(np.argmax((vectors @ vectors.T) @ weights))
+
+
+def cluster_sidebars(
+    sidebars: list[dict],
+    counts: dict[str, int] | None = None,
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+) -> dict[str, str]:
+    """
+    Group similar sidebars and give each group one canonical description.
+
+    :param sidebars: Unique sidebars from unique_sidebars(), each with an "id" and a "sidebar".
+    :param counts: The number of rows using each sidebar id. Sidebars used by more rows are more
+      likely to become the canonical description. Every sidebar counts once if not given.
+    :param threshold: Minimum cosine similarity for a sidebar to join a cluster, between 0 and 1.
+    :return: A dictionary mapping each sidebar id to the description of its cluster's medoid.
+    """
+    if not sidebars:
+        return {}
+    counts = counts or {}
+    texts = [
+        re.sub(r"\s+", " ", str(sidebar["sidebar"])).strip() for sidebar in sidebars
+    ]
+    weights: np.ndarray = np.array(
+        [counts.get(sidebar["id"], 1) for sidebar in sidebars], dtype=np.float32
+    )
+    vectors = tfidf_vectors(texts)
+
+    # Leader clustering: visit sidebars from most to least used and add each one to the most
+    # similar cluster leader, or make it the leader of a new cluster.
+    order: np.ndarray = np.argsort(-weights, kind="stable")
+    leaders = np.zeros_like(vectors)
+    leader_count = 0
+    labels: np.ndarray = np.empty(len(sidebars), dtype=np.int64)
+    for index in order:
+        if leader_count:
+            similarities = leaders[:leader_count] @ vectors[index]
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                labels[index] = best
+                continue
+        leaders[leader_count] = vectors[index]
+        labels[index] = leader_count
+        leader_count += 1
+
+    streamlined = {}
+    for label in range(leader_count):
+        members: np.ndarray = np.flatnonzero(labels == label)
+        medoid = members[_medoid(vectors[members], weights[members])]
+        for member in members:
+            streamlined[sidebars[member]["id"]] = texts[medoid]
+    return streamlined
@@ -0,0 +1,99 @@
+"""
+Utilities for deduplicating sidebar descriptions before they are streamlined.
+
+Most sites have a few dozen distinct sidebars across thousands of pages. Sidebars are matched
+exactly after collapsing whitespace and ignoring case, so each distinct sidebar only needs to be
+streamlined once and the result can be mapped back onto every row that uses it.
+
+Usage:
+  from ai_crawl_analysis.utilities.sidebars import apply_streamlined_sidebars, unique_sidebars
+  sidebars, sidebar_ids = unique_sidebars(rows)
+  rows = apply_streamlined_sidebars(rows, sidebar_ids, streamlined)
+"""
+
+import re
+from collections import Counter
+from typing import Any
+
+# Sidebar values that mean the page has no sidebar.
+EMPTY_SIDEBAR_VALUES = {"", "false", "none", "null", "n/a"}
+
+
+def normalize_sidebar(sidebar: Any) -> str | None:
+    """
+    Return the key used to match sidebars: the text with whitespace collapsed, in lowercase.
+
+    :param sidebar: The sidebar description from a row.
+    :return: The normalized text, or None if the row has no sidebar.
+    """
+    if not isinstance(sidebar, str):
+        return None
+    normalized = re.sub(r"\s+", " ", sidebar).strip().casefold()
+    if normalized in EMPTY_SIDEBAR_VALUES:
+        return None
+    return normalized
+
+
+def unique_sidebars(rows: list[dict]) -> tuple[list[dict], dict[str, str]]:
+    """
+    Find the distinct sidebars used by the rows.
+
+    :param rows: Rows with "sidebar" and optionally "migration_group" keys.
+    :return: A list of unique sidebars, each with an "id", the first "sidebar" text seen and the
+      "migration_groups" of the rows that use it, and a dictionary mapping each normalized sidebar
+      to its id.
+    """
+    sidebars: list[dict] = []
+    sidebar_ids: dict[str, str] = {}
+    for row in rows:
+        key = normalize_sidebar(row.get("sidebar"))
+        if key is None:
+            continue
+        if key not in sidebar_ids:
+            sidebar_ids[key] = str(len(sidebars) + 1)
+            sidebars.append(
+                {
+                    "id": sidebar_ids[key],
+                    "sidebar": row["sidebar"],
+                    "migration_groups": [],
+                }
+            )
+        groups = sidebars[int(sidebar_ids[key]) - 1]["migration_groups"]
+        group = row.get("migration_group")
+        if group and group not in groups:
+            groups.append(group)
+    return sidebars, sidebar_ids
+
+
+def sidebar_counts(rows: list[dict], sidebar_ids: dict[str, str]) -> dict[str, int]:
+    """
+    Count the rows that use each unique sidebar.
+
+    :param rows: The rows passed to unique_sidebars().
+    :param sidebar_ids: The normalized sidebar to id mapping from unique_sidebars().
+    :return: A dictionary mapping sidebar ids to the number of rows that use them.
+    """
+    keys = (normalize_sidebar(row.get("sidebar")) for row in rows)
+    return dict(Counter(sidebar_ids[key] for key in keys if key in sidebar_ids))
+
+
+def apply_streamlined_sidebars(
+    rows: list[dict], sidebar_ids: dict[str, str], streamlined: dict[str, Any]
+) -> list[dict]:
+    """
+    Add a "streamlined_sidebar" key to every row from the streamlined text of its sidebar.
+
+    :param rows: The rows to update.
+    :param sidebar_ids: The normalized sidebar to id mapping from unique_sidebars().
+    :param streamlined: A dictionary mapping sidebar ids to their streamlined descriptions.
+    :return: New rows with "streamlined_sidebar" set. Rows without a sidebar, or whose sidebar was
+      not streamlined, keep their original sidebar value.
+    """
+    results = []
+    for row in rows:
+        key = normalize_sidebar(row.get("sidebar"))
+        sidebar = row.get("sidebar")
+        if key is not None and key in sidebar_ids:
+            sidebar = streamlined.get(sidebar_ids[key], sidebar)
+        results.append({**row, "streamlined_sidebar": sidebar})
+    return results
@@ -0,0 +1,145 @@
+"""
+Groups URLs by path template so only a few URLs per template need to be sent to the AI model.
+
+Crawls are dominated by URLs that follow the same template, such as /news/2024/05/some-article,
+/grants/123 or /events/spring-gala. Each URL path is split into segments, and segments that look like
+dates, years, numeric or hexadecimal ids, or slugs (below the top level) are replaced with
+placeholders, so these URLs share the templates /news/{year}/{id}/{slug}, /grants/{id} and
+/events/{slug}. The host is kept as part of the template.
+
+Only a few representatives of each template with enough members are classified, and the migration
+group returned most often for them is given to every URL with the same template.
+
+Usage:
+  from ai_crawl_analysis.utilities.url_templates import (
+      assign_url_templates,
+      propagate_template_groups,
+  )
+  templates = assign_url_templates(addresses)
+  representatives = templates.filter(pl.col("representative"))["address"].to_list()
+  groups = propagate_template_groups(templates, representative_groups)
+"""
+
+from typing import Any
+
+import polars as pl
+
+# Minimum number of URLs sharing a template before only representatives are sent.
+DEFAULT_MIN_TEMPLATE_MEMBERS = 5
+# Number of URLs of each template sent to the model.
+DEFAULT_REPRESENTATIVES_PER_TEMPLATE = 3
+
+# Segment patterns and their placeholders, checked in order.
+_SEGMENT_PLACEHOLDERS = [
+    (r"^\d{4}-\d{2}-\d{2}$", "{date}"),
+    (r"^(19|20)\d{2}$", "{year}"),
+    (r"^\d+$", "{id}"),
+    (r"(?i)^[0-9a-f]{8}(-[0-9a-f]{4}){3}-[0-9a-f]{12}$", "{id}"),
+    (r"(?i)^[0-9a-f]{24,}$", "{id}"),
+]
+# Slugs have at least two words joined with hyphens or underscores, and an optional extension.
+_SLUG = r"(?i)^[a-z0-9]+([-_][a-z0-9]+)+(\.[a-z0-9]+)?$"
+_SCHEME_AND_HOST = r"^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)"
+
+
+def url_template_expr(address: pl.Expr) -> pl.Expr:
+    """
+    Build an expression that converts URLs to their path templates.
+
+    :param address: An expression for the URLs, eg. pl.col("address").
+    :return: A string expression with the host and templated path, eg. "www.example.gov/grants/{id}".
+    """
+    segment = pl.element()
+    conditions = [
+        (segment.str.contains(pattern), value)
+        for pattern, value in _SEGMENT_PLACEHOLDERS
+    ]
+    # Top level segments such as /about-us are usually sections rather than slugs.
+    conditions.append(
+        ((pl.int_range(pl.len()) > 0) & segment.str.contains(_SLUG), "{slug}")
+    )
+    (condition, value), *other_conditions = conditions
+    # The chain changes type from Then to ChainedThen as conditions are added.
+    chain: Any = pl.when(condition).then(pl.lit(value))
+    for condition, value in other_conditions:
+        chain = chain.when(condition).then(pl.lit(value))
+    placeholder = chain.otherwise(segment)
+
+    host = address.str.extract(_SCHEME_AND_HOST, 1).str.to_lowercase().fill_null("")
+    path = (
+        address.str.replace(r"[?#].*$", "")
+        .str.replace(_SCHEME_AND_HOST, "")
+        .str.strip_chars("/")
+        .str.split("/")
+        .list.eval(placeholder)
+        .list.join("/")
+    )
+    return pl.concat_str([host, pl.lit("/"), path])
+
+
+def assign_url_templates(
+    addresses: list[str],
+    min_members: int = DEFAULT_MIN_TEMPLATE_MEMBERS,
+    representatives: int = DEFAULT_REPRESENTATIVES_PER_TEMPLATE,
+) -> pl.DataFrame:
+    """
+    Find the path template of each URL and pick the URLs to send to the model.
+
+    :param addresses: The URLs to group.
+    :param min_members: Templates with fewer URLs than this have all their URLs sent.
+    :param representatives: Number of URLs sent for each template with at least min_members URLs.
+    :return: A DataFrame with the "address", its "template", and a "representative" column that is
+      True for the URLs to send to the model.
+    """
+    frame = pl.DataFrame({"address": addresses}, schema={"address": pl.Utf8})
+    return frame.with_columns(
+        template=url_template_expr(pl.col("address"))
+    ).with_columns(
+        representative=(pl.len().over("template") < min_members)
+        | (pl.int_range(pl.len()).over("template") < representatives)
+    )
+
+
+def propagate_template_groups(
+    templates: pl.DataFrame, groups: dict[str, Any]
+) -> dict[str, Any]:
+    """
+    Give every URL the migration group returned most often for the representatives of its template.
+
+    :param templates: The DataFrame from assign_url_templates().
+    :param groups: A dictionary mapping representative URLs to the migration group returned for them.
+    :return: A dictionary mapping every URL to a migration group. Representatives keep their own
+      group, and URLs whose representatives were all left unclassified are not included.
+    """
+    assigned = templates.with_columns(
+        migration_group=pl.col("address").replace_strict(
+            {address: str(group) for address, group in groups.items()},
+            default=None,
+            return_dtype=pl.Utf8,
+        )
+    )
+    majority = (
+        assigned.filter(pl.col("migration_group").is_not_null())
+        .group_by("template", "migration_group")
+        .len()
+        .sort(["template", "len", "migration_group"], descending=[False, True, False])
+        .unique("template", keep="first", maintain_order=True)
+        .select("template", template_group=pl.col("migration_group"))
+    )
+    propagated = (
+        assigned.join(majority, on="template", how="left")
+        .select(
+            "address",
+            pl.coalesce("migration_group", "template_group").alias("migration_group"),
+        )
+        .filter(pl.col("migration_group").is_not_null())
+    )
+    return dict(zip(propagated["address"], propagated["migration_group"]))
+
+
+def compression_ratio(templates: pl.DataFrame) -> float:
+    """
+    Return the number of URLs for each URL sent to the model.
+    """
+    sent = templates["representative"].sum()
+    return templates.height / sent if sent else 1.0
@@ -0,0 +1,142 @@
+"""
+Benchmark the Polars and Python engines of expand_json_csv on large crawl exports.
+
+Builds Screaming Frog style CSV files of the requested sizes, with the AI JSON column in code
+fences and values of every JSON type, expands each one with both engines and checks that they wrote
+the same file. With --invalid, a few rows hold invalid JSON, which makes the Polars engine parse the
+objects in Python. The Polars engine is also run with the typed decoder, which reports invalid JSON
+instead, and with --workers in parallel mode.
+
+Usage:
+  uv run python -m benchmarks.expand_json_csv_engines
+  uv run python -m benchmarks.expand_json_csv_engines --rows 10000 100000 --invalid
+  uv run python -m benchmarks.expand_json_csv_engines --rows 1000000 --workers 32
+"""
+
+import argparse
+import csv
+import json
+import random
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from ai_crawl_analysis.expand_json_csv import ENGINES, JSON_COLUMN, expand_json_csv
+
+
+def build_crawl(path: Path, rows: int, invalid: bool, seed: int = 0):
+    """
+    Write a crawl export with `rows` HTML rows and a few non-HTML rows.
+    """
+    # Seeded so every run builds the same crawl; the values are not used for security.
+    generator = random.Random(seed)  # nosec B311
+    kinds = ["news", "grants", "about", "events", "topics"]
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "Address",
+                "Content Type",
+                "Status Code",
+                "HTTP Version",
+                "Title 1",
+                JSON_COLUMN,
+            ]
+        )
+        for i in range(rows):
+            kind = generator.choice(kinds)
+            data = {
+                "page_description": f'A {kind} page about "topic" {i % 97}, with details.',
+                "page_structure": (
+                    {"title": "text", "body": "text", "tags": ["reference"]}
+                    if kind != "about"
+                    else {"title": "text"}
+                ),
+                "sidebar": generator.choice(
+                    [False, "Links to related programs.", "true", "2024 updates"]
+                ),
+                "sidebar_has_menu": generator.choice([True, False]),
+                "content_tags": [kind, "program"],
+                "has_tabs": generator.random() < 0.1,
+                "css_files": [f"/themes/{kind}.css", "/themes/uswds.min.css"],
+                "js_libraries": ["USWDS 3.8.0", "jQuery 3.7.1"],
+                "manual_review": generator.random() < 0.3,
+                "word_count": generator.choice([120, 480, True]),
+                "reading_level": generator.choice([8.5, 10, None]),
+            }
+            text = json.dumps(
+                data, ensure_ascii=False, indent=generator.choice([None, 2])
+            )
+            if generator.random() < 0.5:
+                text = f"```json\n{text}\n```"
+            if invalid and i % 5_000 == 1:
+                text = text[: len(text) // 2]
+            writer.writerow(
+                [
+                    f"https://www.example.gov/{kind}/{i}",
+                    "text/html; charset=utf-8",
+                    200,
+                    "1.1",
+                    f"Title {i}",
+                    text if i % 50 else "",
+                ]
+            )
+        writer.writerow(
+            ["https://www.example.gov/logo.png", "image/png", 200, "1.1", "", ""]
+        )
+
+
+def time_engine(input_file: Path, output_file: Path, **options) -> float:
+    started = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        expand_json_csv(input_file, output_file, **options)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="Number of crawl rows to benchmark",
+    )
+    parser.add_argument(
+        "--invalid",
+        action="store_true",
+        help="Add rows with invalid JSON",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Also run the Polars engine with this many worker processes",
+    )
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'engine':<10} {'seconds':>8}  output")
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        for rows in args.rows:
+            input_file = directory / f"crawl-{rows}.csv"
+            build_crawl(input_file, rows, args.invalid)
+            runs = [(engine, {"engine": engine}) for engine in ENGINES]
+            runs.append(("typed", {"decoder": "typed"}))
+            if args.workers:
+                runs.append((f"polars x{args.workers}", {"workers": args.workers}))
+            outputs = {}
+            for name, options in runs:
+                output_file = directory / f"crawl-{rows}-{len(outputs)}.csv"
+                seconds = time_engine(input_file, output_file, **options)
+                outputs[name] = output_file.read_bytes()
+                same = outputs[name] == outputs[ENGINES[0]]
+                print(
+                    f"{rows:>8} {name:<10} {seconds:>8.2f}  "
+                    f"{'identical' if same else 'DIFFERENT'}"
+                )
+
+
+if __name__ == "__main__":
+    main()
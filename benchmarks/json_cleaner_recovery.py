@@ -0,0 +1,121 @@
+"""
+Benchmark truncated-JSON recovery in json_cleaner on large LLM-style responses.
+
+Builds JSON arrays of crawl rows of the requested sizes, cuts each one off in the middle of the last
+object, and times clean_json_text on them. The previous line-by-line recovery, which re-parsed the
+whole prefix for every line it walked back, can be included for comparison with --legacy.
+
+Usage:
+  uv run python -m benchmarks.json_cleaner_recovery
+  uv run python -m benchmarks.json_cleaner_recovery --sizes 10 25 50 --legacy
+"""
+
+import argparse
+import json
+import time
+
+from ai_crawl_analysis.utilities.json_cleaner import clean_json_text
+
+
+def build_response(size_mb: int, layout: str) -> str:
+    """
+    Build a JSON array of crawl rows of about size_mb megabytes, cut off inside the last object.
+
+    :param layout: "indented" or "minified" for rows of the same size, or "large-last" for indented
+      rows where the last row has a page structure spanning thousands of lines.
+    """
+    row = {
+        "address": "https://www.example.gov/news/2024/05/some-article-title",
+        "page_description": "A news article about a program update. " * 4,
+        "page_structure": json.dumps(
+            {
+                "title": "text",
+                "body": "text",
+                "image": "image",
+                "related": ["reference"],
+            }
+        ),
+        "sidebar": "A sidebar with links to related programs and contact details.",
+        "sidebar_has_menu": True,
+        "migration_group": "News Article",
+    }
+    indent = None if layout == "minified" else 2
+    row_size = len(json.dumps(row, indent=indent)) + 2
+    count = size_mb * 1024 * 1024 // row_size
+    rows = [row] * count
+    cut = row_size // 2
+    if layout == "large-last":
+        fields = {
+            f"field_{i}": {"type": "text", "label": f"Field {i}"} for i in range(2000)
+        }
+        last_row = {**row, "page_structure": fields}
+        rows.append(last_row)
+        cut = len(json.dumps(last_row, indent=indent)) // 2
+    text = json.dumps(rows, indent=indent)
+    # Cut the response off halfway through the last object.
+    return "```json\n" + text[: len(text) - cut]
+
+
+def legacy_recover(content: str) -> str:
+    """
+    The previous recovery: walk lines backwards and re-parse the prefix until it is valid JSON.
+    """
+    lines = content.strip().split("\n")
+    for i in range(len(lines) - 1, -1, -1):
+        test_content = "\n".join(lines[:i]).strip()
+        if test_content.endswith("}"):
+            test_content += "\n]"
+        elif test_content.endswith(","):
+            test_content = test_content.rstrip(",") + "\n]"
+        else:
+            continue
+        try:
+            test_data = json.loads(test_content)
+            if isinstance(test_data, list) and test_data:
+                return json.dumps(test_data, indent=2, ensure_ascii=False)
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Could not fix malformed JSON")
+
+
+def time_call(func, *args) -> tuple[float, str]:
+    started = time.perf_counter()
+    try:
+        result = func(*args)
+    except ValueError as e:
+        return time.perf_counter() - started, f"failed: {e}"
+    return time.perf_counter() - started, f"{len(json.loads(result))} rows"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 25, 50],
+        help="Response sizes to benchmark, in megabytes",
+    )
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="Also time the previous line-by-line recovery",
+    )
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'format':<10} {'method':<8} {'seconds':>8}  result")
+    for size_mb in args.sizes:
+        for label in ("indented", "minified", "large-last"):
+            response = build_response(size_mb, label)
+            seconds, result = time_call(clean_json_text, response)
+            print(f"{size_mb:>4}MB {label:<10} {'scan':<8} {seconds:>8.2f}  {result}")
+            if args.legacy:
+                content = response.split("\n", 1)[1]
+                seconds, result = time_call(legacy_recover, content)
+                print(
+                    f"{size_mb:>4}MB {label:<10} {'legacy':<8} {seconds:>8.2f}  {result}"
+                )
+
+
+if __name__ == "__main__":
+    main()
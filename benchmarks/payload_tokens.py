@@ -0,0 +1,95 @@
+"""
+Compare the estimated tokens per URL of the JSON and compact payload formats.
+
+Builds a crawl export of the requested size with the expand_json_csv_engines benchmark, expands the
+columns sent to the AI model, and splits the rows into batches in each payload format with the
+default token budgets. Prints the estimated input and output tokens per URL and the number of
+requests needed. Use --structure-chars to pad each page structure to a realistic size, so the
+effect of --max-structure-chars shows.
+
+Usage:
+  uv run python -m benchmarks.payload_tokens
+  uv run python -m benchmarks.payload_tokens --rows 100000 --structure-chars 2000
+"""
+
+import argparse
+import json
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+from ai_crawl_analysis.expand_json_csv import expand_json_frame
+from ai_crawl_analysis.main import COLUMNS_TO_EXTRACT
+from ai_crawl_analysis.utilities.batching import (
+    ROW_OUTPUT_OVERHEAD_TOKENS,
+    batch_rows,
+    estimate_tokens,
+)
+from ai_crawl_analysis.utilities.filter_html_rows import filter_html_frame
+from ai_crawl_analysis.utilities.payload_encoder import (
+    DEFAULT_MAX_STRUCTURE_CHARS,
+    CompactPayload,
+)
+from benchmarks.expand_json_csv_engines import build_crawl
+
+
+def report(name: str, input_tokens: int, output_tokens: int, rows: int, batches: int):
+    print(
+        f"{name:<8} {input_tokens / rows:>9.0f} {output_tokens / rows:>10.0f} {batches:>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="Number of crawl rows")
+    parser.add_argument(
+        "--structure-chars",
+        type=int,
+        default=0,
+        help="Pad each page structure to at least this many characters",
+    )
+    parser.add_argument(
+        "--max-structure-chars",
+        type=int,
+        default=DEFAULT_MAX_STRUCTURE_CHARS,
+        help="Character budget of each page structure in compact payloads",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, redirect_stdout(StringIO()):
+        input_file = Path(directory) / "crawl.csv"
+        build_crawl(input_file, args.rows, False)
+        rows = expand_json_frame(filter_html_frame(input_file)).select(
+            COLUMNS_TO_EXTRACT
+        )
+    rows = rows.to_dicts()
+    for row in rows:
+        structure = row["page_structure"] or ""
+        if len(structure) < args.structure_chars:
+            padding = {"sections": ["text"] * (args.structure_chars // 9)}
+            structure = json.loads(structure) if structure else {}
+            row["page_structure"] = json.dumps({**structure, **padding})
+
+    print(f"{'format':<8} {'input/URL':>9} {'output/URL':>10} {'requests':>8}")
+    # The model echoes each row of a JSON payload back with its migration group.
+    batches = batch_rows(rows)
+    input_tokens = sum(
+        estimate_tokens(json.dumps(b, ensure_ascii=False)) for b in batches
+    )
+    output_tokens = input_tokens + ROW_OUTPUT_OVERHEAD_TOKENS * len(rows)
+    report("json", input_tokens, output_tokens, len(rows), len(batches))
+
+    payload = CompactPayload(max_structure_chars=args.max_structure_chars)
+    batches = batch_rows(
+        rows,
+        output_tokens_per_row=payload.output_tokens_per_row,
+        row_text=payload.row_text,
+    )
+    input_tokens = sum(estimate_tokens(payload.encode(b)[0]) for b in batches)
+    output_tokens = payload.output_tokens_per_row * len(rows)
+    report("compact", input_tokens, output_tokens, len(rows), len(batches))
+
+
+if __name__ == "__main__":
+    main()
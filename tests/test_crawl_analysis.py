@@ -0,0 +1,99 @@
+"""
+Checks how the AI batches of crawl_analysis behave when the model fails.
+
+Usage:
+  uv run --with pytest pytest tests/test_crawl_analysis.py
+"""
+
+import asyncio
+import json
+import threading
+
+import polars as pl
+
+from ai_crawl_analysis import crawl_analysis
+
+COLUMNS = ["address", "page_description"]
+
+
+def chunks(count: int, rows: int):
+    for chunk in range(count):
+        yield pl.DataFrame(
+            {
+                "address": [f"https://example.gov/{chunk}/{i}" for i in range(rows)],
+                "page_description": ["A page about grants."] * rows,
+            }
+        )
+
+
+def test_overlap_raises_when_a_batch_fails(monkeypatch, tmp_path):
+    async def call_ai_async(**request):
+        # The crawl keeps being read while the request waits, until the queue of chunks is full.
+        await asyncio.sleep(0.2)
+        raise RuntimeError("No retries left")
+
+    monkeypatch.setattr(crawl_analysis, "call_ai_async", call_ai_async)
+    errors = []
+
+    def run():
+        try:
+            crawl_analysis.classify_expanding_crawl(
+                chunks(20, 50), COLUMNS, max_input_tokens=500, output_dir=tmp_path
+            )
+        except Exception as e:
+            errors.append(e)
+
+    # The run used to hang on the full queue of chunks, so it is run in a thread with a timeout.
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert [str(e) for e in errors] == ["No retries left"]
+
+
+def test_overlap_classifies_every_row(monkeypatch, tmp_path):
+    async def call_ai_async(content: str, **request):
+        rows = json.loads(content)
+        return json.dumps(
+            [{"address": row["address"], "migration_group": "Grants"} for row in rows]
+        )
+
+    monkeypatch.setattr(crawl_analysis, "call_ai_async", call_ai_async)
+    expanded, groups = crawl_analysis.classify_expanding_crawl(
+        chunks(20, 50), COLUMNS, max_input_tokens=500, output_dir=tmp_path
+    )
+    assert expanded.height == 1000
+    assert set(groups.values()) == {"Grants"}
+    assert len(groups) == 1000
+
+
+def test_cut_off_stream_keeps_complete_rows(monkeypatch):
+    calls = []
+
+    async def call_ai_stream_async(content: str, **request):
+        rows = json.loads(content)
+        response = json.dumps(
+            [{"address": row["address"], "migration_group": "Grants"} for row in rows]
+        )
+        calls.append(len(rows))
+        if len(calls) == 1:
+            # The first response is cut off half way by a network error.
+            yield response[: len(response) // 2]
+            raise ConnectionError("Connection reset")
+        yield response
+
+    monkeypatch.setattr(crawl_analysis, "call_ai_stream_async", call_ai_stream_async)
+    rows = next(chunks(1, 20)).to_dicts()
+    streamed = []
+    groups = crawl_analysis.classify_in_batches(
+        rows,
+        prompt="Group the pages.",
+        system_instructions="",
+        response_schema={},
+        result_key="migration_group",
+        on_row=streamed.append,
+    )
+    assert groups == {row["address"]: "Grants" for row in rows}
+    # The rows completed before the cut are kept, and only the others are sent again.
+    assert calls[0] == 20 and sum(calls[1:]) < 20
+    assert len(streamed) == 20
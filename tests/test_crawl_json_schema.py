@@ -0,0 +1,19 @@
+"""
+Checks that the declared schema of the crawl's JSON column matches the Screaming Frog prompt.
+
+Usage:
+  uv run --with pytest pytest tests/test_crawl_json_schema.py
+"""
+
+from ai_crawl_analysis.utilities.crawl_json_schema import (
+    CRAWL_SCHEMA,
+    SCREAMING_FROG_PROMPT_FILE,
+    prompt_fields,
+)
+from ai_crawl_analysis.utilities.file_loaders import load_prompt
+
+
+def test_schema_matches_prompt():
+    fields = prompt_fields(load_prompt(SCREAMING_FROG_PROMPT_FILE))
+    assert fields == {name: spec["required"] for name, spec in CRAWL_SCHEMA.items()}
+    assert list(fields) == list(CRAWL_SCHEMA)
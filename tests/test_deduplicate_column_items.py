@@ -0,0 +1,31 @@
+"""
+Checks that deduplicate_column_items reads the values of CSV columns as the strings in the file.
+
+Usage:
+  uv run --with pytest pytest tests/test_deduplicate_column_items.py
+"""
+
+import csv
+
+from ai_crawl_analysis.deduplicate_column_items import (
+    get_deduplicated_items_from_column,
+)
+
+
+def test_csv_values_are_strings(tmp_path):
+    path = tmp_path / "expanded.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["js_libraries", "content_tags"])
+        # A column that only holds numbers in its first rows is not read as numbers.
+        for i in range(120):
+            writer.writerow([i, ""])
+        writer.writerow(["['jQuery', 'USWDS']", "None"])
+        writer.writerow(["", "NA"])
+    libraries = get_deduplicated_items_from_column(str(path), "js_libraries")
+    assert libraries == sorted([str(i) for i in range(120)] + ["USWDS", "jQuery"])
+    assert get_deduplicated_items_from_column(str(path), "content_tags") == [
+        "NA",
+        "None",
+    ]
+    assert get_deduplicated_items_from_column(str(path), "missing") == []
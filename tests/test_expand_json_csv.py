@@ -0,0 +1,93 @@
+"""
+Checks that the polars engine of expand_json_csv writes the same expanded file as the python
+engine, which decodes each cell with json.loads, and that Parquet files keep the values of
+integers too large for Int64.
+
+Usage:
+  uv run --with pytest pytest tests/test_expand_json_csv.py
+"""
+
+import csv
+
+import polars as pl
+import pytest
+
+from ai_crawl_analysis.expand_json_csv import JSON_COLUMN, expand_json_csv
+
+
+def expand(tmp_path, cells: list[str], engine: str) -> list[dict]:
+    input_file = tmp_path / engine / "crawl.csv"
+    input_file.parent.mkdir()
+    with open(input_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Address", "Content Type", JSON_COLUMN])
+        for i, cell in enumerate(cells):
+            writer.writerow([f"https://example.gov/{i}", "text/html", cell])
+    output_file = expand_json_csv(
+        input_file, input_file.with_name("expanded.csv"), engine=engine
+    )
+    with open(output_file, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def check_engines(tmp_path, cells: list[str], expected: list[str]):
+    rows = expand(tmp_path, cells, "polars")
+    assert rows == expand(tmp_path, cells, "python")
+    assert [row["a"] for row in rows] == expected
+
+
+@pytest.mark.parametrize(
+    "cells, expected",
+    [
+        (
+            ['{"a": 18446744073709551615, "b": "x"}', '{"a": 1, "b": "y"}'],
+            ["18446744073709551615", "1"],
+        ),
+        (
+            ['{"a": 9223372036854775807}', '{"a": 9223372036854775808}'],
+            ["9223372036854775807", "9223372036854775808"],
+        ),
+        (
+            ['{"a": -9223372036854775809}', '{"a": "text"}'],
+            ["-9223372036854775809", "text"],
+        ),
+    ],
+)
+def test_integers_beyond_int64(tmp_path, cells, expected):
+    check_engines(tmp_path, cells, expected)
+
+
+@pytest.mark.parametrize(
+    "cells, expected",
+    [
+        (['{"a": 1, "b": "s", "a": 2}', '{"a": 3, "b": "t"}'], ["2", "3"]),
+        (['{"a": "x", "a": "y"}', '{"a": "z"}'], ["y", "z"]),
+        (['{"a": "x", "a": [1, 2]}', '{"a": "z"}'], ["[1, 2]", "z"]),
+    ],
+)
+def test_duplicate_keys(tmp_path, cells, expected):
+    # json.loads keeps the last value of a duplicate key.
+    check_engines(tmp_path, cells, expected)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_integers_beyond_int64_in_parquet(tmp_path, streaming):
+    input_file = tmp_path / "crawl.csv"
+    with open(input_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Address", "Content Type", JSON_COLUMN])
+        writer.writerow(
+            [
+                "https://example.gov/1",
+                "text/html",
+                '{"a": 18446744073709551615, "n": 1}',
+            ]
+        )
+        writer.writerow(["https://example.gov/2", "text/html", '{"a": 2, "n": 2}'])
+    output_file = expand_json_csv(
+        input_file, tmp_path / "expanded.parquet", streaming=streaming
+    )
+    df = pl.read_parquet(output_file)
+    # A column with an integer too large for Int64 is kept as strings rather than read as nulls.
+    assert df.schema["a"] == pl.Utf8 and df.schema["n"] == pl.Int64
+    assert df["a"].to_list() == ["18446744073709551615", "2"]